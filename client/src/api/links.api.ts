@@ -1,5 +1,5 @@
 import api from './axios'
-import type { Link, LinkCreate, LinkUpdate, LinkReorder } from '@/shared/types'
+import type { Link, LinkCreate, LinkUpdate, LinkReorder, LinkMove } from '@/shared/types'
 
 export const linksApi = {
   // Get my links (authenticated)
@@ -37,6 +37,15 @@ export const linksApi = {
     return response.data
   },
 
+  // Move one link between new neighbours (authenticated)
+  move: async (linkId: number, data: LinkMove): Promise<Link> => {
+    const response = await api.post<Link>(`/links/${linkId}/move`, data)
+    return response.data
+  },
+
+  // Public redirect URL: counts the click and forwards to the link's URL
+  redirectUrl: (linkId: number): string => `${api.defaults.baseURL}/r/${linkId}`,
+
   // Increment click count - PUBLIC (no auth required)
   incrementClick: async (linkId: number): Promise<Link> => {
     const response = await api.post<Link>(`/links/${linkId}/click`)
@@ -23,6 +23,11 @@ export const usersApi = {
     return response.data
   },
 
+  // Count a visit to a public profile page - PUBLIC (no auth required)
+  recordView: async (username: string): Promise<void> => {
+    await api.post(`/users/username/${username}/view`)
+  },
+
   // Get current user's profile (authenticated)
   getCurrentUser: async (): Promise<User> => {
     const response = await api.get<User>('/auth/me')
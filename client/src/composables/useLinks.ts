@@ -5,11 +5,12 @@ import {
   type LinkCreate,
   type LinkUpdate,
   type LinkReorder,
+  type LinkMove,
   LinkType,
   type Link,
 } from '@/shared/types'
 import { useAuthStore } from '@/stores/auth'
-import { showToast } from '@/shared/utils'
+import { showToast, compareLinks } from '@/shared/utils'
 
 /**
  * Composable for managing authenticated user's links
@@ -30,10 +31,10 @@ export function useLinks() {
     staleTime: 2 * 60 * 1000, // 2 minutes
   })
 
-  // Computed: Sorted links by position
+  // Computed: Sorted links in display order
   const sortedLinks = computed(() => {
     if (!links.value) return []
-    return [...links.value].sort((a, b) => a.position - b.position)
+    return [...links.value].sort(compareLinks)
   })
 
   // Computed: Active links only
@@ -106,6 +107,22 @@ export function useLinks() {
     },
   })
 
+  // Move a single link mutation (only that link is rewritten on the server)
+  const moveMutation = useMutation({
+    mutationFn: ({ id, data }: { id: number; data: LinkMove }) => linksApi.move(id, data),
+    onSuccess: (movedLink) => {
+      queryClient.setQueryData<Link[]>(['myLinks'], (oldLinks) => {
+        if (!oldLinks) return [movedLink]
+        return oldLinks.map((link) => (link.id === movedLink.id ? movedLink : link))
+      })
+      queryClient.invalidateQueries({ queryKey: ['publicProfile', user?.username] })
+      showToast('Links Reordered!', 'success')
+    },
+    onError: () => {
+      showToast('Reorder failed!', 'error')
+    },
+  })
+
   // Helper: Toggle link active status
   const toggleActive = (linkId: number) => {
     const link = links.value?.find((l) => l.id === linkId)
@@ -128,13 +145,17 @@ export function useLinks() {
     if (newIndex < 0 || newIndex >= sortedLinks.value.length) return
 
     if (sortedLinks.value[currentIndex] && sortedLinks.value[newIndex]) {
-      // Create reorder data for affected links
-      const reorderData: LinkReorder[] = [
-        { link_id: sortedLinks.value[currentIndex].id, new_position: newIndex },
-        { link_id: sortedLinks.value[newIndex].id, new_position: currentIndex },
-      ]
+      // New neighbours once the link has swapped places with the one at newIndex
+      const [afterIndex, beforeIndex] =
+        direction === 'up' ? [newIndex - 1, newIndex] : [newIndex, newIndex + 1]
 
-      reorderMutation.mutate(reorderData)
+      moveMutation.mutate({
+        id: linkId,
+        data: {
+          after_id: sortedLinks.value[afterIndex]?.id ?? null,
+          before_id: sortedLinks.value[beforeIndex]?.id ?? null,
+        },
+      })
     }
   }
 
@@ -157,6 +178,7 @@ export function useLinks() {
     updateLink: (id: number, data: LinkUpdate) => updateMutation.mutateAsync({ id, data }),
     deleteLink: deleteMutation.mutateAsync,
     reorderLinks: reorderMutation.mutateAsync,
+    moveLinkTo: (id: number, data: LinkMove) => moveMutation.mutateAsync({ id, data }),
     toggleActive,
     moveLink,
     refetch,
@@ -165,7 +187,7 @@ export function useLinks() {
     isCreating: createMutation.isPending,
     isUpdating: updateMutation.isPending,
     isDeleting: deleteMutation.isPending,
-    isReordering: reorderMutation.isPending,
+    isReordering: computed(() => reorderMutation.isPending.value || moveMutation.isPending.value),
 
     // Errors
     createError: createMutation.error,
@@ -189,12 +211,10 @@ export function usePublicLinks(username: string) {
     enabled: !!username,
     staleTime: 5 * 60 * 1000, // 5 minutes
   })
-  const queryClient = useQueryClient()
-
   // Sorted links
   const sortedLinks = computed(() => {
     if (!linksData.value) return []
-    return [...linksData.value].sort((a, b) => a.position - b.position)
+    return [...linksData.value].sort(compareLinks)
   })
 
   // Computed: Active links only
@@ -202,23 +222,9 @@ export function usePublicLinks(username: string) {
     return sortedLinks.value.filter((link) => link.is_active)
   })
 
-  // Track click mutation (no auth required)
-  const clickMutation = useMutation({
-    mutationFn: (linkId: number) => linksApi.incrementClick(linkId),
-    onSuccess: (updatedLink) => {
-      // Optimistically update the cache
-      queryClient.setQueryData(['publicLinks', username], (oldData: any) => {
-        if (!oldData) return oldData
-        return oldData.map((link: any) => (link.id === updatedLink.id ? updatedLink : link))
-      })
-    },
-  })
-
-  const handleLinkClick = (linkId: number, url: string) => {
-    // Track the click
-    clickMutation.mutate(linkId)
-    // Open link in new tab
-    window.open(url, '_blank')
+  const handleLinkClick = (linkId: number) => {
+    // One request: the redirect endpoint counts the click and forwards to the URL
+    window.open(linksApi.redirectUrl(linkId), '_blank')
   }
 
   const buttons = computed(() =>
@@ -236,7 +242,6 @@ export function usePublicLinks(username: string) {
     error,
     refetch,
     handleLinkClick,
-    isTrackingClick: clickMutation.isPending,
   }
 }
 
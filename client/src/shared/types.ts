@@ -140,6 +140,7 @@ export interface Link {
   description: string | null
   thumbnail_url: string | null
   position: number
+  sort_key: string
   is_active: boolean
   created_at: string
   updated_at: string | null
@@ -172,6 +173,12 @@ export interface LinkReorder {
   new_position: number
 }
 
+// New neighbours of a moved link
+export interface LinkMove {
+  after_id?: number | null
+  before_id?: number | null
+}
+
 // ============ PUBLIC PROFILE TYPES ============
 export interface PublicUserProfile {
   username: string
@@ -1,6 +1,7 @@
 import 'vue-sonner/style.css'
 import { toast } from 'vue-sonner'
 import type { RegleRuleDefinition } from '@regle/core'
+import type { Link, LinkMove } from '@/shared/types'
 import { isFilled } from '@regle/rules'
 // import { isFilled, type RegleRuleDefinition } from '@regle/core'
 
@@ -18,6 +19,36 @@ export const showToast = (text: string, type?: 'success' | 'error' | 'info' | 'w
   }
 }
 
+// Display order of links: by sort_key (compared bytewise, like the server), then id
+export const compareLinks = (a: Link, b: Link) => {
+  if (a.sort_key !== b.sort_key) return a.sort_key < b.sort_key ? -1 : 1
+  return a.id - b.id
+}
+
+/**
+ * If `current` is `original` with exactly one id moved, return that id and its new neighbours
+ */
+export const findSingleMove = (
+  original: number[],
+  current: number[],
+): ({ id: number } & LinkMove) | null => {
+  if (original.length !== current.length) return null
+
+  for (const id of current) {
+    const rest = (ids: number[]) => ids.filter((other) => other !== id)
+    if (JSON.stringify(rest(original)) !== JSON.stringify(rest(current))) continue
+
+    const index = current.indexOf(id)
+    if (original.indexOf(id) === index) continue
+    return {
+      id,
+      after_id: index > 0 ? current[index - 1] : null,
+      before_id: index < current.length - 1 ? current[index + 1] : null,
+    }
+  }
+  return null
+}
+
 // /**
 //  * Custom URL validator for Regle
 //  * Validates that a string is a properly formatted URL
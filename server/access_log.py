@@ -0,0 +1,185 @@
+"""
+Structured access log.
+
+AccessLogMiddleware writes one JSON line per request to the "access"
+logger: method, route template, status, latency, database time and
+statement count, user id and cache results. Code handling the request adds
+to the current `RequestLog` through `note_user`, `note_cache` and
+`note_query`. Latency and database figures stop when the last body chunk is
+sent, so background tasks run after the response don't count.
+
+Log records go through a bounded in-memory queue to a listener thread that
+formats and writes them, so a request never waits on stdout or JSON
+encoding. When the queue is full, records are dropped and counted rather
+than blocking.
+
+Public reads and clicks are sampled at ACCESS_LOG_PUBLIC_SAMPLE_RATE (each
+line carries its `sample_rate`); errors and requests slower than
+ACCESS_LOG_SLOW_MS are always logged.
+"""
+import json
+import logging
+import queue
+import random
+import sys
+import time
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener
+from typing import Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import get_settings
+from load_shedding import classify
+
+settings = get_settings()
+
+QUEUE_SIZE = 10_000
+SAMPLED_CLASSES = {"public", "clicks"}
+
+access_logger = logging.getLogger("access")
+access_logger.setLevel(logging.INFO)
+access_logger.propagate = False
+
+
+class RequestLog:
+    __slots__ = ("user_id", "db_ms", "db_queries", "cache")
+
+    def __init__(self):
+        self.user_id: Optional[int] = None
+        self.db_ms = 0.0
+        self.db_queries = 0
+        self.cache: Optional[dict[str, str]] = None
+
+
+current_request: ContextVar[Optional[RequestLog]] = ContextVar("current_request", default=None)
+
+
+def note_user(user_id: int):
+    entry = current_request.get()
+    if entry is not None:
+        entry.user_id = user_id
+
+
+def note_cache(name: str, hit: bool):
+    entry = current_request.get()
+    if entry is not None:
+        if entry.cache is None:
+            entry.cache = {}
+        entry.cache[name] = "hit" if hit else "miss"
+
+
+def note_query(ms: float):
+    # Sync routes run in threads with a copy of the context; the RequestLog itself is shared
+    entry = current_request.get()
+    if entry is not None:
+        entry.db_ms += ms
+        entry.db_queries += 1
+
+
+class JsonFormatter(logging.Formatter):
+    def format(self, record: logging.LogRecord) -> str:
+        if isinstance(record.msg, dict):
+            return json.dumps(record.msg, separators=(",", ":"), default=str)
+        return json.dumps({
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+            **({"exc": self.formatException(record.exc_info)} if record.exc_info else {}),
+        })
+
+
+class DroppingQueueHandler(QueueHandler):
+    """Never blocks: a full queue drops the record"""
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # Formatting is left to the listener thread
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+_queue: queue.Queue = queue.Queue(QUEUE_SIZE)
+queue_handler = DroppingQueueHandler(_queue)
+_output = logging.StreamHandler(sys.stdout)
+_output.setFormatter(JsonFormatter())
+_listener = QueueListener(_queue, _output, respect_handler_level=False)
+access_logger.addHandler(queue_handler)
+
+
+def start_access_log():
+    _listener.start()
+
+
+def stop_access_log():
+    """Write out what is queued and stop the listener thread"""
+    _listener.stop()
+
+
+def _sampled_out(method: str, path: str) -> tuple[bool, float]:
+    route_class = classify(method, path)
+    if route_class is None or route_class.name not in SAMPLED_CLASSES:
+        return False, 1.0
+    rate = settings.ACCESS_LOG_PUBLIC_SAMPLE_RATE
+    return random.random() >= rate, rate
+
+
+class AccessLogMiddleware:
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+
+        entry = RequestLog()
+        token = current_request.set(entry)
+        started = time.perf_counter()
+        status_code = 500
+        # (ms, db_ms, db_queries) when the last body chunk went out; background
+        # tasks run after that, before the app returns, and aren't counted
+        sent = None
+
+        async def send_wrapper(message: Message):
+            nonlocal status_code, sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await send(message)
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                sent = ((time.perf_counter() - started) * 1000, entry.db_ms, entry.db_queries)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            current_request.reset(token)
+            if sent is None:
+                sent = ((time.perf_counter() - started) * 1000, entry.db_ms, entry.db_queries)
+            self._log(scope, entry, status_code, *sent)
+
+    @staticmethod
+    def _log(scope: Scope, entry: RequestLog, status_code: int, ms: float, db_ms: float, db_queries: int):
+        sampled_out, rate = _sampled_out(scope["method"], scope["path"])
+        if sampled_out and status_code < 500 and ms < settings.ACCESS_LOG_SLOW_MS:
+            return
+        route = scope.get("route")
+        access_logger.info({
+            "ts": datetime.now(timezone.utc).isoformat(),
+            "method": scope["method"],
+            "route": getattr(route, "path", None),
+            "path": scope["path"],
+            "status": status_code,
+            "ms": round(ms, 2),
+            "db_ms": round(db_ms, 2),
+            "db_queries": db_queries,
+            "user_id": entry.user_id,
+            "cache": entry.cache,
+            "sample_rate": rate,
+        })
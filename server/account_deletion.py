@@ -0,0 +1,106 @@
+"""
+Account deletion.
+
+DELETE /users/me only marks the account deleted (`deleted_at`, is_active off)
+and hides it everywhere; `purge_user` then runs as a background task. It
+removes the user's links in batches of DELETE_BATCH_SIZE with set-based
+DELETEs, each in its own short transaction, and the files the user uploaded
+to storage. Then it deletes the user row and lets the ON DELETE CASCADE
+foreign keys take the remaining small tables (profile, tokens, sessions,
+view sketches, link stats).
+
+If the process stops halfway, `resume_pending_deletions` picks the account
+up again at the next startup; every step can safely run twice.
+"""
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import delete, select
+from sqlalchemy.orm import Session
+from clients import get_supabase
+from database import SessionLocal
+from invalidation import publish
+from refresh_sessions import revoke_user_sessions
+import models
+import search
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 1000
+STORAGE_BUCKET = "linktree-files"
+STORAGE_PAGE_SIZE = 100
+
+
+def mark_deleted(db: Session, user: models.User):
+    """Deactivate the account right away; the data goes in `purge_user` (commits)"""
+    user.is_active = False
+    user.deleted_at = datetime.now(timezone.utc)
+    search.remove_user(db, user.id)
+    db.commit()
+    publish("user", user.id)
+    revoke_user_sessions(db, user.id, reason="deleted")
+
+
+def _delete_links(db: Session, user_id: int) -> int:
+    total = 0
+    while True:
+        batch = select(models.Link.id).where(models.Link.user_id == user_id).limit(DELETE_BATCH_SIZE)
+        deleted = db.execute(delete(models.Link).where(models.Link.id.in_(batch))).rowcount
+        db.commit()
+        total += deleted
+        if deleted < DELETE_BATCH_SIZE:
+            return total
+
+
+def _purge_storage(user_id: int):
+    # Uploads are stored under "<user id>/" (see upload_avatar)
+    bucket = get_supabase().storage.from_(STORAGE_BUCKET)
+    # A listing returns one page; collect them all before removing, so removals don't shift the offsets
+    paths = []
+    while True:
+        files = bucket.list(str(user_id), {
+            "limit": STORAGE_PAGE_SIZE,
+            "offset": len(paths),
+            "sortBy": {"column": "name", "order": "asc"},
+        })
+        paths += [f"{user_id}/{file['name']}" for file in files]
+        if len(files) < STORAGE_PAGE_SIZE:
+            break
+    for start in range(0, len(paths), STORAGE_PAGE_SIZE):
+        bucket.remove(paths[start:start + STORAGE_PAGE_SIZE])
+
+
+def purge_user(user_id: int):
+    """Delete a user marked by `mark_deleted` and everything they own (background task)"""
+    db = SessionLocal()
+    try:
+        pending = db.query(models.User.id).filter(
+            models.User.id == user_id,
+            models.User.deleted_at.isnot(None)
+        ).scalar()
+        if pending is None:
+            return
+
+        links = _delete_links(db, user_id)
+
+        try:
+            _purge_storage(user_id)
+        except Exception:
+            logger.exception("Removing stored files of deleted user %s failed", user_id)
+
+        db.execute(delete(models.User).where(models.User.id == user_id))
+        db.commit()
+        logger.info("Purged user %s (%s links)", user_id, links)
+    finally:
+        db.close()
+
+
+def resume_pending_deletions():
+    """Finish purges interrupted by a restart"""
+    db = SessionLocal()
+    try:
+        user_ids = [user_id for (user_id,) in db.query(models.User.id).filter(models.User.deleted_at.isnot(None)).all()]
+    finally:
+        db.close()
+
+    for user_id in user_ids:
+        purge_user(user_id)
@@ -57,6 +57,7 @@ def run_migrations_offline() -> None:
         target_metadata=target_metadata,
         literal_binds=True,
         dialect_opts={"paramstyle": "named"},
+        render_as_batch=url.startswith("sqlite"),
     )
 
     with context.begin_transaction():
@@ -78,7 +79,13 @@ def run_migrations_online() -> None:
 
     with connectable.connect() as connection:
         context.configure(
-            connection=connection, target_metadata=target_metadata
+            connection=connection,
+            target_metadata=target_metadata,
+            # SQLite can't ALTER most of a table; autogenerate batch operations,
+            # which copy the table there and are plain ALTERs on Postgres.
+            # This engine leaves SQLite foreign keys off (unlike database.py),
+            # so dropping the old copy doesn't cascade to other tables.
+            render_as_batch=connection.dialect.name == "sqlite",
         )
 
         with context.begin_transaction():
@@ -0,0 +1,48 @@
+"""case-insensitive usernames
+
+Revision ID: 3b9e2d7a41c6
+Revises: f408b90404eb
+Create Date: 2026-10-19 09:12:40.118274
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = '3b9e2d7a41c6'
+down_revision: Union[str, Sequence[str], None] = 'f408b90404eb'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    conn = op.get_bind()
+
+    # Usernames that only differ by case can't share the unique index below.
+    # Report them and stop so they can be renamed by hand.
+    conflicts = conn.execute(sa.text(
+        "SELECT id, username FROM users WHERE lower(username) IN ("
+        "  SELECT lower(username) FROM users GROUP BY lower(username) HAVING count(*) > 1"
+        ") ORDER BY lower(username), id"
+    )).fetchall()
+    if conflicts:
+        report = "\n".join(f"  id={row.id} username={row.username!r}" for row in conflicts)
+        raise RuntimeError(
+            f"{len(conflicts)} users have usernames that differ only by case; "
+            f"rename them and re-run the migration:\n{report}"
+        )
+
+    # Backfill canonical lowercase usernames
+    op.execute("UPDATE users SET username = lower(username) WHERE username <> lower(username)")
+
+    op.create_index('ix_users_username_lower', 'users', [sa.text('lower(username)')], unique=True)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    # Usernames stay lowercase; the original casing is not recoverable
+    op.drop_index('ix_users_username_lower', table_name='users')
@@ -0,0 +1,55 @@
+"""add profile search index
+
+Revision ID: a61f0c93d25e
+Revises: 3b9e2d7a41c6
+Create Date: 2026-10-19 11:03:27.540912
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'a61f0c93d25e'
+down_revision: Union[str, Sequence[str], None] = '3b9e2d7a41c6'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("ALTER TABLE users ADD COLUMN search_vector tsvector")
+        # Backfill every user's document (same expression as search.index_user)
+        op.execute("""
+            UPDATE users SET search_vector =
+                setweight(to_tsvector('simple', coalesce(username, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(full_name, '')), 'A') ||
+                setweight(to_tsvector('simple', coalesce(bio, '')), 'B') ||
+                setweight(to_tsvector('simple', coalesce((
+                    SELECT string_agg(links.title || ' ' || coalesce(links.description, ''), ' ')
+                    FROM links WHERE links.user_id = users.id AND links.is_active
+                ), '')), 'C')
+        """)
+        op.execute("CREATE INDEX ix_users_search_vector ON users USING gin (search_vector)")
+    else:
+        op.execute("CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(username, full_name, bio, links)")
+        op.execute("""
+            INSERT INTO user_search (rowid, username, full_name, bio, links)
+            SELECT id, username, coalesce(full_name, ''), coalesce(bio, ''), coalesce((
+                SELECT group_concat(links.title || ' ' || coalesce(links.description, ''), ' ')
+                FROM links WHERE links.user_id = users.id AND links.is_active
+            ), '')
+            FROM users
+        """)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    if op.get_bind().dialect.name == 'postgresql':
+        op.execute("DROP INDEX ix_users_search_vector")
+        op.execute("ALTER TABLE users DROP COLUMN search_vector")
+    else:
+        op.execute("DROP TABLE user_search")
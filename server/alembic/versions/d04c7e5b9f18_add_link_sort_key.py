@@ -0,0 +1,65 @@
+"""add link sort_key
+
+Revision ID: d04c7e5b9f18
+Revises: a61f0c93d25e
+Create Date: 2026-10-19 13:41:08.262519
+
+"""
+from itertools import groupby
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision: str = 'd04c7e5b9f18'
+down_revision: Union[str, Sequence[str], None] = 'a61f0c93d25e'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+
+
+def _spread_keys(count: int) -> list[str]:
+    # Frozen copy of ordering.spread_keys
+    base = len(DIGITS)
+    width = 1
+    while base ** width < (count + 1) * base:
+        width += 1
+    keys = []
+    for i in range(1, count + 1):
+        value = i * base ** width // (count + 1)
+        digits = []
+        for _ in range(width):
+            value, digit = divmod(value, base)
+            digits.append(DIGITS[digit])
+        keys.append("".join(reversed(digits)).rstrip(DIGITS[0]))
+    return keys
+
+
+def upgrade() -> None:
+    """Upgrade schema."""
+    sort_key_type = sa.String(length=64).with_variant(sa.String(length=64, collation='C'), 'postgresql')
+    op.add_column('links', sa.Column('sort_key', sort_key_type, nullable=True))
+
+    # Backfill keys from the current position order of each user's links
+    conn = op.get_bind()
+    rows = conn.execute(sa.text("SELECT id, user_id FROM links ORDER BY user_id, position, id")).fetchall()
+    updates = []
+    for _, user_rows in groupby(rows, key=lambda row: row.user_id):
+        user_rows = list(user_rows)
+        for row, key in zip(user_rows, _spread_keys(len(user_rows))):
+            updates.append({"id": row.id, "sort_key": key})
+    if updates:
+        conn.execute(sa.text("UPDATE links SET sort_key = :sort_key WHERE id = :id"), updates)
+
+    with op.batch_alter_table('links') as batch_op:
+        batch_op.alter_column('sort_key', existing_type=sort_key_type, nullable=False)
+    op.create_index('ix_links_user_id_sort_key', 'links', ['user_id', 'sort_key'], unique=False)
+
+
+def downgrade() -> None:
+    """Downgrade schema."""
+    op.drop_index('ix_links_user_id_sort_key', table_name='links')
+    op.drop_column('links', 'sort_key')
@@ -1,6 +1,5 @@
 from datetime import datetime, timedelta
 from typing import Optional, Dict, Any
-from jose import JWTError, jwt
 from passlib.context import CryptContext
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
@@ -9,11 +8,16 @@ from database import get_db
 from config import get_settings
 import models
 import schemas
+from refresh_sessions import revocation_cache
+from jwt_codecs import InvalidToken, VerifiedTokenCache, get_codec
+from access_log import note_user
 
 settings = get_settings()
 
 pwd_context = CryptContext(schemes=["pbkdf2_sha256"], deprecated="auto")
 oauth2_scheme = OAuth2PasswordBearer(tokenUrl="auth/login")
+codec = get_codec(settings.JWT_BACKEND)
+access_token_cache = VerifiedTokenCache(settings.ACCESS_TOKEN_CACHE_SIZE)
 
 def verify_password(plain_password: str, hashed_password: str) -> bool:
     return pwd_context.verify(plain_password, hashed_password)
@@ -37,7 +41,7 @@ def create_access_token(data: Dict[str, Any], expires_delta: Optional[timedelta]
         "type": "access"
     })
     
-    encoded_jwt = jwt.encode(to_encode, settings.SECRET_KEY, algorithm=settings.ALGORITHM)
+    encoded_jwt = codec.encode(to_encode, settings.SECRET_KEY, settings.ALGORITHM)
     return encoded_jwt
 
 def create_refresh_token(data: Dict[str, Any]) -> str:
@@ -55,22 +59,27 @@ def create_refresh_token(data: Dict[str, Any]) -> str:
     
     # Use separate secret for refresh tokens (add this to config)
     refresh_secret = getattr(settings, 'REFRESH_SECRET_KEY', settings.SECRET_KEY)
-    encoded_jwt = jwt.encode(to_encode, refresh_secret, algorithm=settings.ALGORITHM)
+    encoded_jwt = codec.encode(to_encode, refresh_secret, settings.ALGORITHM)
     return encoded_jwt
 
 def decode_access_token(token: str) -> Dict[str, Any]:
     """
-    Decode and verify access token
+    Decode and verify access token.
+    Tokens seen before are answered from `access_token_cache` until they expire.
     """
+    cached = access_token_cache.get(token)
+    if cached is not None:
+        return cached
     try:
-        payload = jwt.decode(token, settings.SECRET_KEY, algorithms=[settings.ALGORITHM])
+        payload = codec.decode(token, settings.SECRET_KEY, settings.ALGORITHM)
         if payload.get("type") != "access":
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token type"
             )
+        access_token_cache.put(token, payload)
         return payload
-    except JWTError:
+    except InvalidToken:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Could not validate credentials",
@@ -83,14 +92,14 @@ def decode_refresh_token(token: str) -> Dict[str, Any]:
     """
     try:
         refresh_secret = getattr(settings, 'REFRESH_SECRET_KEY', settings.SECRET_KEY)
-        payload = jwt.decode(token, refresh_secret, algorithms=[settings.ALGORITHM])
+        payload = codec.decode(token, refresh_secret, settings.ALGORITHM)
         if payload.get("type") != "refresh":
             raise HTTPException(
                 status_code=status.HTTP_401_UNAUTHORIZED,
                 detail="Invalid token type"
             )
         return payload
-    except JWTError:
+    except InvalidToken:
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token"
@@ -115,6 +124,10 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
         email: str = payload.get("sub")
         if email is None:
             raise credentials_exception
+        # Access tokens outlive a logout by up to ACCESS_TOKEN_EXPIRE_MINUTES otherwise
+        family_id = payload.get("fid")
+        if family_id and revocation_cache.is_recently_revoked(family_id):
+            raise credentials_exception
         token_data = schemas.TokenData(email=email)
     except HTTPException:
         raise credentials_exception
@@ -122,6 +135,7 @@ async def get_current_user(token: str = Depends(oauth2_scheme), db: Session = De
     user = db.query(models.User).filter(models.User.email == token_data.email).first()
     if user is None:
         raise credentials_exception
+    note_user(user.id)
     return user
 
 async def get_current_active_user(current_user: models.User = Depends(get_current_user)):
@@ -0,0 +1,218 @@
+"""
+In-memory index of taken usernames and emails for the signup form's
+availability checks.
+
+Each worker keeps one Bloom filter per field, built from a bulk scan of the
+users table at startup and updated by the handlers that create or change
+accounts. Usernames are keyed by their lowercase form, matching the unique
+index on lower(username). A miss in the filter means the value is definitely
+not taken, so the validation endpoints can answer without a database query.
+A hit may be a false positive and falls back to the indexed lookup.
+
+Bloom filters can't forget values, so deleted or renamed accounts stay in the
+filter as false positives until the next rebuild. That costs a DB query,
+never a wrong answer.
+
+The filters are per process. Registrations and account changes publish a
+"user" message on the invalidation bus; every worker queues those user ids
+and `sync_availability_index`, run every AVAILABILITY_SYNC_SECONDS, adds
+their current username and email. When the bus may have missed messages the
+next sync rebuilds the index instead. Until a sync has run, a name taken on
+another worker can still look available, so these checks stay advisory and
+`register` keeps its own database uniqueness checks.
+"""
+import hashlib
+import logging
+import math
+import threading
+from sqlalchemy import func
+from sqlalchemy.orm import Session
+from database import SessionLocal
+from invalidation import bus
+import models
+
+logger = logging.getLogger(__name__)
+
+MIN_CAPACITY = 10_000
+TARGET_ERROR_RATE = 0.01
+# Rebuild once this share of the entries belong to deleted or renamed accounts
+STALE_REBUILD_RATIO = 0.1
+
+
+class BloomFilter:
+    def __init__(self, capacity: int, error_rate: float = TARGET_ERROR_RATE):
+        self.capacity = max(capacity, 1)
+        self.error_rate = error_rate
+        # Optimal size and hash count for the expected number of entries
+        self.num_bits = max(64, math.ceil(-self.capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.num_hashes = max(1, round(self.num_bits / self.capacity * math.log(2)))
+        self.bits = bytearray((self.num_bits + 7) // 8)
+        self.count = 0
+
+    def _positions(self, key: str):
+        # Double hashing: k positions derived from one 128-bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        for i in range(self.num_hashes):
+            yield (h1 + i * h2) % self.num_bits
+
+    def add(self, key: str):
+        for position in self._positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+        self.count += 1
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self._positions(key))
+
+    @property
+    def memory_bytes(self) -> int:
+        return len(self.bits)
+
+    def false_positive_rate(self) -> float:
+        """Current false-positive rate, estimated from the share of bits set"""
+        set_bits = int.from_bytes(self.bits, "little").bit_count()
+        return (set_bits / self.num_bits) ** self.num_hashes
+
+
+class AvailabilityIndex:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.usernames: BloomFilter | None = None
+        self.emails: BloomFilter | None = None
+        self.stale = 0
+        # Values added while a rebuild scan is running, replayed into the new filters
+        self._pending: list[tuple[str | None, str | None]] | None = None
+        # Users changed anywhere in the deployment since the last sync
+        self._changed_users: set[int] = set()
+        self._missed_changes = False
+
+    @property
+    def ready(self) -> bool:
+        return self.usernames is not None
+
+    @property
+    def needs_rebuild(self) -> bool:
+        return self.ready and self.stale > STALE_REBUILD_RATIO * max(self.usernames.count, 1)
+
+    def build(self, db: Session):
+        with self._lock:
+            self._pending = []
+
+        try:
+            total = db.query(func.count(models.User.id)).scalar() or 0
+            capacity = max(2 * total, MIN_CAPACITY)
+            usernames = BloomFilter(capacity)
+            emails = BloomFilter(capacity)
+
+            rows = db.query(models.User.username, models.User.email).yield_per(5000)
+            for username, email in rows:
+                usernames.add(username.lower())
+                emails.add(email)
+        except Exception:
+            with self._lock:
+                self._pending = None
+            raise
+
+        with self._lock:
+            for username, email in self._pending:
+                if username:
+                    usernames.add(username.lower())
+                if email:
+                    emails.add(email)
+            self._pending = None
+            self.usernames, self.emails = usernames, emails
+            self.stale = 0
+
+        logger.info("Availability index built: %s", self.stats())
+
+    def add(self, username: str | None = None, email: str | None = None):
+        """Record a username and/or email as taken"""
+        with self._lock:
+            if self._pending is not None:
+                self._pending.append((username, email))
+            if not self.ready or not (username or email):
+                return
+            if username:
+                self.usernames.add(username.lower())
+            if email:
+                self.emails.add(email)
+
+    def user_changed(self, user_id: int):
+        with self._lock:
+            self._changed_users.add(user_id)
+
+    def changes_missed(self):
+        with self._lock:
+            self._missed_changes = True
+
+    def sync(self, db: Session):
+        """Add the queued users' current values, or rebuild if changes were missed"""
+        with self._lock:
+            user_ids, self._changed_users = self._changed_users, set()
+            missed, self._missed_changes = self._missed_changes, False
+        if missed or self.needs_rebuild:
+            self.build(db)
+            return
+        if not user_ids or not self.ready:
+            return
+        rows = db.query(models.User.username, models.User.email).filter(models.User.id.in_(user_ids)).all()
+        for username, email in rows:
+            # Mostly this worker's own changes, already added
+            self.add(
+                username=None if username.lower() in self.usernames else username,
+                email=None if email in self.emails else email,
+            )
+
+    def release(self, count: int = 1):
+        """Note values that are no longer taken (they stay in the filter until a rebuild)"""
+        with self._lock:
+            self.stale += count
+
+    def username_maybe_taken(self, username: str) -> bool:
+        # Until the first build finishes every check goes to the database
+        filter_ = self.usernames
+        return filter_ is None or username.lower() in filter_
+
+    def email_maybe_taken(self, email: str) -> bool:
+        filter_ = self.emails
+        return filter_ is None or email in filter_
+
+    def stats(self) -> dict:
+        if not self.ready:
+            return {"ready": False}
+        return {
+            "ready": True,
+            "entries": self.usernames.count,
+            "stale_entries": self.stale,
+            "capacity": self.usernames.capacity,
+            "hashes": self.usernames.num_hashes,
+            "memory_bytes": self.usernames.memory_bytes + self.emails.memory_bytes,
+            "username_false_positive_rate": round(self.usernames.false_positive_rate(), 6),
+            "email_false_positive_rate": round(self.emails.false_positive_rate(), 6),
+        }
+
+
+availability_index = AvailabilityIndex()
+
+
+def rebuild_availability_index():
+    """Rebuild the index with its own session (startup / background task)"""
+    db = SessionLocal()
+    try:
+        availability_index.build(db)
+    finally:
+        db.close()
+
+
+def sync_availability_index():
+    """Pick up accounts created or changed by other workers (scheduled per worker)"""
+    db = SessionLocal()
+    try:
+        availability_index.sync(db)
+    finally:
+        db.close()
+
+
+bus.subscribe("user", lambda message: availability_index.user_changed(message.user_id))
+bus.on_reset(availability_index.changes_missed)
@@ -0,0 +1,83 @@
+"""
+Link click counters, stored in `link_stats` (one row per clicked link).
+
+Redirects count clicks in `click_buffer`; `flush_clicks` adds them to the
+table every CLICK_FLUSH_SECONDS with a single upsert.
+"""
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+from sqlalchemy.orm import Session
+from database import SessionLocal
+import models
+
+
+def _insert(db: Session):
+    if db.get_bind().dialect.name == "postgresql":
+        from sqlalchemy.dialects.postgresql import insert
+    else:
+        from sqlalchemy.dialects.sqlite import insert
+    return insert(models.LinkStats)
+
+
+def add_clicks(db: Session, counts: dict[int, int], clicked_at: datetime | None = None):
+    """Add `counts` ({link_id: clicks}) to the counters in one upsert. The caller commits."""
+    if not counts:
+        return
+    clicked_at = clicked_at or datetime.now(timezone.utc)
+    stmt = _insert(db).values([
+        {"link_id": link_id, "click_count": clicks, "last_clicked_at": clicked_at}
+        for link_id, clicks in counts.items()
+    ])
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[models.LinkStats.link_id],
+        set_={
+            "click_count": models.LinkStats.click_count + stmt.excluded.click_count,
+            "last_clicked_at": stmt.excluded.last_clicked_at,
+        },
+    )
+    db.execute(stmt)
+
+
+class ClickBuffer:
+    """Clicks counted in memory and written by `flush_clicks`, so a redirect doesn't wait on a write"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._counts: Counter[int] = Counter()
+
+    def record(self, link_id: int):
+        with self._lock:
+            self._counts[link_id] += 1
+
+    def drain(self) -> Counter[int]:
+        with self._lock:
+            counts, self._counts = self._counts, Counter()
+        return counts
+
+    def restore(self, counts: Counter[int]):
+        with self._lock:
+            self._counts.update(counts)
+
+
+click_buffer = ClickBuffer()
+
+
+def flush_clicks():
+    """Add the buffered clicks to link_stats in one statement"""
+    counts = click_buffer.drain()
+    if not counts:
+        return
+
+    db = SessionLocal()
+    try:
+        # Links deleted since their clicks were counted would break the foreign key
+        existing = {link_id for (link_id,) in db.query(models.Link.id).filter(models.Link.id.in_(counts))}
+        add_clicks(db, {link_id: n for link_id, n in counts.items() if link_id in existing})
+        db.commit()
+    except Exception:
+        db.rollback()
+        click_buffer.restore(counts)
+        raise
+    finally:
+        db.close()
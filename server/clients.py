@@ -0,0 +1,63 @@
+"""
+Clients for external services (Supabase storage, SMTP mail, outgoing HTTP).
+
+Nothing in this module talks to the network or imports the client libraries
+at import time. Each client is built on first use and cached for the life of
+the process, so workers boot fast and only pay for what they actually use.
+"""
+from functools import lru_cache
+from typing import TYPE_CHECKING
+from config import get_settings
+
+if TYPE_CHECKING:
+    import httpx
+    from supabase import Client
+    from fastapi_mail import FastMail
+
+USER_AGENT = "LinktreeClone/1.0 (+link previews)"
+
+
+@lru_cache()
+def get_supabase() -> "Client":
+    """Supabase client authenticated with the service role key"""
+    from supabase import create_client
+
+    settings = get_settings()
+    return create_client(settings.SUPABASE_URL, settings.SUPABASE_SERVICE_KEY)
+
+
+@lru_cache()
+def get_mailer() -> "FastMail":
+    from fastapi_mail import FastMail
+
+    return FastMail(get_settings().MAIL_CONFIG)
+
+
+@lru_cache()
+def get_http_client() -> "httpx.AsyncClient":
+    """Shared async HTTP client for outgoing requests (connection pooling across tasks)"""
+    import httpx
+
+    return httpx.AsyncClient(
+        timeout=httpx.Timeout(10.0, connect=5.0),
+        limits=httpx.Limits(max_connections=50, max_keepalive_connections=20),
+        headers={"User-Agent": USER_AGENT},
+    )
+
+
+async def close_http_client():
+    if get_http_client.cache_info().currsize:
+        await get_http_client().aclose()
+        get_http_client.cache_clear()
+
+
+async def send_plain_email(recipient: str, subject: str, body: str):
+    from fastapi_mail import MessageSchema
+
+    message = MessageSchema(
+        subject=subject,
+        recipients=[recipient],
+        body=body,
+        subtype="plain",
+    )
+    await get_mailer().send_message(message)
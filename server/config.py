@@ -1,6 +1,9 @@
 from pydantic_settings import BaseSettings
-from functools import lru_cache
-from fastapi_mail import ConnectionConfig
+from functools import lru_cache, cached_property
+from typing import TYPE_CHECKING
+
+if TYPE_CHECKING:
+    from fastapi_mail import ConnectionConfig
 
 class Settings(BaseSettings):
     DATABASE_URL: str
@@ -28,6 +31,56 @@ class Settings(BaseSettings):
 
     FRONTEND_URL:str
 
+    # JWT library used to sign and verify tokens: "jose" or "pyjwt" (see jwt_codecs.py)
+    JWT_BACKEND: str = "jose"
+    # Verified access tokens kept in memory per worker (0 disables the cache)
+    ACCESS_TOKEN_CACHE_SIZE: int = 4096
+
+    # How often buffered profile view sketches are written to the database
+    PAGE_VIEW_FLUSH_SECONDS: int = 60
+    # How often each worker pulls session revocations (logout-all propagation delay)
+    SESSION_SYNC_SECONDS: int = 5
+    # Link health checker: how often it runs and how old a URL's last check may get
+    LINK_HEALTH_INTERVAL_SECONDS: int = 900
+    LINK_HEALTH_MAX_AGE_HOURS: int = 24
+    # When expired tokens and sessions are deleted (cron, UTC)
+    TOKEN_CLEANUP_CRON: str = "17 3 * * *"
+    # How long fetched link preview metadata is reused for a URL
+    LINK_PREVIEW_TTL_HOURS: int = 168
+    # Links kept in each worker's redirect map, and how often counted clicks are written
+    REDIRECT_CACHE_SIZE: int = 50_000
+    CLICK_FLUSH_SECONDS: int = 10
+    # Cross-worker cache invalidation: "auto" (Postgres NOTIFY on Postgres), "postgres" or "local"
+    INVALIDATION_TRANSPORT: str = "auto"
+    # Public profile / link list payloads kept precompressed (entries, two per username)
+    PUBLIC_CACHE_SIZE: int = 10_000
+    # X-Admin-Token for the /admin operational endpoints; unset disables them
+    ADMIN_TOKEN: str | None = None
+    # Database connections per worker: kept open, and extra ones opened under load
+    DB_POOL_SIZE: int = 5
+    DB_MAX_OVERFLOW: int = 10
+    # SQLite only: bytes of the database file memory-mapped, and how long a write waits for the lock
+    SQLITE_MMAP_SIZE: int = 256 * 1024 * 1024
+    SQLITE_BUSY_TIMEOUT_MS: int = 5000
+    # Threads for sync routes and run_in_threadpool; unset means the connections left after BACKGROUND_THREADS
+    THREADPOOL_SIZE: int | None = None
+    # Threads for exports, sync scheduler jobs and startup builds, apart from the request threadpool
+    BACKGROUND_THREADS: int = 4
+    # Continuous low-rate profiling of every request (samples per second, 0 = off; see profiling.py)
+    PROFILER_CONTINUOUS_HZ: float = 0
+    # Statements slower than this are logged with their route and call site (see querylog.py)
+    SLOW_QUERY_MS: int = 200
+    # Share of public read and click requests written to the access log; errors and slow requests always are
+    ACCESS_LOG_PUBLIC_SAMPLE_RATE: float = 1.0
+    ACCESS_LOG_SLOW_MS: int = 1000
+    # How often each worker adds accounts created or renamed on other workers to its availability index
+    AVAILABILITY_SYNC_SECONDS: int = 5
+    # Public profiles preloaded into the cache at startup: the most viewed over the last WARMUP_DAYS (see warmup.py)
+    WARMUP_PROFILES: int = 100
+    WARMUP_DAYS: int = 7
+    # Requests one worker works on at once before low priority ones are shed (see load_shedding.py)
+    MAX_IN_FLIGHT_REQUESTS: int = 64
+
     class Config:
         env_file = ".env"
 
@@ -35,8 +88,11 @@ class Settings(BaseSettings):
     def cors_origins(self) -> list[str]:
         return [origin.strip() for origin in self.BACKEND_CORS_ORIGINS.split(",")]
     
-    @property
-    def MAIL_CONFIG(self) -> ConnectionConfig:
+    @cached_property
+    def MAIL_CONFIG(self) -> "ConnectionConfig":
+        # Built once per process; fastapi_mail is only imported when mail is sent
+        from fastapi_mail import ConnectionConfig
+
         return ConnectionConfig(
             MAIL_USERNAME=self.MAIL_USERNAME,
             MAIL_PASSWORD=self.MAIL_PASSWORD,
@@ -1,28 +1,101 @@
-from sqlalchemy import create_engine
+from contextvars import ContextVar
+from fastapi import Request
+from fastapi.routing import APIRoute
+from sqlalchemy import create_engine, event
+from sqlalchemy.engine import make_url
+from sqlalchemy.pool import StaticPool
+from starlette.concurrency import run_in_threadpool
 from sqlalchemy.ext.declarative import declarative_base
 from sqlalchemy.orm import sessionmaker
 from config import get_settings
 
 settings = get_settings()
 
+database_url = make_url(settings.DATABASE_URL)
+is_sqlite = database_url.get_backend_name() == "sqlite"
+# sqlite:// or sqlite:///:memory:, which only lives as long as its connection
+is_sqlite_memory = is_sqlite and database_url.database in (None, "", ":memory:")
+
+def _engine_options() -> dict:
+    if is_sqlite_memory:
+        # Every session shares the one connection that holds the database
+        return {"poolclass": StaticPool, "connect_args": {"check_same_thread": False}}
+    if is_sqlite:
+        # A file needs no liveness checks or recycling; connections are cheap but
+        # pooling keeps each one's pragmas and page cache
+        return {
+            "pool_size": settings.DB_POOL_SIZE,
+            "max_overflow": settings.DB_MAX_OVERFLOW,
+            "connect_args": {"check_same_thread": False},
+        }
+    return {
+        "pool_pre_ping": True,        # Verify connections before using
+        "pool_size": settings.DB_POOL_SIZE,          # Number of connections to keep
+        "max_overflow": settings.DB_MAX_OVERFLOW,    # Extra connections when needed
+        "pool_recycle": 3600,          # Recycle connections after 1 hour
+    }
+
 # Create engine with proper connection pooling
 engine = create_engine(
     settings.DATABASE_URL,
-    pool_pre_ping=True,        # Verify connections before using
-    pool_size=5,                # Number of connections to keep
-    max_overflow=10,            # Extra connections when needed
-    pool_recycle=3600,          # Recycle connections after 1 hour
     echo=False,                 # Set to True for SQL debugging
+    **_engine_options(),
 )
 
+if is_sqlite:
+    @event.listens_for(engine, "connect")
+    def _set_sqlite_pragmas(dbapi_connection, connection_record):
+        cursor = dbapi_connection.cursor()
+        # Readers don't block the writer and vice versa; WAL doesn't apply in memory
+        if not is_sqlite_memory:
+            cursor.execute("PRAGMA journal_mode=WAL")
+        # Safe with WAL: a power loss can lose the last commits but not corrupt the file
+        cursor.execute("PRAGMA synchronous=NORMAL")
+        cursor.execute(f"PRAGMA mmap_size={int(settings.SQLITE_MMAP_SIZE)}")
+        # Wait for a concurrent writer instead of failing with "database is locked"
+        cursor.execute(f"PRAGMA busy_timeout={int(settings.SQLITE_BUSY_TIMEOUT_MS)}")
+        # ON DELETE CASCADE is only enforced with foreign keys on
+        cursor.execute("PRAGMA foreign_keys=ON")
+        cursor.close()
+
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
 Base = declarative_base()
 
-# Dependency for FastAPI routes
-def get_db():
+# Path template of the route being served, for pool hold time stats (pool_stats.py)
+current_route: ContextVar[str] = ContextVar("current_route", default="(background)")
+
+# Dependency for FastAPI routes. The session takes a pooled connection on its
+# first query; routes using DBRoute hand it back as soon as the response is built.
+def get_db(request: Request):
     db = SessionLocal()
+    request.state.db = db
     try:
         yield db
     finally:
-        db.close()
\ No newline at end of file
+        db.close()
+
+class DBRoute(APIRoute):
+    """
+    Closes the request's session right after the handler returns and the
+    response is serialized, instead of after the response has been sent.
+    A session that committed already gave its connection back; this covers
+    read-only requests, which would otherwise sit idle in a transaction
+    while the body goes out. Background tasks open their own sessions.
+    """
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+
+        async def route_handler(request: Request):
+            token = current_route.set(path)
+            try:
+                return await handler(request)
+            finally:
+                db = getattr(request.state, "db", None)
+                if db is not None and db.in_transaction():
+                    # Rolling back the connection is a round trip; keep it off the event loop
+                    await run_in_threadpool(db.close)
+                current_route.reset(token)
+
+        return route_handler
\ No newline at end of file
@@ -0,0 +1,75 @@
+# import_time_report.py
+"""
+Report how long it takes to import the API and check it against a budget.
+Runs `python -X importtime -c "import <module>"` in a fresh interpreter,
+keeps the fastest of a few runs and prints the slowest imports.
+
+Usage: python import_time_report.py [--module main] [--runs 3] [--top 15] [--budget-ms 1500]
+
+Exits with status 1 when the cumulative import time of the module is over budget,
+so it can be used as a CI gate.
+"""
+import argparse
+import os
+import subprocess
+import sys
+from pathlib import Path
+
+SERVER_DIR = Path(__file__).resolve().parent
+
+
+def measure(module: str) -> dict[str, tuple[int, int]]:
+    """Import `module` in a subprocess and return {name: (self_us, cumulative_us)}"""
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", f"import {module}"],
+        cwd=SERVER_DIR,
+        env=os.environ.copy(),
+        capture_output=True,
+        text=True,
+    )
+    if result.returncode != 0:
+        # The importtime lines are on stderr too; show the traceback at the end
+        print(result.stderr.splitlines()[-1] if result.stderr else "import failed")
+        sys.exit(2)
+
+    timings = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "[us]" in line:
+            continue
+        self_us, cumulative_us, name = line[len("import time:"):].split("|")
+        timings[name.strip()] = (int(self_us), int(cumulative_us))
+    return timings
+
+
+def report(module: str, runs: int, top: int, budget_ms: float) -> bool:
+    # Keep the best run for each module to filter out noise from a cold disk cache
+    best: dict[str, tuple[int, int]] = {}
+    for _ in range(runs):
+        for name, timing in measure(module).items():
+            if name not in best or timing[1] < best[name][1]:
+                best[name] = timing
+
+    total_ms = best[module][1] / 1000
+
+    print(f"Slowest imports under '{module}' (best of {runs} runs)\n")
+    print(f"{'cumulative ms':>14} {'self ms':>9}  module")
+    slowest = sorted(best.items(), key=lambda item: item[1][1], reverse=True)
+    for name, (self_us, cumulative_us) in slowest[:top]:
+        print(f"{cumulative_us / 1000:>14.1f} {self_us / 1000:>9.1f}  {name}")
+
+    within_budget = total_ms <= budget_ms
+    status = "OK" if within_budget else "OVER BUDGET"
+    print(f"\nimport {module}: {total_ms:.1f} ms (budget {budget_ms:.0f} ms) {status}")
+    return within_budget
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--module", default="main")
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--top", type=int, default=15)
+    parser.add_argument("--budget-ms", type=float, default=float(os.environ.get("IMPORT_BUDGET_MS", 1500)))
+    args = parser.parse_args()
+
+    if not report(args.module, args.runs, args.top, args.budget_ms):
+        sys.exit(1)
@@ -2,14 +2,28 @@
 """
 Run this script ONCE to create all database tables.
 Usage: python init_db.py
+
+On an empty database (Postgres or SQLite) the schema is stamped as the
+latest Alembic revision, so later migrations apply with `alembic upgrade head`.
 """
-from database import engine, Base
+import os
+from sqlalchemy import inspect
+from alembic import command
+from alembic.config import Config
+from database import engine, Base, is_sqlite_memory
 import models  # This imports all your models
 
+ALEMBIC_INI = os.path.join(os.path.dirname(os.path.abspath(__file__)), "alembic.ini")
+
 def init_db():
     print("Creating database tables...")
+    fresh = not inspect(engine).has_table("users")
     Base.metadata.create_all(bind=engine)
+    # An in-memory database is gone before Alembic could connect to it
+    if fresh and not is_sqlite_memory:
+        # create_all built the current schema; the migrations before it don't apply
+        command.stamp(Config(ALEMBIC_INI), "head")
     print("✅ Database tables created successfully!")
 
 if __name__ == "__main__":
-    init_db()
\ No newline at end of file
+    init_db()
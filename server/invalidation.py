@@ -0,0 +1,239 @@
+"""
+Cross-worker cache invalidation.
+
+Every worker keeps in-process caches (redirect map, profile payloads, ...).
+Write handlers call `publish(entity, user_id)` after committing; the message
+`(entity, user_id, version)` is applied to this worker's caches right away
+and sent to every other worker, which evicts its own copies.
+
+Transports:
+- PostgresTransport: NOTIFY on the `cache_invalidation` channel, with one
+  LISTEN connection per worker read by a background thread. Used when the
+  database is Postgres.
+- LocalTransport: delivers to every bus started in the same process. Used on
+  SQLite (a single worker) and in tests, which can start several buses to
+  stand in for several workers.
+
+`bus.version(entity, user_id)` is when this worker last applied an
+invalidation of that user, on its own monotonic clock (`now_ns`), so a cache
+can refuse to store data it read (`now_ns()` before the read) before the
+latest invalidation. The message's `version` is the publisher's clock and is
+never compared across hosts, where clocks may be skewed. Each received message also records its
+propagation delay (receive time - send time) for `bus.stats()`; delays over
+SLOW_DELIVERY_MS are logged. Messages sent while a listener was disconnected
+are lost, so after reconnecting the bus calls its reset callbacks and the
+caches start over empty.
+"""
+import json
+import logging
+import os
+import select
+import threading
+import time
+import uuid
+from collections import OrderedDict, deque
+from typing import Callable, NamedTuple
+from sqlalchemy import text
+from config import get_settings
+from database import engine
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+CHANNEL = "cache_invalidation"
+ENTITIES = ("link", "profile", "user")
+# Versions remembered per (entity, user); older entries are forgotten first
+MAX_TRACKED_VERSIONS = 100_000
+DELAY_SAMPLES = 1000
+SLOW_DELIVERY_MS = 1000
+
+# Local clock for bus versions and cache read times; immune to wall clock steps
+now_ns = time.monotonic_ns
+
+
+class Invalidation(NamedTuple):
+    entity: str
+    user_id: int
+    version: int
+    sent_at: float
+    origin: str
+
+    def to_json(self) -> str:
+        return json.dumps(self._asdict(), separators=(",", ":"))
+
+    @classmethod
+    def from_json(cls, payload: str) -> "Invalidation":
+        return cls(**json.loads(payload))
+
+
+class LocalTransport:
+    name = "local"
+    _receivers: list[Callable[[Invalidation], None]] = []
+
+    def start(self, deliver: Callable[[Invalidation], None], reset: Callable[[], None]):
+        self._deliver = deliver
+        LocalTransport._receivers.append(deliver)
+
+    def send(self, message: Invalidation):
+        for deliver in list(LocalTransport._receivers):
+            deliver(message)
+
+    def stop(self):
+        if self._deliver in LocalTransport._receivers:
+            LocalTransport._receivers.remove(self._deliver)
+
+
+class PostgresTransport:
+    name = "postgres"
+    RECONNECT_SECONDS = 2.0
+
+    def __init__(self):
+        self._stop = threading.Event()
+        self._thread: threading.Thread | None = None
+
+    def send(self, message: Invalidation):
+        with engine.connect() as conn:
+            conn.execute(text("SELECT pg_notify(:channel, :payload)"), {"channel": CHANNEL, "payload": message.to_json()})
+            conn.commit()
+
+    def start(self, deliver: Callable[[Invalidation], None], reset: Callable[[], None]):
+        self._thread = threading.Thread(target=self._listen, args=(deliver, reset), name="invalidation-listener", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+
+    def _listen(self, deliver: Callable[[Invalidation], None], reset: Callable[[], None]):
+        first = True
+        while not self._stop.is_set():
+            try:
+                self._listen_once(deliver, None if first else reset)
+            except Exception:
+                first = False
+                logger.exception("Invalidation listener lost its connection, reconnecting")
+                self._stop.wait(self.RECONNECT_SECONDS)
+
+    def _listen_once(self, deliver: Callable[[Invalidation], None], reset: Callable[[], None] | None):
+        # A dedicated connection, taken out of the pool for good
+        pooled = engine.raw_connection()
+        pooled.detach()
+        conn = pooled.dbapi_connection
+        try:
+            conn.autocommit = True
+            conn.cursor().execute(f"LISTEN {CHANNEL}")
+            if reset is not None:
+                # Anything published while we were away was missed
+                reset()
+            while not self._stop.is_set():
+                if select.select([conn], [], [], 1.0) == ([], [], []):
+                    continue
+                conn.poll()
+                while conn.notifies:
+                    notify = conn.notifies.pop(0)
+                    try:
+                        deliver(Invalidation.from_json(notify.payload))
+                    except Exception:
+                        logger.exception("Bad invalidation message %r", notify.payload)
+        finally:
+            conn.close()
+
+
+class InvalidationBus:
+    def __init__(self):
+        self.origin = f"{os.getpid()}-{uuid.uuid4().hex[:8]}"
+        self.transport = LocalTransport()
+        self._subscribers: dict[str, list[Callable[[Invalidation], None]]] = {entity: [] for entity in ENTITIES}
+        self._reset_callbacks: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+        self._versions: OrderedDict[tuple[str, int], int] = OrderedDict()
+        self._delays_ms: deque[float] = deque(maxlen=DELAY_SAMPLES)
+        self.published = 0
+        self.received = 0
+        self.resets = 0
+
+    def subscribe(self, entity: str, callback: Callable[[Invalidation], None]):
+        self._subscribers[entity].append(callback)
+
+    def on_reset(self, callback: Callable[[], None]):
+        """Called when messages may have been missed; the cache should drop everything"""
+        self._reset_callbacks.append(callback)
+
+    def start(self, transport):
+        self.transport = transport
+        transport.start(self._receive, self._reset)
+        logger.info("Invalidation bus started (%s transport)", transport.name)
+
+    def stop(self):
+        self.transport.stop()
+
+    def version(self, entity: str, user_id: int) -> int:
+        return self._versions.get((entity, user_id), 0)
+
+    def publish(self, entity: str, user_id: int):
+        """Evict `entity` of `user_id` here and in every other worker. Call after committing."""
+        now = time.time()
+        message = Invalidation(entity, user_id, time.time_ns(), now, self.origin)
+        self._apply(message)
+        self.published += 1
+        try:
+            self.transport.send(message)
+        except Exception:
+            # Other workers keep the stale entry until it is evicted or expires
+            logger.exception("Publishing invalidation %s failed", message)
+
+    def _receive(self, message: Invalidation):
+        if message.origin == self.origin:
+            return
+        self.received += 1
+        delay_ms = max(0.0, (time.time() - message.sent_at) * 1000)
+        self._delays_ms.append(delay_ms)
+        if delay_ms > SLOW_DELIVERY_MS:
+            logger.warning("Invalidation %s arrived after %.0f ms", message, delay_ms)
+        self._apply(message)
+
+    def _reset(self):
+        self.resets += 1
+        for callback in self._reset_callbacks:
+            try:
+                callback()
+            except Exception:
+                logger.exception("Invalidation reset callback failed")
+
+    def _apply(self, message: Invalidation):
+        key = (message.entity, message.user_id)
+        with self._lock:
+            self._versions[key] = now_ns()
+            self._versions.move_to_end(key)
+            while len(self._versions) > MAX_TRACKED_VERSIONS:
+                self._versions.popitem(last=False)
+
+        for callback in self._subscribers[message.entity]:
+            try:
+                callback(message)
+            except Exception:
+                logger.exception("Invalidation subscriber failed for %s", message)
+
+    def stats(self) -> dict:
+        delays = sorted(self._delays_ms)
+        def percentile(p):
+            return round(delays[min(len(delays) - 1, int(p * len(delays)))], 2) if delays else None
+        return {
+            "transport": self.transport.name,
+            "published": self.published,
+            "received": self.received,
+            "resets": self.resets,
+            "delay_ms_p50": percentile(0.5),
+            "delay_ms_p99": percentile(0.99),
+            "delay_ms_max": round(delays[-1], 2) if delays else None,
+        }
+
+
+bus = InvalidationBus()
+publish = bus.publish
+
+
+def make_transport():
+    choice = settings.INVALIDATION_TRANSPORT
+    if choice == "auto":
+        choice = "postgres" if engine.dialect.name == "postgresql" else "local"
+    return PostgresTransport() if choice == "postgres" else LocalTransport()
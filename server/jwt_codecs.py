@@ -0,0 +1,120 @@
+"""
+Interchangeable JWT backends.
+
+python-jose and PyJWT are both in requirements.txt; `JWT_BACKEND` picks the
+one auth.py signs and verifies tokens with. Both produce standard HS256
+tokens, so switching backends doesn't log anyone out. `bench_jwt.py`
+compares them on our token shape.
+
+`VerifiedTokenCache` sits in front of whichever backend is used so repeat
+requests with the same access token skip signature verification.
+"""
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+from functools import lru_cache
+from typing import Any, Dict, Optional
+
+
+class InvalidToken(Exception):
+    """Bad signature, expired, or malformed token (whatever the backend)"""
+
+
+class JoseCodec:
+    name = "jose"
+
+    def __init__(self):
+        from jose import JWTError, jwt
+
+        self._jwt = jwt
+        self._error = JWTError
+
+    def encode(self, payload: Dict[str, Any], key: str, algorithm: str) -> str:
+        return self._jwt.encode(payload, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithm: str) -> Dict[str, Any]:
+        try:
+            return self._jwt.decode(token, key, algorithms=[algorithm])
+        except self._error as exc:
+            raise InvalidToken(str(exc)) from exc
+
+
+class PyJWTCodec:
+    name = "pyjwt"
+
+    def __init__(self):
+        import jwt
+
+        self._jwt = jwt
+        self._error = jwt.PyJWTError
+
+    def encode(self, payload: Dict[str, Any], key: str, algorithm: str) -> str:
+        return self._jwt.encode(payload, key, algorithm=algorithm)
+
+    def decode(self, token: str, key: str, algorithm: str) -> Dict[str, Any]:
+        try:
+            return self._jwt.decode(token, key, algorithms=[algorithm])
+        except self._error as exc:
+            raise InvalidToken(str(exc)) from exc
+
+
+CODECS = {codec.name: codec for codec in (JoseCodec, PyJWTCodec)}
+
+
+@lru_cache
+def get_codec(name: str):
+    try:
+        return CODECS[name]()
+    except KeyError:
+        raise ValueError(f"Unknown JWT backend {name!r}, expected one of {sorted(CODECS)}")
+
+
+class VerifiedTokenCache:
+    """
+    Bounded LRU of access tokens that already passed signature verification.
+    Entries are keyed by a SHA-256 digest of the token (the raw token is never
+    kept) and dropped once the token's `exp` has passed, so a hit is exactly as
+    valid as a fresh verification. Revocation is checked by the caller either way.
+    """
+
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[bytes, tuple[float, Dict[str, Any]]] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _key(token: str) -> bytes:
+        return hashlib.sha256(token.encode()).digest()
+
+    def get(self, token: str) -> Optional[Dict[str, Any]]:
+        key = self._key(token)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.misses += 1
+                return None
+            expires_at, payload = entry
+            if expires_at <= time.time():
+                del self._entries[key]
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return payload
+
+    def put(self, token: str, payload: Dict[str, Any]):
+        if self.maxsize <= 0 or "exp" not in payload:
+            return
+        key = self._key(token)
+        with self._lock:
+            self._entries[key] = (float(payload["exp"]), payload)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def stats(self) -> dict:
+        return {"size": len(self._entries), "maxsize": self.maxsize, "hits": self.hits, "misses": self.misses}
+
@@ -0,0 +1,84 @@
+"""
+Streaming export of a user's links with their click counters.
+
+Rows are read through a server-side cursor in batches of EXPORT_BATCH_SIZE
+and written out one line at a time, so memory stays flat however many links
+a user has. The generator opens its own session because it keeps running
+after the request handler has returned.
+"""
+import csv
+import io
+import json
+from datetime import datetime
+from enum import Enum
+from typing import Iterator
+from sqlalchemy import select
+from database import SessionLocal
+import models
+
+EXPORT_BATCH_SIZE = 500
+
+EXPORT_FIELDS = [
+    "id", "link_type", "social_platform", "title", "url", "description",
+    "thumbnail_url", "is_active", "sort_key", "created_at", "updated_at",
+    "click_count", "last_clicked_at",
+]
+
+MEDIA_TYPES = {
+    "ndjson": "application/x-ndjson",
+    "csv": "text/csv; charset=utf-8",
+}
+
+
+def _plain(value):
+    if isinstance(value, Enum):
+        return value.value
+    if isinstance(value, datetime):
+        return value.isoformat()
+    return value
+
+
+def _rows(user_id: int) -> Iterator[dict]:
+    stmt = (
+        select(
+            models.Link.id, models.Link.link_type, models.Link.social_platform,
+            models.Link.title, models.Link.url, models.Link.description,
+            models.Link.thumbnail_url, models.Link.is_active, models.Link.sort_key,
+            models.Link.created_at, models.Link.updated_at,
+            models.LinkStats.click_count, models.LinkStats.last_clicked_at,
+        )
+        .outerjoin(models.LinkStats, models.LinkStats.link_id == models.Link.id)
+        .where(models.Link.user_id == user_id)
+        .order_by(models.Link.sort_key, models.Link.id)
+        .execution_options(yield_per=EXPORT_BATCH_SIZE)
+    )
+
+    db = SessionLocal()
+    try:
+        for row in db.execute(stmt).mappings():
+            row = {field: _plain(row[field]) for field in EXPORT_FIELDS}
+            row["click_count"] = row["click_count"] or 0
+            yield row
+    finally:
+        db.close()
+
+
+def stream_ndjson(user_id: int) -> Iterator[str]:
+    for row in _rows(user_id):
+        yield json.dumps(row, ensure_ascii=False) + "\n"
+
+
+def stream_csv(user_id: int) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=EXPORT_FIELDS)
+    writer.writeheader()
+    for row in _rows(user_id):
+        writer.writerow(row)
+        # Hand over whatever the writer produced and reuse the buffer
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    yield buffer.getvalue()
+
+
+STREAMS = {"ndjson": stream_ndjson, "csv": stream_csv}
@@ -0,0 +1,225 @@
+"""
+Background checker that finds dead links.
+
+Each run picks up to MAX_URLS_PER_RUN distinct URLs of active links whose
+last check is older than LINK_HEALTH_MAX_AGE_HOURS and requests each of them
+once, however many links share it. Requests go out over one async HTTP
+client with at most MAX_CONCURRENCY in flight overall and PER_HOST_CONCURRENCY
+per host, so a popular domain isn't hammered. A HEAD request is tried first,
+falling back to GET (without reading the body) for servers that don't
+support HEAD. Redirects are followed by hand, at most MAX_REDIRECTS hops,
+and every hop must resolve to a public address, which the request is then
+pinned to (see url_safety.py); links pointing at internal hosts are stored
+as "unreachable" without being requested.
+
+Results are kept per URL in `url_checks`, with the ETag / Last-Modified
+validators, so the next check is a conditional request. A URL checked
+recently for another link is not fetched again: its stored result is copied.
+The outcome lands on every link with that URL (`Link.health_*`).
+"""
+import asyncio
+import hashlib
+import logging
+from collections import defaultdict
+from dataclasses import dataclass
+from datetime import datetime, timedelta, timezone
+from typing import TYPE_CHECKING, Optional
+from urllib.parse import urljoin, urlsplit
+from sqlalchemy import bindparam, select, update
+from config import get_settings
+from database import SessionLocal
+from invalidation import publish
+from threadpool import run_in_background_thread
+from url_safety import MAX_REDIRECTS, UnsafeUrl, pinned, public_address
+import models
+
+if TYPE_CHECKING:
+    import httpx
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+MAX_URLS_PER_RUN = 500
+MAX_CONCURRENCY = 20
+PER_HOST_CONCURRENCY = 2
+REQUEST_TIMEOUT_SECONDS = 10.0
+CONNECT_TIMEOUT_SECONDS = 5.0
+USER_AGENT = "LinktreeClone-LinkChecker/1.0"
+# Servers answering these to HEAD may still serve GET
+HEAD_UNSUPPORTED = {403, 405, 501}
+
+
+@dataclass
+class CheckResult:
+    status: str
+    status_code: Optional[int] = None
+    etag: Optional[str] = None
+    last_modified: Optional[str] = None
+
+
+def url_hash(url: str) -> str:
+    return hashlib.sha256(url.encode()).hexdigest()
+
+
+def _classify(status_code: int) -> str:
+    # 429 means the host is throttling us, not that the link is gone
+    return "ok" if status_code < 400 or status_code == 429 else "broken"
+
+
+async def _request(client: "httpx.AsyncClient", url: str, headers: dict) -> "httpx.Response":
+    target, host_header, extensions = pinned(url, await public_address(url))
+    headers = {**headers, **host_header}
+    response = await client.head(target, headers=headers, extensions=extensions)
+    if response.status_code in HEAD_UNSUPPORTED:
+        async with client.stream("GET", target, headers=headers, extensions=extensions) as response:
+            pass
+    return response
+
+
+async def check_url(client: "httpx.AsyncClient", url: str, previous: Optional[models.UrlCheck] = None) -> CheckResult:
+    """Check one URL, conditionally if there is a previous result with validators"""
+    import httpx
+
+    if urlsplit(url).scheme not in ("http", "https"):
+        return CheckResult("broken")
+
+    validators = {}
+    if previous is not None:
+        if previous.etag:
+            validators["If-None-Match"] = previous.etag
+        if previous.last_modified:
+            validators["If-Modified-Since"] = previous.last_modified
+
+    # Redirects are followed by hand so that every hop is checked and pinned to a
+    # public address; otherwise links could make us probe internal hosts and
+    # publish what answered. The validators belong to the original URL only.
+    current = url
+    try:
+        for hop in range(MAX_REDIRECTS + 1):
+            response = await _request(client, current, validators if hop == 0 else {})
+            if not response.has_redirect_location:
+                break
+            current = urljoin(current, response.headers["location"])
+        else:
+            return CheckResult("unreachable")
+    except (httpx.HTTPError, httpx.InvalidURL, UnsafeUrl, OSError):
+        return CheckResult("unreachable")
+
+    if response.status_code == 304 and previous is not None:
+        return CheckResult(previous.status, previous.status_code, previous.etag, previous.last_modified)
+
+    return CheckResult(
+        _classify(response.status_code),
+        response.status_code,
+        response.headers.get("etag"),
+        response.headers.get("last-modified"),
+    )
+
+
+async def check_urls(urls: dict[str, Optional[models.UrlCheck]]) -> dict[str, CheckResult]:
+    """Check {url: previous result} concurrently, bounded overall and per host"""
+    # Imported here to keep httpx out of the API's startup imports
+    import httpx
+
+    host_limits = defaultdict(lambda: asyncio.Semaphore(PER_HOST_CONCURRENCY))
+    limits = httpx.Limits(max_connections=MAX_CONCURRENCY, max_keepalive_connections=MAX_CONCURRENCY)
+
+    async with httpx.AsyncClient(
+        timeout=httpx.Timeout(REQUEST_TIMEOUT_SECONDS, connect=CONNECT_TIMEOUT_SECONDS),
+        limits=limits,
+        follow_redirects=False,
+        headers={"User-Agent": USER_AGENT},
+    ) as client:
+        async def check(url: str):
+            async with host_limits[urlsplit(url).hostname]:
+                return url, await check_url(client, url, urls[url])
+
+        # The client's connection limit caps the overall concurrency
+        results = await asyncio.gather(*(check(url) for url in urls))
+    return dict(results)
+
+
+def _due_urls() -> dict[str, Optional[models.UrlCheck]]:
+    """URLs of links due for a check, with their last stored result"""
+    cutoff = datetime.now(timezone.utc) - timedelta(hours=settings.LINK_HEALTH_MAX_AGE_HOURS)
+    db = SessionLocal()
+    try:
+        urls = [url for (url,) in db.query(models.Link.url).filter(
+            models.Link.is_active == True,
+            (models.Link.health_checked_at.is_(None)) | (models.Link.health_checked_at < cutoff)
+        ).distinct().limit(MAX_URLS_PER_RUN).all()]
+
+        hashes = {url_hash(url): url for url in urls}
+        checks = db.query(models.UrlCheck).filter(models.UrlCheck.url_hash.in_(hashes)).all()
+        db.expunge_all()
+    finally:
+        db.close()
+
+    previous = {hashes[check.url_hash]: check for check in checks}
+    return {url: previous.get(url) for url in urls}
+
+
+def _is_fresh(check: Optional[models.UrlCheck]) -> bool:
+    if check is None:
+        return False
+    checked_at = check.checked_at if check.checked_at.tzinfo else check.checked_at.replace(tzinfo=timezone.utc)
+    return datetime.now(timezone.utc) - checked_at < timedelta(hours=settings.LINK_HEALTH_MAX_AGE_HOURS)
+
+
+def _save_results(results: dict[str, CheckResult], fetched: set[str]):
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        for url in fetched:
+            result = results[url]
+            db.merge(models.UrlCheck(
+                url_hash=url_hash(url),
+                url=url,
+                status=result.status,
+                status_code=result.status_code,
+                etag=result.etag,
+                last_modified=result.last_modified,
+                checked_at=now,
+            ))
+
+        stmt = update(models.Link.__table__).where(
+            models.Link.__table__.c.url == bindparam("checked_url")
+        ).values(
+            health_status=bindparam("status"),
+            health_status_code=bindparam("status_code"),
+            health_checked_at=now,
+            # A check isn't an edit; keep the onupdate default off updated_at
+            updated_at=models.Link.__table__.c.updated_at,
+        )
+        db.connection().execute(stmt, [
+            {"checked_url": url, "status": result.status, "status_code": result.status_code}
+            for url, result in results.items()
+        ])
+        user_ids = db.execute(
+            select(models.Link.user_id).where(models.Link.url.in_(results)).distinct()
+        ).scalars().all()
+        db.commit()
+        # Public payloads show the health fields
+        for user_id in user_ids:
+            publish("link", user_id)
+    finally:
+        db.close()
+
+
+async def run_link_health_check() -> int:
+    """Check the links that are due; returns the number of URLs fetched"""
+    due = await run_in_background_thread(_due_urls)
+    if not due:
+        return 0
+
+    # URLs checked recently for other links reuse that result
+    results = {
+        url: CheckResult(check.status, check.status_code, check.etag, check.last_modified)
+        for url, check in due.items() if _is_fresh(check)
+    }
+    to_fetch = {url: check for url, check in due.items() if url not in results}
+    results.update(await check_urls(to_fetch))
+
+    await run_in_background_thread(_save_results, results, set(to_fetch))
+    logger.info("Link health check: %s URLs fetched, %s from cache", len(to_fetch), len(due) - len(to_fetch))
+    return len(to_fetch)
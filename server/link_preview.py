@@ -0,0 +1,218 @@
+"""
+Link previews: Open Graph / <title> metadata for links.
+
+After a link is created or its URL changes, `refresh_link_preview` runs as a
+background task. Metadata is cached per normalized URL in `url_metadata` for
+LINK_PREVIEW_TTL_HOURS, shared by every user, so a popular URL is fetched
+once per TTL no matter how many links point at it. Concurrent refreshes of the
+same URL in one process share a single fetch.
+
+Fetches only go to public addresses (every redirect hop is checked and
+pinned, see url_safety.py), read at most MAX_PAGE_BYTES of HTML and give up
+after FETCH_TIMEOUT_SECONDS.
+The preview only fills a link's description and thumbnail when the user
+left them empty.
+"""
+import asyncio
+import hashlib
+import logging
+from datetime import datetime, timedelta, timezone
+from html.parser import HTMLParser
+from typing import Optional
+from urllib.parse import parse_qsl, urlencode, urljoin, urlsplit, urlunsplit
+from starlette.concurrency import run_in_threadpool
+from clients import get_http_client
+from config import get_settings
+from database import SessionLocal
+from invalidation import publish
+from url_safety import MAX_REDIRECTS, UnsafeUrl, pinned, public_address
+import models
+import search
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+MAX_PAGE_BYTES = 512 * 1024
+FETCH_TIMEOUT_SECONDS = 8.0
+# Failed fetches are retried sooner than successful ones are refreshed
+FAILURE_TTL = timedelta(hours=1)
+TRACKING_PARAMS = {"fbclid", "gclid", "igshid", "mc_cid", "mc_eid", "ref_src"}
+
+# url_hash -> fetch in progress in this process
+_in_flight: dict[str, asyncio.Task] = {}
+
+
+def normalize_url(url: str) -> str:
+    """Canonical form used as the cache key: same page, same key"""
+    parts = urlsplit(url.strip())
+    scheme = parts.scheme.lower()
+    host = (parts.hostname or "").lower()
+    port = parts.port
+    netloc = host if port is None or (scheme, port) in (("http", 80), ("https", 443)) else f"{host}:{port}"
+    query = sorted(
+        (key, value) for key, value in parse_qsl(parts.query, keep_blank_values=True)
+        if not key.startswith("utm_") and key not in TRACKING_PARAMS
+    )
+    return urlunsplit((scheme, netloc, parts.path or "/", urlencode(query), ""))
+
+
+def url_hash(normalized_url: str) -> str:
+    return hashlib.sha256(normalized_url.encode()).hexdigest()
+
+
+class _MetadataParser(HTMLParser):
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.meta: dict[str, str] = {}
+        self.title = ""
+        self._in_title = False
+
+    def handle_starttag(self, tag, attrs):
+        if tag == "meta":
+            attrs = dict(attrs)
+            key = (attrs.get("property") or attrs.get("name") or "").lower()
+            if key and attrs.get("content") and key not in self.meta:
+                self.meta[key] = attrs["content"].strip()
+        elif tag == "title":
+            self._in_title = True
+
+    def handle_endtag(self, tag):
+        if tag == "title":
+            self._in_title = False
+
+    def handle_data(self, data):
+        if self._in_title:
+            self.title += data
+
+
+def parse_metadata(html: str, base_url: str) -> dict:
+    parser = _MetadataParser()
+    parser.feed(html)
+    meta = parser.meta
+    image = meta.get("og:image") or meta.get("twitter:image")
+    return {
+        "title": (meta.get("og:title") or meta.get("twitter:title") or parser.title.strip() or None),
+        "description": meta.get("og:description") or meta.get("description") or meta.get("twitter:description"),
+        "image_url": urljoin(base_url, image) if image else None,
+        "site_name": meta.get("og:site_name"),
+    }
+
+
+async def fetch_metadata(url: str) -> dict:
+    """Fetch a page's head and parse its metadata, within the byte, time and address limits"""
+    client = get_http_client()
+
+    async def fetch():
+        current = url
+        for _ in range(MAX_REDIRECTS + 1):
+            target, headers, extensions = pinned(current, await public_address(current))
+            async with client.stream(
+                "GET", target, headers=headers, extensions=extensions, follow_redirects=False
+            ) as response:
+                if response.is_redirect:
+                    current = urljoin(current, response.headers["location"])
+                    continue
+                response.raise_for_status()
+                if "html" not in response.headers.get("content-type", ""):
+                    return {}
+
+                parser_input = bytearray()
+                async for chunk in response.aiter_bytes():
+                    parser_input += chunk
+                    if len(parser_input) >= MAX_PAGE_BYTES or b"</head>" in parser_input.lower():
+                        break
+                encoding = response.encoding or "utf-8"
+                html = bytes(parser_input[:MAX_PAGE_BYTES]).decode(encoding, errors="replace")
+                return parse_metadata(html, current)
+        raise UnsafeUrl(f"Too many redirects: {url}")
+
+    return await asyncio.wait_for(fetch(), FETCH_TIMEOUT_SECONDS)
+
+
+def _load_cached(key: str) -> Optional[models.UrlMetadata]:
+    db = SessionLocal()
+    try:
+        row = db.get(models.UrlMetadata, key)
+        if row is not None:
+            db.expunge(row)
+        return row
+    finally:
+        db.close()
+
+
+def _store(key: str, normalized: str, metadata: Optional[dict]) -> models.UrlMetadata:
+    now = datetime.now(timezone.utc)
+    ttl = timedelta(hours=settings.LINK_PREVIEW_TTL_HOURS) if metadata is not None else FAILURE_TTL
+    row = models.UrlMetadata(
+        url_hash=key,
+        url=normalized,
+        status="ok" if metadata is not None else "failed",
+        fetched_at=now,
+        expires_at=now + ttl,
+        **(metadata or {}),
+    )
+    db = SessionLocal()
+    try:
+        row = db.merge(row)
+        db.commit()
+        db.refresh(row)
+        db.expunge(row)
+        return row
+    finally:
+        db.close()
+
+
+def _expired(row: models.UrlMetadata) -> bool:
+    expires_at = row.expires_at if row.expires_at.tzinfo else row.expires_at.replace(tzinfo=timezone.utc)
+    return expires_at <= datetime.now(timezone.utc)
+
+
+async def _fetch_and_store(key: str, normalized: str) -> models.UrlMetadata:
+    try:
+        metadata = await fetch_metadata(normalized)
+    except Exception as exc:
+        logger.info("Preview fetch failed for %s: %r", normalized, exc)
+        metadata = None
+    return await run_in_threadpool(_store, key, normalized, metadata)
+
+
+async def get_metadata(url: str) -> models.UrlMetadata:
+    """Cached metadata for a URL, fetching it (once per process at a time) when missing or stale"""
+    normalized = normalize_url(url)
+    key = url_hash(normalized)
+
+    cached = await run_in_threadpool(_load_cached, key)
+    if cached is not None and not _expired(cached):
+        return cached
+
+    task = _in_flight.get(key)
+    if task is None:
+        task = asyncio.create_task(_fetch_and_store(key, normalized))
+        _in_flight[key] = task
+        task.add_done_callback(lambda _: _in_flight.pop(key, None))
+    return await task
+
+
+def _apply(link_id: int, url: str, metadata: models.UrlMetadata):
+    db = SessionLocal()
+    try:
+        link = db.get(models.Link, link_id)
+        # The link may have been deleted or pointed elsewhere since the task was queued
+        if link is None or link.url != url:
+            return
+        if not link.description and metadata.description:
+            link.description = metadata.description[:1000]
+        if not link.thumbnail_url and metadata.image_url and len(metadata.image_url) <= 500:
+            link.thumbnail_url = metadata.image_url
+        search.index_user(db, link.user_id)
+        db.commit()
+        publish("link", link.user_id)
+    finally:
+        db.close()
+
+
+async def refresh_link_preview(link_id: int, url: str):
+    """Fill in a link's preview fields from its URL's metadata (background task)"""
+    metadata = await get_metadata(url)
+    if metadata.status == "ok":
+        await run_in_threadpool(_apply, link_id, url, metadata)
@@ -0,0 +1,190 @@
+"""
+Per route class concurrency limits, shedding low priority work under load.
+
+Requests are sorted into classes by method and path:
+- public:      profile pages, link lists and search anyone can load
+- clicks:      short link redirects, click and view counting
+- crud:        everything a logged-in user does to their own data
+- credentials: register, login and password flows, which spend most of
+               their time hashing passwords
+
+Each class has its own cap on requests in flight. A request over its class
+cap waits up to the class's queue timeout for a slot, then gets a 503 with
+Retry-After. Independently, once the whole worker has `shed_at` x
+MAX_IN_FLIGHT_REQUESTS requests in flight, classes with a `shed_at` are
+refused immediately, lowest priority first. Public reads have no `shed_at`:
+a burst of logins fills the credentials slots and then gets shed, while
+profile views keep their own capacity.
+
+A request gives its slot back once the last chunk of its response is sent;
+background tasks running after that don't count against the limits.
+
+Health checks, the admin endpoints, the docs and CORS preflights bypass the
+limits.
+"""
+import asyncio
+import json
+import re
+import time
+from collections import deque
+from dataclasses import dataclass, field
+from typing import Optional
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+from config import get_settings
+
+settings = get_settings()
+
+WAIT_SAMPLES = 1000
+
+# Limited requests in flight in this worker, all classes together
+_in_flight = 0
+
+
+@dataclass
+class RouteClass:
+    name: str
+    limit: int
+    # How long a request may wait for a slot of its class
+    queue_timeout: float
+    retry_after: int
+    # Refuse at once when the worker has this fraction of MAX_IN_FLIGHT_REQUESTS in flight
+    shed_at: Optional[float] = None
+    in_flight: int = 0
+    waiting: int = 0
+    admitted: int = 0
+    shed_queue_timeout: int = 0
+    shed_saturated: int = 0
+    waits_ms: deque = field(default_factory=lambda: deque(maxlen=WAIT_SAMPLES))
+
+    def __post_init__(self):
+        self._slots: Optional[asyncio.Semaphore] = None
+
+    @property
+    def slots(self) -> asyncio.Semaphore:
+        # Created lazily, inside the running event loop
+        if self._slots is None:
+            self._slots = asyncio.Semaphore(self.limit)
+        return self._slots
+
+    def stats(self) -> dict:
+        waits = sorted(self.waits_ms)
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": self.waiting,
+            "admitted": self.admitted,
+            "shed_queue_timeout": self.shed_queue_timeout,
+            "shed_saturated": self.shed_saturated,
+            "wait_ms_p99": round(waits[min(len(waits) - 1, int(0.99 * len(waits)))], 2) if waits else None,
+        }
+
+
+ROUTE_CLASSES = {
+    "public": RouteClass("public", limit=32, queue_timeout=2.0, retry_after=1),
+    "clicks": RouteClass("clicks", limit=16, queue_timeout=0.5, retry_after=1, shed_at=0.9),
+    "crud": RouteClass("crud", limit=16, queue_timeout=1.0, retry_after=2, shed_at=0.75),
+    "credentials": RouteClass("credentials", limit=4, queue_timeout=3.0, retry_after=5, shed_at=0.5),
+}
+
+# First match wins; None means not limited
+ROUTES = [
+    (None, re.compile(r"^/(health|docs|redoc|openapi\.json|admin/)")),
+    ("clicks", re.compile(r"^/r/")),
+    ("clicks", re.compile(r"^POST /links/\d+/click$")),
+    ("clicks", re.compile(r"^POST /users/username/[^/]+/view$")),
+    ("public", re.compile(r"^GET /users/username/")),
+    ("public", re.compile(r"^GET /links/user/")),
+    ("public", re.compile(r"^GET /search")),
+    ("credentials", re.compile(r"^POST /auth/(login|register|reset-password|forgot-password|resend-verification)$")),
+]
+
+
+def classify(method: str, path: str) -> Optional[RouteClass]:
+    if method == "OPTIONS":
+        return None
+    target = f"{method} {path}"
+    for name, pattern in ROUTES:
+        if pattern.match(path) or pattern.match(target):
+            return ROUTE_CLASSES[name] if name else None
+    return ROUTE_CLASSES["crud"]
+
+
+class ConcurrencyLimitMiddleware:
+    def __init__(self, app: ASGIApp, max_in_flight: int = settings.MAX_IN_FLIGHT_REQUESTS):
+        self.app = app
+        self.max_in_flight = max_in_flight
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send):
+        global _in_flight
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        route_class = classify(scope["method"], scope["path"])
+        if route_class is None:
+            await self.app(scope, receive, send)
+            return
+
+        if route_class.shed_at is not None and _in_flight >= route_class.shed_at * self.max_in_flight:
+            route_class.shed_saturated += 1
+            await self._refuse(send, route_class)
+            return
+
+        route_class.waiting += 1
+        started = time.perf_counter()
+        try:
+            await asyncio.wait_for(route_class.slots.acquire(), route_class.queue_timeout)
+        except asyncio.TimeoutError:
+            route_class.shed_queue_timeout += 1
+            await self._refuse(send, route_class)
+            return
+        finally:
+            route_class.waiting -= 1
+        route_class.waits_ms.append((time.perf_counter() - started) * 1000)
+
+        route_class.admitted += 1
+        route_class.in_flight += 1
+        _in_flight += 1
+        released = False
+
+        def release():
+            global _in_flight
+            nonlocal released
+            if not released:
+                released = True
+                _in_flight -= 1
+                route_class.in_flight -= 1
+                route_class.slots.release()
+
+        async def send_wrapper(message: Message):
+            await send(message)
+            # Background tasks run after the last chunk, still inside self.app;
+            # they don't hold the slot
+            if message["type"] == "http.response.body" and not message.get("more_body", False):
+                release()
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            release()
+
+    @staticmethod
+    async def _refuse(send: Send, route_class: RouteClass):
+        body = json.dumps({"detail": "Server is busy, please retry shortly"}).encode()
+        await send({
+            "type": "http.response.start",
+            "status": 503,
+            "headers": [
+                (b"content-type", b"application/json"),
+                (b"content-length", str(len(body)).encode()),
+                (b"retry-after", str(route_class.retry_after).encode()),
+            ],
+        })
+        await send({"type": "http.response.body", "body": body})
+
+
+def load_stats() -> dict:
+    return {
+        "in_flight": _in_flight,
+        "max_in_flight": settings.MAX_IN_FLIGHT_REQUESTS,
+        "classes": {name: route_class.stats() for name, route_class in ROUTE_CLASSES.items()},
+    }
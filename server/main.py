@@ -1,16 +1,86 @@
+import asyncio
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.responses import JSONResponse
 from fastapi.middleware.cors import CORSMiddleware
-from routers import auth_router, users_router, profiles_router, links_router
+from starlette.concurrency import run_in_threadpool
+from routers import auth_router, users_router, profiles_router, links_router, search_router, redirects_router, admin_router
 from config import get_settings
+from availability import rebuild_availability_index, sync_availability_index
+from pageviews import flush_page_views
+from refresh_sessions import sync_revocations
+from account_deletion import resume_pending_deletions
+from link_health import run_link_health_check
+from clients import close_http_client
+from clicks import flush_clicks
+from invalidation import bus, make_transport
+from scheduler import scheduler
+from load_shedding import ConcurrencyLimitMiddleware
+from threadpool import configure_threadpool, probe_threadpool, run_in_background_thread
+from profiling import continuous_sampler
+from access_log import AccessLogMiddleware, start_access_log, stop_access_log
+from token_cleanup import purge_expired_tokens
+from warmup import run_warmup, warmup_state
 
 settings = get_settings()
 
+def schedule_jobs():
+    # Per worker: each one flushes its own buffers and refreshes its own caches.
+    # Buffered views, clicks and revocations are retried on the next run if one fails.
+    scheduler.every(settings.PAGE_VIEW_FLUSH_SECONDS, "flush_page_views", flush_page_views, jitter=5)
+    scheduler.every(settings.CLICK_FLUSH_SECONDS, "flush_clicks", flush_clicks, jitter=2)
+    # The first run loads every revoked session family still able to refresh
+    scheduler.every(settings.SESSION_SYNC_SECONDS, "sync_revocations", sync_revocations, run_at_start=True)
+    scheduler.every(1, "probe_threadpool", probe_threadpool)
+    scheduler.every(settings.AVAILABILITY_SYNC_SECONDS, "sync_availability", sync_availability_index, jitter=1)
+    # Once per deployment
+    scheduler.every(settings.LINK_HEALTH_INTERVAL_SECONDS, "link_health", run_link_health_check,
+                    jitter=60, leader_only=True, run_at_start=True)
+    # Account purges cut short by a shutdown or a failed background task
+    scheduler.every(3600, "resume_deletions", resume_pending_deletions, leader_only=True, run_at_start=True)
+    scheduler.cron(settings.TOKEN_CLEANUP_CRON, "purge_expired_tokens", purge_expired_tokens, leader_only=True)
+
+schedule_jobs()
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    start_access_log()
+    # No more threads than database connections, unless THREADPOOL_SIZE says otherwise;
+    # exports, sync jobs and the startup builds below get BACKGROUND_THREADS of their own
+    configure_threadpool()
+    # Evict cached entries when other workers change the data behind them
+    bus.start(make_transport())
+    # Build the signup availability index without delaying startup;
+    # until it is ready the validation endpoints query the database
+    index_build = asyncio.create_task(run_in_background_thread(rebuild_availability_index))
+    await scheduler.start()
+    if settings.PROFILER_CONTINUOUS_HZ:
+        continuous_sampler.set_rate(settings.PROFILER_CONTINUOUS_HZ)
+    # Requests are served meanwhile; /health reports ready once it is done
+    warmup = asyncio.create_task(run_in_background_thread(run_warmup))
+    yield
+    continuous_sampler.stop()
+    warmup.cancel()
+    index_build.cancel()
+    # Lets running jobs finish first
+    await scheduler.stop()
+    bus.stop()
+    # Don't lose the views and clicks counted since the last flush
+    await run_in_threadpool(flush_page_views)
+    await run_in_threadpool(flush_clicks)
+    await close_http_client()
+    stop_access_log()
+
 app = FastAPI(
     title="Linktree Clone API",
     description="A Linktree clone with authentication and link management",
-    version="1.0.0"
+    version="1.0.0",
+    lifespan=lifespan
 )
 
+# Per route class concurrency limits; added first so that CORS wraps its 503s
+app.add_middleware(ConcurrencyLimitMiddleware)
+
 # CORS middleware
 app.add_middleware(
     CORSMiddleware,
@@ -20,11 +90,17 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Outermost, so that shed requests and CORS preflights are logged too
+app.add_middleware(AccessLogMiddleware)
+
 # Include routers
 app.include_router(auth_router)
 app.include_router(users_router)
 app.include_router(profiles_router)
 app.include_router(links_router)
+app.include_router(search_router)
+app.include_router(redirects_router)
+app.include_router(admin_router)
 
 @app.get("/")
 def read_root():
@@ -36,4 +112,7 @@ def read_root():
 
 @app.get("/health")
 def health_check():
-    return {"status": "healthy"}
\ No newline at end of file
+    # Not ready until the startup warm-up has filled the pool and caches
+    if not warmup_state.ready:
+        return JSONResponse({"status": "warming_up"}, status_code=503)
+    return {"status": "healthy", "warmup": warmup_state.stats()}
\ No newline at end of file
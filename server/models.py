@@ -1,4 +1,4 @@
-from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime,Enum
+from sqlalchemy import Boolean, Column, Integer, String, Text, ForeignKey, DateTime,Enum, Index, DDL, event, Date, LargeBinary
 from sqlalchemy.orm import relationship
 from sqlalchemy.sql import func
 from database import Base
@@ -40,12 +40,34 @@ class User(Base):
     is_verified = Column(Boolean, default=False)
     last_password_reset_sent_at = Column(DateTime(timezone=True), nullable=True)
     verified_at = Column(DateTime(timezone=True), nullable=True)
+    # Set when the account is deleted; the rows go once account_deletion.purge_user has run
+    deleted_at = Column(DateTime(timezone=True), nullable=True, index=True)
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
-    profile = relationship("Profile", back_populates="user", uselist=False, cascade="all, delete-orphan")
-    links = relationship("Link", back_populates="user", cascade="all, delete-orphan")
+    # passive_deletes: deleting a user leaves the children to ON DELETE CASCADE instead of loading them
+    profile = relationship("Profile", back_populates="user", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+    links = relationship("Link", back_populates="user", cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        # Usernames are case-insensitive; lookups filter on lower(username) to use this index
+        Index("ix_users_username_lower", func.lower(username), unique=True),
+    )
+
+
+# Full-text search documents (see search.py). Postgres keeps a tsvector column on
+# users with a GIN index, SQLite an FTS5 table keyed by user id. They aren't mapped
+# columns because only raw search SQL reads them.
+event.listen(User.__table__, "after_create", DDL(
+    "ALTER TABLE users ADD COLUMN search_vector tsvector"
+).execute_if(dialect="postgresql"))
+event.listen(User.__table__, "after_create", DDL(
+    "CREATE INDEX ix_users_search_vector ON users USING gin (search_vector)"
+).execute_if(dialect="postgresql"))
+event.listen(User.__table__, "after_create", DDL(
+    "CREATE VIRTUAL TABLE IF NOT EXISTS user_search USING fts5(username, full_name, bio, links)"
+).execute_if(dialect="sqlite"))
 
 
 class Profile(Base):
@@ -89,13 +111,35 @@ class Link(Base):
     
     # Display settings
     position = Column(Integer, default=0, index=True)
+    # Fractional ordering key (see ordering.py); compared bytewise, hence the "C" collation
+    sort_key = Column(String(64).with_variant(String(64, collation="C"), "postgresql"), nullable=False)
     is_active = Column(Boolean, default=True)
+
+    # Last result of the link health checker (see link_health.py)
+    health_status = Column(String(20), nullable=True)
+    health_status_code = Column(Integer, nullable=True)
+    health_checked_at = Column(DateTime(timezone=True), nullable=True)
     
     created_at = Column(DateTime(timezone=True), server_default=func.now())
     updated_at = Column(DateTime(timezone=True), onupdate=func.now())
 
     # Relationships
     user = relationship("User", back_populates="links")
+    stats = relationship("LinkStats", uselist=False, cascade="all, delete-orphan", passive_deletes=True)
+
+    __table_args__ = (
+        Index("ix_links_user_id_sort_key", "user_id", "sort_key"),
+        # Health results are written to every link sharing a URL; urls are too long for a btree
+        Index("ix_links_url", "url", postgresql_using="hash"),
+    )
+
+class LinkStats(Base):
+    """Click counters, kept out of `links` so counting a click doesn't rewrite the link row"""
+    __tablename__ = "link_stats"
+
+    link_id = Column(Integer, ForeignKey("links.id", ondelete="CASCADE"), primary_key=True)
+    click_count = Column(Integer, default=0, nullable=False)
+    last_clicked_at = Column(DateTime(timezone=True), nullable=True)
 
 class EmailVerificationToken(Base):
     __tablename__ = "email_verification_tokens"
@@ -128,4 +172,61 @@ class EmailPasswordResetToken(Base):
     expires_at = Column(DateTime(timezone=True), nullable=False)
     used = Column(Boolean, default=False)
 
-    user = relationship("User")
\ No newline at end of file
+    user = relationship("User")
+
+class RefreshSession(Base):
+    """A login's refresh token family; see refresh_sessions.py"""
+    __tablename__ = "sessions"
+
+    id = Column(Integer, primary_key=True, index=True)
+    family_id = Column(String(36), unique=True, index=True, nullable=False)
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), nullable=False, index=True)
+    current_jti = Column(String(36), nullable=False)
+    previous_jti = Column(String(36), nullable=True)
+    expires_at = Column(DateTime(timezone=True), nullable=False)
+    revoked_at = Column(DateTime(timezone=True), nullable=True, index=True)
+    revoked_reason = Column(String(20), nullable=True)
+    last_used_at = Column(DateTime(timezone=True), nullable=True)
+    created_at = Column(DateTime(timezone=True), server_default=func.now())
+
+    user = relationship("User")
+
+class ProfileViewSketch(Base):
+    """Unique visitors of one profile on one day, as a zlib-compressed HyperLogLog sketch (see pageviews.py)"""
+    __tablename__ = "profile_view_sketches"
+
+    user_id = Column(Integer, ForeignKey("users.id", ondelete="CASCADE"), primary_key=True)
+    day = Column(Date, primary_key=True)
+    sketch = Column(LargeBinary, nullable=False)
+    # Estimate at the last flush, so reports and rankings don't have to decode sketches
+    unique_visitors = Column(Integer, nullable=False, default=0)
+    updated_at = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
+
+class UrlMetadata(Base):
+    """Open Graph / title metadata of a normalized URL, shared by every link to it (see link_preview.py)"""
+    __tablename__ = "url_metadata"
+
+    # sha256 of the normalized URL
+    url_hash = Column(String(64), primary_key=True)
+    url = Column(String(2000), nullable=False)
+    status = Column(String(20), nullable=False)
+    title = Column(Text, nullable=True)
+    description = Column(Text, nullable=True)
+    image_url = Column(Text, nullable=True)
+    site_name = Column(Text, nullable=True)
+    fetched_at = Column(DateTime(timezone=True), nullable=False)
+    expires_at = Column(DateTime(timezone=True), nullable=False, index=True)
+
+class UrlCheck(Base):
+    """Last health check of a URL, shared by every link pointing at it (see link_health.py)"""
+    __tablename__ = "url_checks"
+
+    # sha256 of the URL
+    url_hash = Column(String(64), primary_key=True)
+    url = Column(String(2000), nullable=False)
+    status = Column(String(20), nullable=False)
+    status_code = Column(Integer, nullable=True)
+    # Validators for conditional requests on the next check
+    etag = Column(String(500), nullable=True)
+    last_modified = Column(String(100), nullable=True)
+    checked_at = Column(DateTime(timezone=True), nullable=False, index=True)
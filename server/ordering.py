@@ -0,0 +1,110 @@
+"""
+Fractional ordering keys for links.
+
+`Link.sort_key` is a string of base-62 digits read as a fraction (0.d1d2d3...),
+compared bytewise. There is always a key between any two keys, so moving a
+link only rewrites that link's key. Keys grow by roughly one character per
+~6 inserts into the same gap; once a key gets longer than MAX_KEY_LENGTH the
+user's links are respaced in the background by `rebalance_links`.
+
+Keys never end in the zero digit, which guarantees there is room below them.
+"""
+from typing import Optional
+from sqlalchemy import update
+from database import SessionLocal
+from invalidation import publish
+import models
+
+DIGITS = "0123456789ABCDEFGHIJKLMNOPQRSTUVWXYZabcdefghijklmnopqrstuvwxyz"
+BASE = len(DIGITS)
+MAX_KEY_LENGTH = 24
+
+
+def _midpoint(low: str, high: Optional[str]) -> str:
+    """Key strictly between `low` ("" = 0) and `high` (None = 1)"""
+    if high is not None:
+        # Keep the common prefix (low is padded with zero digits)
+        n = 0
+        while n < len(high) and (low[n] if n < len(low) else DIGITS[0]) == high[n]:
+            n += 1
+        if n:
+            return high[:n] + _midpoint(low[n:], high[n:])
+
+    digit_low = DIGITS.index(low[0]) if low else 0
+    digit_high = DIGITS.index(high[0]) if high is not None else BASE
+    if digit_high - digit_low > 1:
+        return DIGITS[(digit_low + digit_high) // 2]
+
+    # The first digits are adjacent: a shorter key may still fit, otherwise go one digit deeper
+    if high is not None and len(high) > 1:
+        return high[:1]
+    return DIGITS[digit_low] + _midpoint(low[1:], None)
+
+
+def key_between(before: Optional[str], after: Optional[str]) -> str:
+    """
+    Key that sorts after `before` and before `after`.
+    Pass None for `before` to insert at the start, None for `after` to append.
+    """
+    # Trailing zero digits don't change a key's value: "a" and "a0" are equal
+    if before is not None and after is not None and before.rstrip(DIGITS[0]) >= after.rstrip(DIGITS[0]):
+        raise ValueError(f"{before!r} must sort before {after!r}")
+
+    if before is not None and after is None:
+        # Appending is the common case: bump the last digit so keys grow
+        # by one character per ~60 appends instead of halving the gap each time
+        last = DIGITS.index(before[-1])
+        if last < BASE - 1:
+            return before[:-1] + DIGITS[last + 1]
+        return before + DIGITS[1]
+
+    return _midpoint(before or "", after)
+
+
+def _spread_width(count: int) -> int:
+    width = 1
+    while BASE ** width < (count + 1) * BASE:
+        width += 1
+    return width
+
+
+def spread_key(index: int, count: int) -> str:
+    """The `index`-th (0-based) of `spread_keys(count)`, without building the others"""
+    width = _spread_width(count)
+    value = (index + 1) * BASE ** width // (count + 1)
+    digits = []
+    for _ in range(width):
+        value, digit = divmod(value, BASE)
+        digits.append(DIGITS[digit])
+    return "".join(reversed(digits)).rstrip(DIGITS[0])
+
+
+def spread_keys(count: int) -> list[str]:
+    """`count` ascending keys spaced evenly, with room to insert between neighbours"""
+    return [spread_key(i, count) for i in range(count)]
+
+
+def needs_rebalance(key: str) -> bool:
+    return len(key) > MAX_KEY_LENGTH
+
+
+def rebalance_links(user_id: int):
+    """Respace a user's link keys, keeping their order (background task)"""
+    db = SessionLocal()
+    try:
+        rows = (
+            db.query(models.Link.id)
+            .filter(models.Link.user_id == user_id)
+            .order_by(models.Link.sort_key, models.Link.id)
+            .with_for_update()
+            .all()
+        )
+        keys = spread_keys(len(rows))
+        db.execute(
+            update(models.Link),
+            [{"id": row.id, "sort_key": key} for row, key in zip(rows, keys)],
+        )
+        db.commit()
+        publish("link", user_id)
+    finally:
+        db.close()
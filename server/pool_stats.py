@@ -0,0 +1,93 @@
+"""
+How long each route keeps a pooled database connection.
+
+Every checkout is stamped with the time and the route being served
+(`database.current_route`); at checkin the hold time is added to that route's
+stats. Work outside a request (background tasks, the periodic jobs) is
+reported as "(background)". With pool_size + max_overflow connections per
+worker, the sum of hold times is what limits concurrency, so a route that
+holds connections long shows up here before it shows up as pool timeouts.
+
+Imported once at startup to install the pool listeners.
+"""
+import threading
+import time
+from collections import deque
+from sqlalchemy import event
+from database import current_route, engine
+
+SAMPLES_PER_ROUTE = 1000
+
+
+class RouteHoldStats:
+    def __init__(self):
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.recent_ms: deque[float] = deque(maxlen=SAMPLES_PER_ROUTE)
+
+    def record(self, ms: float):
+        self.count += 1
+        self.total_ms += ms
+        self.max_ms = max(self.max_ms, ms)
+        self.recent_ms.append(ms)
+
+    def summary(self) -> dict:
+        recent = sorted(self.recent_ms)
+        def percentile(p):
+            return round(recent[min(len(recent) - 1, int(p * len(recent)))], 2) if recent else None
+        return {
+            "checkouts": self.count,
+            "total_ms": round(self.total_ms, 1),
+            "mean_ms": round(self.total_ms / self.count, 2) if self.count else None,
+            "p50_ms": percentile(0.5),
+            "p99_ms": percentile(0.99),
+            "max_ms": round(self.max_ms, 2),
+        }
+
+
+_lock = threading.Lock()
+_routes: dict[str, RouteHoldStats] = {}
+
+
+@event.listens_for(engine, "checkout")
+def _on_checkout(dbapi_connection, connection_record, connection_proxy):
+    connection_record.info["held_since"] = (time.perf_counter(), current_route.get())
+
+
+@event.listens_for(engine, "checkin")
+def _on_checkin(dbapi_connection, connection_record):
+    held = connection_record.info.pop("held_since", None)
+    if held is None:
+        return
+    started, route = held
+    ms = (time.perf_counter() - started) * 1000
+    with _lock:
+        stats = _routes.get(route)
+        if stats is None:
+            stats = _routes[route] = RouteHoldStats()
+        stats.record(ms)
+
+
+def pool_status() -> dict:
+    pool = engine.pool
+    status = {"class": type(pool).__name__}
+    # QueuePool counters; other pool classes don't have them all
+    for name in ("size", "checkedin", "checkedout", "overflow"):
+        counter = getattr(pool, name, None)
+        if counter is not None:
+            status[name] = counter()
+    status["max_overflow"] = getattr(pool, "_max_overflow", None)
+    return status
+
+
+def route_hold_stats() -> dict:
+    """Per route hold time stats, longest total hold first"""
+    with _lock:
+        summaries = {route: stats.summary() for route, stats in _routes.items()}
+    return dict(sorted(summaries.items(), key=lambda item: item[1]["total_ms"], reverse=True))
+
+
+def reset():
+    with _lock:
+        _routes.clear()
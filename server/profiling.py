@@ -0,0 +1,308 @@
+"""
+Sampling profiler for live requests.
+
+Per request: a request is profiled when it carries a valid X-Profile-Token
+header (minted by POST /admin/profiler/token, signed with SECRET_KEY and
+expiring), or when its route has been armed for the next N requests from
+the admin API. While the request runs, a sampler thread records the stack of
+the thread working on it every SAMPLE_INTERVAL seconds. The result is saved
+in collapsed-stack format (one "frame;frame;frame count" line per stack,
+which speedscope and flamegraph.pl open directly) to PROFILE_DIR. Only the
+newest PROFILE_RING_SIZE files are kept.
+
+Continuous: with a nonzero rate (PROFILER_CONTINUOUS_HZ, or set from the
+admin API), one sampler thread samples every busy request thread at that
+rate and adds its stack to the route's totals. Hot stacks per route are
+read back from the admin API.
+
+Routes opt in with `route_class=ProfiledRoute`. Sync endpoints are wrapped
+to record which thread serves which route; that is all the work done when
+profiling is off. Time spent in dependencies (e.g. authentication) is not
+attributed. Async endpoints share the event loop thread with every other
+request, so continuous mode skips them and a profile of one also shows
+whatever else the loop ran meanwhile.
+"""
+import functools
+import hashlib
+import hmac
+import inspect
+import os
+import re
+import sys
+import tempfile
+import threading
+import time
+from collections import Counter
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from typing import Optional
+from fastapi import Request
+from starlette.concurrency import run_in_threadpool
+from config import get_settings
+from database import DBRoute
+
+settings = get_settings()
+
+PROFILE_TOKEN_HEADER = "x-profile-token"
+PROFILE_DIR = os.path.join(tempfile.gettempdir(), "linktree-profiles")
+PROFILE_RING_SIZE = 50
+SAMPLE_INTERVAL = 0.005
+MAX_STACK_DEPTH = 128
+# Distinct stacks kept per route in continuous mode; the rest are counted as "(other)"
+MAX_STACKS_PER_ROUTE = 5000
+
+
+class RequestProfile:
+    def __init__(self, route: str, loop_thread: Optional[int]):
+        self.route = route
+        # Async endpoints run on the event loop thread
+        self.loop_thread = loop_thread
+        self.stacks: Counter[str] = Counter()
+        self.samples = 0
+        self.started = time.perf_counter()
+        self.duration_ms = 0.0
+        self._done = threading.Event()
+        self._thread = threading.Thread(target=self._sample, name="request-profiler", daemon=True)
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self.duration_ms = (time.perf_counter() - self.started) * 1000
+        self._done.set()
+        self._thread.join()
+
+    def _sample(self):
+        while not self._done.wait(SAMPLE_INTERVAL):
+            frames = sys._current_frames()
+            thread_ids = [tid for tid, (_, profile) in list(_thread_work.items()) if profile is self]
+            if self.loop_thread is not None:
+                thread_ids.append(self.loop_thread)
+            for tid in thread_ids:
+                frame = frames.get(tid)
+                if frame is not None:
+                    self.stacks[collapse(frame)] += 1
+                    self.samples += 1
+
+    def save(self) -> str:
+        os.makedirs(PROFILE_DIR, exist_ok=True)
+        stamp = datetime.now(timezone.utc).strftime("%Y%m%dT%H%M%S%f")
+        slug = re.sub(r"[^A-Za-z0-9]+", "_", self.route).strip("_") or "root"
+        path = os.path.join(PROFILE_DIR, f"{stamp}-{slug}-{self.duration_ms:.0f}ms.collapsed")
+        with open(path, "w") as out:
+            out.write(to_collapsed(self.stacks))
+        _trim_ring()
+        return path
+
+
+# Thread id -> (route, profile) for threads running a sync endpoint
+_thread_work: dict[int, tuple[str, Optional[RequestProfile]]] = {}
+_current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+# Route path -> number of upcoming requests to profile
+_armed_routes: dict[str, int] = {}
+_armed_lock = threading.Lock()
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    filename = code.co_filename
+    marker = f"{os.sep}site-packages{os.sep}"
+    if marker in filename:
+        filename = filename.split(marker, 1)[1]
+    else:
+        filename = os.path.basename(filename)
+    return f"{code.co_name} ({filename}:{code.co_firstlineno})"
+
+
+def collapse(frame) -> str:
+    """A thread's stack as "root;...;leaf\""""
+    names = []
+    while frame is not None and len(names) < MAX_STACK_DEPTH:
+        names.append(_frame_name(frame))
+        frame = frame.f_back
+    return ";".join(reversed(names))
+
+
+def to_collapsed(stacks: Counter) -> str:
+    return "".join(f"{stack} {count}\n" for stack, count in stacks.most_common())
+
+
+def _trim_ring():
+    files = sorted(name for name in os.listdir(PROFILE_DIR) if name.endswith(".collapsed"))
+    for name in files[:-PROFILE_RING_SIZE]:
+        try:
+            os.remove(os.path.join(PROFILE_DIR, name))
+        except FileNotFoundError:
+            pass
+
+
+def saved_profiles() -> list[dict]:
+    if not os.path.isdir(PROFILE_DIR):
+        return []
+    files = sorted((name for name in os.listdir(PROFILE_DIR) if name.endswith(".collapsed")), reverse=True)
+    return [{"name": name, "bytes": os.path.getsize(os.path.join(PROFILE_DIR, name))} for name in files]
+
+
+def profile_path(name: str) -> Optional[str]:
+    if os.path.basename(name) != name or not name.endswith(".collapsed"):
+        return None
+    path = os.path.join(PROFILE_DIR, name)
+    return path if os.path.isfile(path) else None
+
+
+# ---- Activation ----
+
+def _sign(expires: int) -> str:
+    return hmac.new(settings.SECRET_KEY.encode(), f"profile:{expires}".encode(), hashlib.sha256).hexdigest()
+
+
+def make_profile_token(ttl_seconds: int) -> str:
+    expires = int(time.time()) + ttl_seconds
+    return f"{expires}.{_sign(expires)}"
+
+
+def _valid_token(token: str) -> bool:
+    expires, _, signature = token.partition(".")
+    if not expires.isdigit() or int(expires) < time.time():
+        return False
+    return hmac.compare_digest(signature, _sign(int(expires)))
+
+
+def arm_route(route: str, requests: int):
+    with _armed_lock:
+        if requests > 0:
+            _armed_routes[route] = requests
+        else:
+            _armed_routes.pop(route, None)
+
+
+def armed_routes() -> dict[str, int]:
+    return dict(_armed_routes)
+
+
+def _take_armed(route: str) -> bool:
+    with _armed_lock:
+        remaining = _armed_routes.get(route)
+        if not remaining:
+            return False
+        if remaining == 1:
+            del _armed_routes[route]
+        else:
+            _armed_routes[route] = remaining - 1
+        return True
+
+
+def _should_profile(request: Request, route: str) -> bool:
+    token = request.headers.get(PROFILE_TOKEN_HEADER)
+    if token is not None and _valid_token(token):
+        return True
+    return bool(_armed_routes) and _take_armed(route)
+
+
+def _track_thread(endpoint, route: str):
+    @functools.wraps(endpoint)
+    def run(*args, **kwargs):
+        tid = threading.get_ident()
+        _thread_work[tid] = (route, _current_profile.get())
+        try:
+            return endpoint(*args, **kwargs)
+        finally:
+            _thread_work.pop(tid, None)
+    run.tracks_thread = True
+    return run
+
+
+class ProfiledRoute(DBRoute):
+    """DBRoute whose requests can be sampled (see the module docstring)"""
+    def __init__(self, path: str, endpoint, **kwargs):
+        self.is_async_endpoint = inspect.iscoroutinefunction(endpoint)
+        # include_router builds every route a second time from the wrapped endpoint
+        if not self.is_async_endpoint and not getattr(endpoint, "tracks_thread", False):
+            endpoint = _track_thread(endpoint, path)
+        super().__init__(path, endpoint, **kwargs)
+
+    def get_route_handler(self):
+        handler = super().get_route_handler()
+        path = self.path
+        is_async = self.is_async_endpoint
+
+        async def route_handler(request: Request):
+            if not _should_profile(request, path):
+                return await handler(request)
+
+            profile = RequestProfile(path, threading.get_ident() if is_async else None)
+            token = _current_profile.set(profile)
+            profile.start()
+            try:
+                response = await handler(request)
+            finally:
+                _current_profile.reset(token)
+                profile.stop()
+            saved = await run_in_threadpool(profile.save)
+            response.headers["X-Profile"] = os.path.basename(saved)
+            return response
+
+        return route_handler
+
+
+# ---- Continuous sampling ----
+
+class ContinuousSampler:
+    def __init__(self):
+        self.hz = 0.0
+        self.samples = 0
+        self.stacks: dict[str, Counter[str]] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def set_rate(self, hz: float):
+        """Sample at `hz` per second; 0 stops the sampler thread"""
+        self.stop()
+        self.hz = hz
+        if hz > 0:
+            self._stop = threading.Event()
+            self._thread = threading.Thread(target=self._run, name="continuous-profiler", daemon=True)
+            self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def _run(self):
+        interval = 1 / self.hz
+        while not self._stop.wait(interval):
+            frames = sys._current_frames()
+            with self._lock:
+                for tid, (route, _) in list(_thread_work.items()):
+                    frame = frames.get(tid)
+                    if frame is None:
+                        continue
+                    stacks = self.stacks.setdefault(route, Counter())
+                    stack = collapse(frame)
+                    if stack not in stacks and len(stacks) >= MAX_STACKS_PER_ROUTE:
+                        stack = "(other)"
+                    stacks[stack] += 1
+                    self.samples += 1
+
+    def hot_stacks(self, route: Optional[str] = None, limit: int = 20) -> dict:
+        with self._lock:
+            routes = {route: self.stacks.get(route, Counter())} if route else dict(self.stacks)
+            return {
+                name: {"samples": sum(stacks.values()), "top": stacks.most_common(limit)}
+                for name, stacks in routes.items()
+            }
+
+    def collapsed(self, route: str) -> str:
+        with self._lock:
+            return to_collapsed(self.stacks.get(route, Counter()))
+
+    def reset(self):
+        with self._lock:
+            self.stacks.clear()
+            self.samples = 0
+
+
+continuous_sampler = ContinuousSampler()
@@ -0,0 +1,207 @@
+"""
+Cache of the public profile payloads, stored precompressed.
+
+GET /users/username/{username} and GET /links/user/{username} are the pages
+every visitor loads. Their JSON is cached per username together with its
+gzip and brotli encodings, built once per content version at the highest
+compression levels (an install without the `brotli` package serves gzip
+only). Each request then only picks an encoding from Accept-Encoding and
+sends stored bytes, with `Vary: Accept-Encoding` and an ETag for
+conditional requests.
+
+Entries are dropped through the invalidation bus whenever the user's links,
+profile or account change, in every worker. A payload read from the database
+before the latest invalidation of its user is served but not stored.
+"""
+import gzip
+import hashlib
+import threading
+from collections import OrderedDict
+from typing import Callable, NamedTuple, Optional
+from fastapi import Request, Response
+from access_log import note_cache
+from config import get_settings
+from invalidation import ENTITIES, bus, now_ns
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+settings = get_settings()
+
+# Not worth compressing below this size
+MIN_COMPRESS_BYTES = 256
+# Preferred first when the client accepts several with the same quality
+ENCODING_PREFERENCE = ("br", "gzip", "identity")
+
+
+class CachedPayload(NamedTuple):
+    user_id: int
+    etag: str
+    # encoding -> body; "identity" is always present
+    bodies: dict[str, bytes]
+
+
+def compress(body: bytes) -> dict[str, bytes]:
+    bodies = {"identity": body}
+    if len(body) < MIN_COMPRESS_BYTES:
+        return bodies
+    gzipped = gzip.compress(body, compresslevel=9, mtime=0)
+    if len(gzipped) < len(body):
+        bodies["gzip"] = gzipped
+    if brotli is not None:
+        compressed = brotli.compress(body, quality=11)
+        if len(compressed) < len(body):
+            bodies["br"] = compressed
+    return bodies
+
+
+def parse_accept_encoding(header: str) -> dict[str, float]:
+    """{coding: q} from an Accept-Encoding header"""
+    accepted = {}
+    for item in header.split(","):
+        coding, _, params = item.strip().partition(";")
+        coding = coding.strip().lower()
+        if not coding:
+            continue
+        q = 1.0
+        params = params.strip()
+        if params.startswith("q="):
+            try:
+                q = float(params[2:])
+            except ValueError:
+                q = 0.0
+        accepted[coding] = q
+    return accepted
+
+
+def choose_encoding(header: Optional[str], available) -> str:
+    if not header:
+        return "identity"
+    accepted = parse_accept_encoding(header)
+    wildcard = accepted.get("*")
+
+    def quality(coding):
+        if coding in accepted:
+            return accepted[coding]
+        if wildcard is not None:
+            return wildcard
+        # identity is acceptable unless excluded, but only as the last resort
+        return 0.001 if coding == "identity" else 0.0
+
+    candidates = [coding for coding in ENCODING_PREFERENCE if coding in available and quality(coding) > 0]
+    if not candidates:
+        return "identity"
+    return max(candidates, key=lambda coding: (quality(coding), -ENCODING_PREFERENCE.index(coding)))
+
+
+class PublicPayloadCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._entries: OrderedDict[tuple[str, str], CachedPayload] = OrderedDict()
+        self._by_user: dict[int, set[tuple[str, str]]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_fills = 0
+
+    def get(self, key: tuple[str, str]) -> Optional[CachedPayload]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+        return entry
+
+    def put(self, key: tuple[str, str], entry: CachedPayload, read_at: int):
+        """Store an entry built from data read at `read_at` (`now_ns()`), unless invalidated since"""
+        with self._lock:
+            # Checked under the lock: an invalidation landing later waits for it and evicts the entry
+            if any(bus.version(entity, entry.user_id) >= read_at for entity in ENTITIES):
+                self.stale_fills += 1
+                return
+            self._entries[key] = entry
+            self._entries.move_to_end(key)
+            self._by_user.setdefault(entry.user_id, set()).add(key)
+            while len(self._entries) > self.maxsize:
+                old_key, old = self._entries.popitem(last=False)
+                self._forget(old_key, old.user_id)
+
+    def _forget(self, key: tuple[str, str], user_id: int):
+        keys = self._by_user.get(user_id)
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[user_id]
+
+    def invalidate_user(self, user_id: int):
+        with self._lock:
+            for key in self._by_user.pop(user_id, ()):
+                self._entries.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._by_user.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._entries),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_fills": self.stale_fills,
+            "brotli": brotli is not None,
+        }
+
+
+public_cache = PublicPayloadCache(settings.PUBLIC_CACHE_SIZE)
+
+for _entity in ENTITIES:
+    bus.subscribe(_entity, lambda message: public_cache.invalidate_user(message.user_id))
+bus.on_reset(public_cache.clear)
+
+
+def _fill(key: tuple[str, str], build: Callable[[], tuple[int, bytes]]) -> CachedPayload:
+    # Taken before build() reads the database
+    read_at = now_ns()
+    user_id, body = build()
+    entry = CachedPayload(user_id, f'W/"{hashlib.sha256(body).hexdigest()[:32]}"', compress(body))
+    public_cache.put(key, entry, read_at)
+    return entry
+
+
+def preload(kind: str, username: str, build: Callable[[], tuple[int, bytes]]):
+    """Build and store the `kind` payload of `username` ahead of its first request"""
+    _fill((kind, username.lower()), build)
+
+
+def cached_json_response(
+    request: Request,
+    kind: str,
+    username: str,
+    build: Callable[[], tuple[int, bytes]],
+) -> Response:
+    """
+    Serve the `kind` payload of `username` from the cache, filling it with
+    `build()` -> (user_id, JSON body) on a miss. Errors raised by `build`
+    (404, private profile) pass through uncached.
+    """
+    key = (kind, username.lower())
+    entry = public_cache.get(key)
+    note_cache("public", entry is not None)
+    if entry is None:
+        entry = _fill(key, build)
+
+    headers = {"ETag": entry.etag, "Vary": "Accept-Encoding", "Cache-Control": "no-cache"}
+    if entry.etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    encoding = choose_encoding(request.headers.get("accept-encoding"), entry.bodies)
+    if encoding != "identity":
+        headers["Content-Encoding"] = encoding
+    return Response(entry.bodies[encoding], media_type="application/json", headers=headers)
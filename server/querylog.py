@@ -0,0 +1,188 @@
+"""
+Slow query log.
+
+Engine hooks time every statement. Each one is folded into per-shape stats
+(SQL normalized: literals and bind parameters become `?`, IN lists collapse
+to one `?`, whitespace is squeezed). Statements slower than SLOW_QUERY_MS
+are also logged, with their route and the first call site in our own code
+(e.g. `routers/links.py:reorder_links`). Parameter values are never logged,
+only their names.
+
+Stats cover a rolling window: the current WINDOW_SECONDS plus the previous
+one. `query_stats.top` returns the heaviest shapes for the admin API.
+
+Imported once at startup to install the engine listeners.
+"""
+import logging
+import os
+import re
+import sys
+import threading
+import time
+from functools import lru_cache
+from sqlalchemy import event
+from access_log import note_query
+from config import get_settings
+from database import current_route, engine
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+WINDOW_SECONDS = 15 * 60
+# Distinct statement shapes tracked per window; new shapes beyond it are dropped
+MAX_SHAPES = 1000
+MAX_SQL_LENGTH = 2000
+
+SERVER_DIR = os.path.dirname(os.path.abspath(__file__))
+# Frames from these files are skipped when looking for the call site
+_OWN_FILES = {os.path.join(SERVER_DIR, name) for name in ("querylog.py", "database.py")}
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r"(?<![\w.])-?\d+(?:\.\d+)?\b")
+_BIND = re.compile(r"%\(\w+\)s|%s|\?|\$\d+")
+_IN_LIST = re.compile(r"\bIN \((?:\?\s*,\s*)*\?\)", re.IGNORECASE)
+_SPACE = re.compile(r"\s+")
+
+
+# SQLAlchemy reuses compiled statements, so most strings repeat
+@lru_cache(maxsize=4096)
+def normalize_sql(statement: str) -> str:
+    sql = _STRING.sub("?", statement)
+    sql = _BIND.sub("?", sql)
+    sql = _NUMBER.sub("?", sql)
+    sql = _SPACE.sub(" ", sql).strip()
+    sql = _IN_LIST.sub("IN (?)", sql)
+    return sql[:MAX_SQL_LENGTH]
+
+
+def call_site() -> str:
+    """First frame in this app's code outside the database layer, as "path:function\""""
+    frame = sys._getframe(1)
+    while frame is not None:
+        filename = frame.f_code.co_filename
+        if filename.startswith(SERVER_DIR) and filename not in _OWN_FILES and "site-packages" not in filename:
+            return f"{os.path.relpath(filename, SERVER_DIR)}:{frame.f_code.co_name}"
+        frame = frame.f_back
+    return "(unknown)"
+
+
+def redacted_params(parameters) -> str:
+    if isinstance(parameters, (list, tuple)) and parameters and isinstance(parameters[0], (dict, list, tuple)):
+        return f"<{len(parameters)} rows>"
+    if isinstance(parameters, dict):
+        return "{" + ", ".join(f"{name}=?" for name in parameters) + "}"
+    if isinstance(parameters, (list, tuple)):
+        return f"<{len(parameters)} values>"
+    return "<none>"
+
+
+class ShapeStats:
+    __slots__ = ("sql", "count", "total_ms", "max_ms", "slow", "route", "call_site")
+
+    def __init__(self, sql: str):
+        self.sql = sql
+        self.count = 0
+        self.total_ms = 0.0
+        self.max_ms = 0.0
+        self.slow = 0
+        self.route = None
+        self.call_site = None
+
+
+class QueryStats:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._window_started = time.monotonic()
+        self._current: dict[str, ShapeStats] = {}
+        self._previous: dict[str, ShapeStats] = {}
+        self.dropped = 0
+
+    def _rotate(self):
+        now = time.monotonic()
+        if now - self._window_started >= WINDOW_SECONDS:
+            # After a long quiet spell the previous window is stale too
+            self._previous = self._current if now - self._window_started < 2 * WINDOW_SECONDS else {}
+            self._current = {}
+            self._window_started = now
+
+    def record(self, sql: str, ms: float, slow_route: str | None = None, slow_site: str | None = None):
+        with self._lock:
+            self._rotate()
+            stats = self._current.get(sql)
+            if stats is None:
+                if len(self._current) >= MAX_SHAPES:
+                    self.dropped += 1
+                    return
+                stats = self._current[sql] = ShapeStats(sql)
+            stats.count += 1
+            stats.total_ms += ms
+            stats.max_ms = max(stats.max_ms, ms)
+            if slow_site is not None:
+                stats.slow += 1
+                stats.route = slow_route
+                stats.call_site = slow_site
+
+    def top(self, limit: int = 20, order: str = "total") -> list[dict]:
+        with self._lock:
+            self._rotate()
+            merged: dict[str, dict] = {}
+            for window in (self._previous, self._current):
+                for sql, stats in window.items():
+                    entry = merged.setdefault(sql, {
+                        "sql": sql, "count": 0, "total_ms": 0.0, "max_ms": 0.0, "slow": 0,
+                        "route": None, "call_site": None,
+                    })
+                    entry["count"] += stats.count
+                    entry["total_ms"] += stats.total_ms
+                    entry["max_ms"] = max(entry["max_ms"], stats.max_ms)
+                    entry["slow"] += stats.slow
+                    if stats.call_site is not None:
+                        entry["route"], entry["call_site"] = stats.route, stats.call_site
+
+        for entry in merged.values():
+            entry["mean_ms"] = round(entry["total_ms"] / entry["count"], 2)
+            entry["total_ms"] = round(entry["total_ms"], 1)
+            entry["max_ms"] = round(entry["max_ms"], 2)
+        key = {"total": "total_ms", "max": "max_ms", "mean": "mean_ms", "count": "count"}[order]
+        return sorted(merged.values(), key=lambda entry: entry[key], reverse=True)[:limit]
+
+    def reset(self):
+        with self._lock:
+            self._current.clear()
+            self._previous.clear()
+            self._window_started = time.monotonic()
+            self.dropped = 0
+
+
+query_stats = QueryStats()
+
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info.setdefault("query_started", []).append(time.perf_counter())
+
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    started = conn.info["query_started"].pop()
+    ms = (time.perf_counter() - started) * 1000
+    note_query(ms)
+    sql = normalize_sql(statement)
+    if ms < settings.SLOW_QUERY_MS:
+        query_stats.record(sql, ms)
+        return
+
+    route, site = current_route.get(), call_site()
+    query_stats.record(sql, ms, route, site)
+    logger.warning(
+        "Slow query %.1f ms route=%s site=%s params=%s sql=%s",
+        ms, route, site, redacted_params(parameters), sql,
+    )
+
+
+@event.listens_for(engine, "handle_error")
+def _on_error(exception_context):
+    # The after hook doesn't run for failed statements
+    connection = exception_context.connection
+    if connection is not None and connection.info.get("query_started"):
+        connection.info["query_started"].pop()
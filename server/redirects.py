@@ -0,0 +1,133 @@
+"""
+In-memory map behind the GET /r/{link_id} redirect.
+
+`redirect_cache` maps link id -> RedirectTarget(url, is_active, user_public,
+user_id) for the most recently used links (an LRU of REDIRECT_CACHE_SIZE).
+Hits are answered without touching the database or building ORM objects;
+misses run one Core SELECT. Any invalidation of a user's links, profile
+or account (see invalidation.py) drops that user's entries, in every worker;
+a target read before the latest invalidation of its user is not stored.
+"""
+import threading
+from collections import OrderedDict
+from typing import NamedTuple, Optional
+from sqlalchemy import select
+from config import get_settings
+from database import engine
+from invalidation import ENTITIES, bus
+import models
+
+settings = get_settings()
+
+
+class RedirectTarget(NamedTuple):
+    url: str
+    is_active: bool
+    user_public: bool
+    user_id: int
+
+
+_links = models.Link.__table__
+_users = models.User.__table__
+_profiles = models.Profile.__table__
+
+_LOOKUP = (
+    select(
+        _links.c.url,
+        _links.c.is_active,
+        _links.c.user_id,
+        _users.c.is_active.label("user_active"),
+        _profiles.c.is_public,
+    )
+    .join(_users, _users.c.id == _links.c.user_id)
+    .outerjoin(_profiles, _profiles.c.user_id == _links.c.user_id)
+)
+
+
+def load_target(link_id: int) -> Optional[RedirectTarget]:
+    """Read one link's redirect target from the database"""
+    stmt = _LOOKUP.where(_links.c.id == link_id)
+    with engine.connect() as conn:
+        row = conn.execute(stmt).first()
+    if row is None:
+        return None
+    # Users without a profile row are public, as in the profile endpoint
+    user_public = bool(row.user_active) and row.is_public is not False
+    return RedirectTarget(row.url, bool(row.is_active), user_public, row.user_id)
+
+
+class RedirectCache:
+    def __init__(self, maxsize: int):
+        self.maxsize = maxsize
+        self._lock = threading.Lock()
+        self._targets: OrderedDict[int, RedirectTarget] = OrderedDict()
+        self._by_user: dict[int, set[int]] = {}
+        self.hits = 0
+        self.misses = 0
+        self.stale_fills = 0
+
+    def get(self, link_id: int) -> Optional[RedirectTarget]:
+        # Plain dict lookups; the lock is only taken to reorder
+        target = self._targets.get(link_id)
+        if target is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        with self._lock:
+            if link_id in self._targets:
+                self._targets.move_to_end(link_id)
+        return target
+
+    def put(self, link_id: int, target: RedirectTarget, read_at: int):
+        """Store a target read at `read_at` (`now_ns()`), unless its user was invalidated since"""
+        with self._lock:
+            # Checked under the lock: an invalidation landing later waits for it and evicts the entry
+            if any(bus.version(entity, target.user_id) >= read_at for entity in ENTITIES):
+                self.stale_fills += 1
+                return
+            self._targets[link_id] = target
+            self._targets.move_to_end(link_id)
+            self._by_user.setdefault(target.user_id, set()).add(link_id)
+            while len(self._targets) > self.maxsize:
+                old_id, old = self._targets.popitem(last=False)
+                self._forget(old_id, old.user_id)
+
+    def _forget(self, link_id: int, user_id: int):
+        user_links = self._by_user.get(user_id)
+        if user_links is not None:
+            user_links.discard(link_id)
+            if not user_links:
+                del self._by_user[user_id]
+
+    def invalidate(self, link_id: int):
+        with self._lock:
+            target = self._targets.pop(link_id, None)
+            if target is not None:
+                self._forget(link_id, target.user_id)
+
+    def invalidate_user(self, user_id: int):
+        """Drop every cached link of a user (profile visibility or account changed)"""
+        with self._lock:
+            for link_id in self._by_user.pop(user_id, ()):
+                self._targets.pop(link_id, None)
+
+    def clear(self):
+        with self._lock:
+            self._targets.clear()
+            self._by_user.clear()
+
+    def stats(self) -> dict:
+        return {
+            "size": len(self._targets),
+            "maxsize": self.maxsize,
+            "hits": self.hits,
+            "misses": self.misses,
+            "stale_fills": self.stale_fills,
+        }
+
+
+redirect_cache = RedirectCache(settings.REDIRECT_CACHE_SIZE)
+
+for _entity in ENTITIES:
+    bus.subscribe(_entity, lambda message: redirect_cache.invalidate_user(message.user_id))
+bus.on_reset(redirect_cache.clear)
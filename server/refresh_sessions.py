@@ -0,0 +1,205 @@
+"""
+Server-side refresh token sessions.
+
+Every login starts a session family (`sessions` table). Refresh tokens carry
+the family id (`fid`) and a per-rotation id (`jti`); each refresh swaps the
+family's current jti with one conditional UPDATE. Presenting a jti that has
+already been rotated away means the token was copied, so the whole family is
+revoked (reuse detection).
+
+Revocation checks stay off the database on the hot path. Each worker keeps a
+`RevocationCache`:
+- families revoked within the access token lifetime, so access tokens of a
+  revoked family are rejected without a query and refreshes fail fast;
+- a Bloom filter of every family revoked within the refresh token lifetime.
+  A miss means "not revoked" and the refresh goes straight to the rotation
+  UPDATE; a hit is confirmed with a read.
+`sync_revocations` pulls new revocations from the database every few seconds,
+which bounds how long a logout-all takes to reach every worker.
+"""
+import logging
+import threading
+import uuid
+from datetime import datetime, timedelta, timezone
+from fastapi import HTTPException, status
+from sqlalchemy.orm import Session
+from availability import BloomFilter
+from config import get_settings
+from database import SessionLocal
+import models
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+# A second refresh with the token that was just rotated (two tabs refreshing at
+# once) is rejected but not treated as token theft
+REUSE_GRACE_SECONDS = 10
+# Re-read revocations this far behind the watermark to catch slow commits
+SYNC_OVERLAP_SECONDS = 5
+
+
+def _utcnow() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _aware(value: datetime) -> datetime:
+    # SQLite hands back naive datetimes; everything is stored in UTC
+    return value if value.tzinfo else value.replace(tzinfo=timezone.utc)
+
+
+def _invalid(detail: str) -> HTTPException:
+    return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=detail)
+
+
+class RevocationCache:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._recent: dict[str, datetime] = {}
+        self._filter = BloomFilter(10_000)
+        self._watermark: datetime | None = None
+
+    @property
+    def recent_window(self) -> timedelta:
+        return timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES + 1)
+
+    def add(self, family_id: str, revoked_at: datetime):
+        with self._lock:
+            self._filter.add(family_id)
+            if _utcnow() - revoked_at < self.recent_window:
+                self._recent[family_id] = revoked_at
+
+    def is_recently_revoked(self, family_id: str) -> bool:
+        return family_id in self._recent
+
+    def maybe_revoked(self, family_id: str) -> bool:
+        return family_id in self._filter
+
+    def load(self, db: Session):
+        """Rebuild from every revoked family whose refresh tokens could still be presented"""
+        now = _utcnow()
+        rows = db.query(models.RefreshSession.family_id, models.RefreshSession.revoked_at).filter(
+            models.RefreshSession.revoked_at.isnot(None),
+            models.RefreshSession.expires_at > now
+        ).all()
+
+        bloom = BloomFilter(max(2 * len(rows), 10_000))
+        recent = {}
+        for family_id, revoked_at in rows:
+            bloom.add(family_id)
+            revoked_at = _aware(revoked_at)
+            if now - revoked_at < self.recent_window:
+                recent[family_id] = revoked_at
+
+        with self._lock:
+            self._filter, self._recent, self._watermark = bloom, recent, now
+
+    def sync(self, db: Session):
+        """Pick up revocations made by other workers since the last sync"""
+        if self._watermark is None:
+            return self.load(db)
+
+        now = _utcnow()
+        rows = db.query(models.RefreshSession.family_id, models.RefreshSession.revoked_at).filter(
+            models.RefreshSession.revoked_at > self._watermark - timedelta(seconds=SYNC_OVERLAP_SECONDS)
+        ).all()
+        for family_id, revoked_at in rows:
+            self.add(family_id, _aware(revoked_at))
+
+        with self._lock:
+            self._watermark = now
+            cutoff = now - self.recent_window
+            self._recent = {fid: at for fid, at in self._recent.items() if at > cutoff}
+            # Nothing ever leaves a Bloom filter; start over once it is past its capacity
+            rebuild = self._filter.count > self._filter.capacity
+
+        if rebuild:
+            self.load(db)
+
+
+revocation_cache = RevocationCache()
+
+
+def sync_revocations():
+    db = SessionLocal()
+    try:
+        revocation_cache.sync(db)
+    finally:
+        db.close()
+
+
+def start_session(db: Session, user_id: int) -> tuple[str, str]:
+    """Create a session family for a new login; returns (family_id, jti). The caller commits."""
+    family_id, jti = str(uuid.uuid4()), str(uuid.uuid4())
+    db.add(models.RefreshSession(
+        family_id=family_id,
+        user_id=user_id,
+        current_jti=jti,
+        expires_at=_utcnow() + timedelta(days=settings.REFRESH_TOKEN_EXPIRE_DAYS),
+    ))
+    return family_id, jti
+
+
+def rotate_session(db: Session, family_id: str, jti: str) -> str:
+    """Swap the family's current jti for a new one; returns it. Raises 401 when the token is no longer valid."""
+    if revocation_cache.is_recently_revoked(family_id):
+        raise _invalid("Session has been revoked")
+
+    sessions = db.query(models.RefreshSession).filter(models.RefreshSession.family_id == family_id)
+    if revocation_cache.maybe_revoked(family_id):
+        revoked = sessions.filter(models.RefreshSession.revoked_at.isnot(None)).first()
+        if revoked:
+            raise _invalid("Session has been revoked")
+
+    now = _utcnow()
+    new_jti = str(uuid.uuid4())
+    rotated = sessions.filter(
+        models.RefreshSession.current_jti == jti,
+        models.RefreshSession.revoked_at.is_(None),
+        models.RefreshSession.expires_at > now
+    ).update(
+        {"current_jti": new_jti, "previous_jti": jti, "last_used_at": now},
+        synchronize_session=False
+    )
+    db.commit()
+    if rotated:
+        return new_jti
+
+    # Work out why the rotation didn't apply
+    session = sessions.first()
+    if session is None or _aware(session.expires_at) <= now:
+        raise _invalid("Session has expired")
+    if session.revoked_at is not None:
+        revocation_cache.add(family_id, _aware(session.revoked_at))
+        raise _invalid("Session has been revoked")
+    if jti == session.previous_jti and now - _aware(session.last_used_at) < timedelta(seconds=REUSE_GRACE_SECONDS):
+        raise _invalid("Refresh token already used")
+
+    logger.warning("Refresh token reuse detected for session family %s (user %s)", family_id, session.user_id)
+    revoke_session(db, family_id, reason="reuse")
+    raise _invalid("Refresh token reuse detected")
+
+
+def revoke_session(db: Session, family_id: str, reason: str = "logout"):
+    now = _utcnow()
+    db.query(models.RefreshSession).filter(
+        models.RefreshSession.family_id == family_id,
+        models.RefreshSession.revoked_at.is_(None)
+    ).update({"revoked_at": now, "revoked_reason": reason}, synchronize_session=False)
+    db.commit()
+    revocation_cache.add(family_id, now)
+
+
+def revoke_user_sessions(db: Session, user_id: int, reason: str = "logout_all"):
+    """Revoke every active session of a user (commits)"""
+    now = _utcnow()
+    family_ids = [fid for (fid,) in db.query(models.RefreshSession.family_id).filter(
+        models.RefreshSession.user_id == user_id,
+        models.RefreshSession.revoked_at.is_(None)
+    ).all()]
+    if family_ids:
+        db.query(models.RefreshSession).filter(
+            models.RefreshSession.family_id.in_(family_ids)
+        ).update({"revoked_at": now, "revoked_reason": reason}, synchronize_session=False)
+    db.commit()
+    for family_id in family_ids:
+        revocation_cache.add(family_id, now)
@@ -2,5 +2,8 @@ from routers.auth import router as auth_router
 from routers.users import router as users_router
 from routers.profiles import router as profiles_router
 from routers.links import router as links_router
+from routers.search import router as search_router
+from routers.redirects import router as redirects_router
+from routers.admin import router as admin_router
 
-__all__ = ["auth_router", "users_router", "profiles_router", "links_router"]
\ No newline at end of file
+__all__ = ["auth_router", "users_router", "profiles_router", "links_router", "search_router", "redirects_router", "admin_router"]
\ No newline at end of file
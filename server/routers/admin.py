@@ -0,0 +1,126 @@
+import secrets
+from typing import Literal
+from fastapi import APIRouter, Depends, Header, HTTPException, Query
+from fastapi.responses import FileResponse, PlainTextResponse
+from config import get_settings
+from auth import access_token_cache
+from invalidation import bus
+from load_shedding import load_stats
+from public_cache import public_cache
+from redirects import redirect_cache
+from scheduler import scheduler
+import pool_stats
+import querylog
+import profiling
+from threadpool import threadpool_status
+
+settings = get_settings()
+
+def require_admin_token(x_admin_token: str = Header(default="")):
+    # Without a configured token the operational endpoints don't exist
+    if not settings.ADMIN_TOKEN:
+        raise HTTPException(status_code=404, detail="Not Found")
+    if not secrets.compare_digest(x_admin_token, settings.ADMIN_TOKEN):
+        raise HTTPException(status_code=403, detail="Invalid admin token")
+
+router = APIRouter(prefix="/admin", tags=["Admin"], dependencies=[Depends(require_admin_token)])
+
+@router.get("/db/pool")
+async def get_pool_stats():
+    """This worker's connection pool and threadpool, and how long each route holds a connection"""
+    # Async: the thread limiter can only be read from the event loop
+    return {
+        "pool": pool_stats.pool_status(),
+        "threadpool": threadpool_status(),
+        "routes": pool_stats.route_hold_stats(),
+    }
+
+@router.post("/db/pool/reset", status_code=204)
+def reset_pool_stats():
+    pool_stats.reset()
+    return None
+
+@router.get("/db/queries")
+def get_query_stats(
+    limit: int = Query(20, ge=1, le=200),
+    order: Literal["total", "max", "mean", "count"] = "total"
+):
+    """Heaviest statement shapes of the last 15-30 minutes in this worker"""
+    return {
+        "slow_query_ms": settings.SLOW_QUERY_MS,
+        "dropped": querylog.query_stats.dropped,
+        "statements": querylog.query_stats.top(limit, order),
+    }
+
+@router.post("/db/queries/reset", status_code=204)
+def reset_query_stats():
+    querylog.query_stats.reset()
+    return None
+
+@router.get("/caches")
+def get_cache_stats():
+    """Hit rates of this worker's in-memory caches and the invalidation bus"""
+    return {
+        "redirects": redirect_cache.stats(),
+        "public_payloads": public_cache.stats(),
+        "access_tokens": access_token_cache.stats(),
+        "invalidation": bus.stats(),
+    }
+
+@router.get("/scheduler")
+def get_scheduler_stats():
+    """Scheduled jobs of this worker: leadership, run counts and run times"""
+    return scheduler.stats()
+
+@router.get("/load")
+def get_load_stats():
+    """Requests in flight, queued and shed per route class in this worker"""
+    return load_stats()
+
+@router.post("/profiler/token")
+def create_profile_token(ttl_seconds: int = Query(600, ge=1, le=86400)):
+    """A token that profiles any request sending it in the X-Profile-Token header until it expires"""
+    return {"header": "X-Profile-Token", "value": profiling.make_profile_token(ttl_seconds)}
+
+@router.put("/profiler/routes")
+def arm_profiler(route: str, requests: int = Query(1, ge=0, le=1000)):
+    """Profile the next `requests` requests to a route path (e.g. /links/{link_id}); 0 disarms"""
+    profiling.arm_route(route, requests)
+    return profiling.armed_routes()
+
+@router.get("/profiler/profiles")
+def list_profiles():
+    """Saved request profiles of this host, newest first"""
+    return profiling.saved_profiles()
+
+@router.get("/profiler/profiles/{name}")
+def get_profile(name: str):
+    path = profiling.profile_path(name)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Profile not found")
+    return FileResponse(path, media_type="text/plain")
+
+@router.put("/profiler/continuous")
+def set_continuous_profiling(hz: float = Query(..., ge=0, le=100)):
+    """Sample every busy request thread `hz` times a second in this worker; 0 turns it off"""
+    profiling.continuous_sampler.set_rate(hz)
+    return {"hz": hz}
+
+@router.get("/profiler/hot")
+def get_hot_stacks(route: str | None = None, limit: int = Query(20, ge=1, le=500)):
+    """Most sampled stacks per route from continuous profiling"""
+    return {
+        "hz": profiling.continuous_sampler.hz,
+        "samples": profiling.continuous_sampler.samples,
+        "routes": profiling.continuous_sampler.hot_stacks(route, limit),
+    }
+
+@router.get("/profiler/hot/collapsed", response_class=PlainTextResponse)
+def get_hot_stacks_collapsed(route: str):
+    """One route's continuous samples in collapsed-stack format"""
+    return profiling.continuous_sampler.collapsed(route)
+
+@router.post("/profiler/hot/reset", status_code=204)
+def reset_hot_stacks():
+    profiling.continuous_sampler.reset()
+    return None
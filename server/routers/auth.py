@@ -1,8 +1,11 @@
 from datetime import datetime,timedelta, timezone
 from fastapi import APIRouter, Depends, HTTPException, status, Response, Request
 from fastapi.security import OAuth2PasswordRequestForm
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from database import get_db
+from access_log import note_user
+from profiling import ProfiledRoute
 from config import get_settings
 import models
 import schemas
@@ -16,18 +19,22 @@ from auth import (
 )
 import secrets
 from fastapi import BackgroundTasks
-from fastapi_mail import MessageSchema, FastMail
+from clients import send_plain_email
+from availability import availability_index
+from invalidation import publish
+from refresh_sessions import start_session, rotate_session, revoke_session, revoke_user_sessions
+import search
 
-router = APIRouter(prefix="/auth", tags=["Authentication"])
+router = APIRouter(prefix="/auth", tags=["Authentication"], route_class=ProfiledRoute)
 settings = get_settings()
 RATE_LIMIT_MINUTES = 5
 
 async def send_verification_email(email: str, token: str):
     verify_url = f"{settings.FRONTEND_URL}/verify-email?token={token}"
 
-    message = MessageSchema(
+    await send_plain_email(
+        email,
         subject="Verify your email",
-        recipients=[email],
         body=f"""
         Welcome 👋
 
@@ -37,12 +44,8 @@ async def send_verification_email(email: str, token: str):
 
         This link expires in 24 hours.
         """,
-        subtype="plain",
     )
 
-    fm = FastMail(settings.MAIL_CONFIG)
-    await fm.send_message(message)
-
 
 @router.post("/register", response_model=schemas.UserResponse, status_code=status.HTTP_201_CREATED)
 def register(
@@ -55,7 +58,7 @@ def register(
         raise HTTPException(status_code=400, detail="Email already registered")
 
     # Check if username exists
-    if db.query(models.User).filter(models.User.username == user.username).first():
+    if db.query(models.User).filter(func.lower(models.User.username) == user.username).first():
         raise HTTPException(status_code=400, detail="Username already taken")
 
     # Create user (NOT verified)
@@ -74,6 +77,7 @@ def register(
 
     # Create default profile
     db.add(models.Profile(user_id=db_user.id))
+    search.index_user(db, db_user.id)
     db.commit()
 
     # Create verification token
@@ -89,6 +93,10 @@ def register(
     db.add(verification)
     db.commit()
 
+    availability_index.add(username=db_user.username, email=db_user.email)
+    # Other workers add the new account to their availability indexes
+    publish("user", db_user.id)
+
     # Send email in background
     background_tasks.add_task(
         send_verification_email,
@@ -117,16 +125,22 @@ def login(
             headers={"WWW-Authenticate": "Bearer"},
         )
     
+    note_user(user.id)
+
+    # Every login starts its own session family
+    family_id, jti = start_session(db, user.id)
+    db.commit()
+
     # Create access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     access_token = create_access_token(
-        data={"sub": user.email, "user_id": user.id},
+        data={"sub": user.email, "user_id": user.id, "fid": family_id},
         expires_delta=access_token_expires
     )
     
     # Create refresh token
     refresh_token = create_refresh_token(
-        data={"sub": user.email, "user_id": user.id}
+        data={"sub": user.email, "user_id": user.id, "fid": family_id, "jti": jti}
     )
     
     # Set refresh token in HTTP-only cookie
@@ -148,10 +162,10 @@ def login(
     return {"access_token": access_token, "token_type": "bearer"}
 
 @router.post("/refresh", response_model=schemas.Token)
-def refresh_token(request: Request, response: Response):
+def refresh_token(request: Request, response: Response, db: Session = Depends(get_db)):
     """
     Refresh access token using refresh token from HTTP-only cookie.
-    Also rotates the refresh token for enhanced security.
+    Also rotates the refresh token; reusing a rotated token revokes the session.
     """
     refresh_token = request.cookies.get("refresh_token")
     
@@ -171,23 +185,33 @@ def refresh_token(request: Request, response: Response):
     
     email = payload.get("sub")
     user_id = payload.get("user_id")
+    family_id = payload.get("fid")
+    jti = payload.get("jti")
     
-    if not email or not user_id:
+    # Tokens issued before server-side sessions carry no family and must log in again
+    if not email or not user_id or not family_id or not jti:
+        response.delete_cookie(key="refresh_token", path="/auth")
         raise HTTPException(
             status_code=status.HTTP_401_UNAUTHORIZED,
             detail="Invalid refresh token payload"
         )
     
+    try:
+        new_jti = rotate_session(db, family_id, jti)
+    except HTTPException:
+        response.delete_cookie(key="refresh_token", path="/auth")
+        raise
+    
     # Create new access token
     access_token_expires = timedelta(minutes=settings.ACCESS_TOKEN_EXPIRE_MINUTES)
     new_access_token = create_access_token(
-        data={"sub": email, "user_id": user_id},
+        data={"sub": email, "user_id": user_id, "fid": family_id},
         expires_delta=access_token_expires
     )
     
     # Refresh token rotation: create new refresh token
     new_refresh_token = create_refresh_token(
-        data={"sub": email, "user_id": user_id}
+        data={"sub": email, "user_id": user_id, "fid": family_id, "jti": new_jti}
     )
     
     # Update refresh token cookie
@@ -210,12 +234,22 @@ def refresh_token(request: Request, response: Response):
 
 @router.post("/logout")
 def logout(
+    request: Request,
     response: Response,
+    db: Session = Depends(get_db)
 ):
     """
-    Logout endpoint - clears refresh token cookie.
-    Requires valid access token to ensure only authenticated users can logout.
+    Logout endpoint - revokes the session and clears refresh token cookie.
     """
+    refresh_token = request.cookies.get("refresh_token")
+    if refresh_token:
+        try:
+            family_id = decode_refresh_token(refresh_token).get("fid")
+        except HTTPException:
+            family_id = None
+        if family_id:
+            revoke_session(db, family_id)
+
     cookie_domain = getattr(settings, 'COOKIE_DOMAIN', None)
     
     response.delete_cookie(
@@ -226,6 +260,27 @@ def logout(
     
     return {"message": "Successfully logged out"}
 
+@router.post("/logout-all")
+def logout_all(
+    response: Response,
+    current_user: models.User = Depends(get_current_active_user),
+    db: Session = Depends(get_db)
+):
+    """
+    Revoke every session of the current user, on all devices.
+    Other workers pick the revocation up within SESSION_SYNC_SECONDS.
+    """
+    revoke_user_sessions(db, current_user.id)
+
+    cookie_domain = getattr(settings, 'COOKIE_DOMAIN', None)
+    response.delete_cookie(
+        key="refresh_token",
+        path="/auth",
+        domain=cookie_domain
+    )
+
+    return {"message": "Logged out from all devices"}
+
 @router.get("/me", response_model=schemas.UserResponse)
 def read_users_me(current_user: models.User = Depends(get_current_active_user)):
     return current_user
@@ -236,11 +291,14 @@ def validate_email(email: str, db: Session = Depends(get_db)):
     Check if an email is already registered.
     Returns available: true if email is available, false if already taken.
     """
-    db_user = db.query(models.User).filter(models.User.email == email).first()
+    # A miss in the in-memory index is definitive; only possible hits hit the DB
+    taken = availability_index.email_maybe_taken(email) and (
+        db.query(models.User.id).filter(models.User.email == email).first() is not None
+    )
     return {
         "email": email,
-        "available": db_user is None,
-        "message": "Email is available" if db_user is None else "Email already registered"
+        "available": not taken,
+        "message": "Email already registered" if taken else "Email is available"
     }
 
 @router.get("/validate/username/{username}", response_model=schemas.UsernameValidationResponse)
@@ -249,11 +307,13 @@ def validate_username(username: str, db: Session = Depends(get_db)):
     Check if a username is already taken.
     Returns available: true if username is available, false if already taken.
     """
-    db_user = db.query(models.User).filter(models.User.username == username).first()
+    taken = availability_index.username_maybe_taken(username) and (
+        db.query(models.User.id).filter(func.lower(models.User.username) == username.lower()).first() is not None
+    )
     return {
         "username": username,
-        "available": db_user is None,
-        "message": "Username is available" if db_user is None else "Username already taken"
+        "available": not taken,
+        "message": "Username already taken" if taken else "Username is available"
     }
 
 @router.get("/verify-email")
@@ -323,9 +383,9 @@ def resend_verification_email(
 async def send_forgot_password_email(email: str, token: str):
     reset_link = f"{settings.FRONTEND_URL}/reset-password?token={token}"
 
-    message = MessageSchema(
+    await send_plain_email(
+        email,
         subject="Reset Your Password",
-        recipients=[email],
         body=f"""
         You requested a password reset.
 
@@ -335,12 +395,8 @@ async def send_forgot_password_email(email: str, token: str):
 
         If you did not request this, just ignore this email.
         """,
-        subtype="plain"
     )
 
-    fm = FastMail(settings.MAIL_CONFIG)
-    await fm.send_message(message)
-
 
 @router.post("/forgot-password", status_code=status.HTTP_202_ACCEPTED,response_model=schemas.ForgotPasswordResponse)
 async def forgot_password(
@@ -448,4 +504,7 @@ def reset_password(
 
     db.commit()
 
+    # A password reset signs out every device
+    revoke_user_sessions(db, user.id, reason="password_reset")
+
     return {"message": "Password reset successful"}
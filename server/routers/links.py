@@ -1,12 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, BackgroundTasks, UploadFile, File, Request
+from fastapi.responses import StreamingResponse
+from sqlalchemy import func
 from sqlalchemy.orm import Session
-from typing import List
+from pydantic import TypeAdapter
+from typing import List, Literal
 from database import get_db
+from profiling import ProfiledRoute
 import models
 import schemas
 from auth import get_current_active_user
+import search
+from ordering import key_between, needs_rebalance, rebalance_links
+from clicks import click_buffer
+from invalidation import publish
+from public_cache import cached_json_response
+from link_preview import refresh_link_preview
+from threadpool import iterate_in_background_thread
+import link_export
+import link_import
 
-router = APIRouter(prefix="/links", tags=["Links"])
+router = APIRouter(prefix="/links", tags=["Links"], route_class=ProfiledRoute)
 
 @router.get("/", response_model=List[schemas.LinkResponse])
 def get_my_links(
@@ -15,9 +28,24 @@ def get_my_links(
 ):
     links = db.query(models.Link).filter(
         models.Link.user_id == current_user.id
-    ).order_by(models.Link.position).all()
+    ).order_by(models.Link.sort_key, models.Link.id).all()
     return links
 
+# Declared before /{link_id} so "export" isn't read as a link id
+@router.get("/export")
+def export_links(
+    format: Literal["ndjson", "csv"] = "ndjson",
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Download all of the current user's links with click counts, streamed row by row"""
+    filename = f"{current_user.username}-links.{format}"
+    # Rows are read on the background threads, not the ones serving requests
+    return StreamingResponse(
+        iterate_in_background_thread(link_export.STREAMS[format](current_user.id)),
+        media_type=link_export.MEDIA_TYPES[format],
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'}
+    )
+
 @router.get("/{link_id}", response_model=schemas.LinkResponse)
 def get_link(
     link_id: int,
@@ -35,6 +63,7 @@ def get_link(
 @router.post("/", response_model=schemas.LinkResponse, status_code=status.HTTP_201_CREATED)
 def create_link(
     link: schemas.LinkCreate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
@@ -45,19 +74,68 @@ def create_link(
             detail="User is not verified"
         )
     
+    # New links go to the end
+    last_key = db.query(func.max(models.Link.sort_key)).filter(
+        models.Link.user_id == current_user.id
+    ).scalar()
+
     db_link = models.Link(
         user_id=current_user.id,
+        sort_key=key_between(last_key, None),
         **link.model_dump()
     )
     db.add(db_link)
+    search.index_user(db, current_user.id)
     db.commit()
     db.refresh(db_link)
+    publish("link", current_user.id)
+
+    if needs_rebalance(db_link.sort_key):
+        background_tasks.add_task(rebalance_links, current_user.id)
+    background_tasks.add_task(refresh_link_preview, db_link.id, db_link.url)
     return db_link
 
+@router.post("/import", response_model=schemas.LinkImportResponse)
+def import_links(
+    background_tasks: BackgroundTasks,
+    file: UploadFile = File(...),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """
+    Add links in bulk from a CSV, JSON or NDJSON file (columns as in LinkCreate).
+    Valid rows are imported after the existing links; invalid rows are reported.
+    """
+    if not current_user.is_verified:
+        raise HTTPException(
+            status_code=status.HTTP_403_FORBIDDEN,
+            detail="User is not verified"
+        )
+
+    try:
+        # Fails early when the size is known; import_links enforces it while reading either way
+        if file.size is not None and file.size > link_import.MAX_IMPORT_BYTES:
+            raise link_import.ImportTooLarge()
+        format_ = link_import.detect_format(file.filename, file.content_type)
+        result = link_import.import_links(db, current_user.id, file.file, format_)
+    except link_import.ImportTooLarge as exc:
+        db.rollback()
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(exc))
+    except link_import.InvalidImport as exc:
+        db.rollback()
+        raise HTTPException(status_code=400, detail=str(exc))
+    db.commit()
+    publish("link", current_user.id)
+
+    if result.rebalance:
+        background_tasks.add_task(rebalance_links, current_user.id)
+    return result
+
 @router.put("/{link_id}", response_model=schemas.LinkResponse)
 def update_link(
     link_id: int,
     link_update: schemas.LinkUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
@@ -69,11 +147,21 @@ def update_link(
         raise HTTPException(status_code=404, detail="Link not found")
     
     # Update fields
+    old_url = link.url
     for field, value in link_update.model_dump(exclude_unset=True).items():
         setattr(link, field, value)
+
+    # A new URL gets checked on the next health check run
+    if link.url != old_url:
+        link.health_status = link.health_status_code = link.health_checked_at = None
     
+    search.index_user(db, current_user.id)
     db.commit()
     db.refresh(link)
+    publish("link", current_user.id)
+
+    if link.url != old_url:
+        background_tasks.add_task(refresh_link_preview, link.id, link.url)
     return link
 
 @router.delete("/{link_id}", status_code=status.HTTP_204_NO_CONTENT)
@@ -90,7 +178,9 @@ def delete_link(
         raise HTTPException(status_code=404, detail="Link not found")
     
     db.delete(link)
+    search.index_user(db, current_user.id)
     db.commit()
+    publish("link", current_user.id)
     return None
 
 @router.post("/reorder", response_model=List[schemas.LinkResponse])
@@ -99,45 +189,113 @@ def reorder_links(
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    """Reorder multiple links at once"""
-    for item in reorder_data:
-        link = db.query(models.Link).filter(
-            models.Link.id == item.link_id,
-            models.Link.user_id == current_user.id
-        ).first()
-        if link:
-            link.position = item.new_position
+    """
+    Reorder multiple links at once.
+    The given links swap ordering keys among themselves, so links that are not
+    listed keep their place. Prefer POST /links/{link_id}/move for single moves.
+    """
+    new_positions = {item.link_id: item.new_position for item in reorder_data}
+    links = db.query(models.Link).filter(
+        models.Link.id.in_(new_positions),
+        models.Link.user_id == current_user.id
+    ).all()
+
+    keys = sorted(link.sort_key for link in links)
+    for link, key in zip(sorted(links, key=lambda x: new_positions[x.id]), keys):
+        link.position = new_positions[link.id]
+        link.sort_key = key
     
     db.commit()
+    publish("link", current_user.id)
     
     # Return updated list
     links = db.query(models.Link).filter(
         models.Link.user_id == current_user.id
-    ).order_by(models.Link.position).all()
+    ).order_by(models.Link.sort_key, models.Link.id).all()
     return links
 
+@router.post("/{link_id}/move", response_model=schemas.LinkResponse)
+def move_link(
+    link_id: int,
+    move: schemas.LinkMove,
+    background_tasks: BackgroundTasks,
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Move one link between two neighbours. Only the moved link is written."""
+    if move.after_id is None and move.before_id is None:
+        raise HTTPException(status_code=400, detail="after_id or before_id is required")
+    if link_id in (move.after_id, move.before_id):
+        raise HTTPException(status_code=400, detail="A link can't be its own neighbour")
+
+    link = db.query(models.Link).filter(
+        models.Link.id == link_id,
+        models.Link.user_id == current_user.id
+    ).first()
+    if not link:
+        raise HTTPException(status_code=404, detail="Link not found")
+
+    neighbour_ids = [i for i in (move.after_id, move.before_id) if i is not None]
+    neighbour_keys = dict(db.query(models.Link.id, models.Link.sort_key).filter(
+        models.Link.id.in_(neighbour_ids),
+        models.Link.user_id == current_user.id
+    ).all())
+    if len(neighbour_keys) != len(neighbour_ids):
+        raise HTTPException(status_code=404, detail="Neighbour link not found")
+
+    after_key = neighbour_keys.get(move.after_id)
+    before_key = neighbour_keys.get(move.before_id)
+
+    # With one neighbour given, the other side is whichever link is adjacent to it now
+    others = db.query(models.Link.sort_key).filter(
+        models.Link.user_id == current_user.id,
+        models.Link.id != link_id
+    )
+    if move.before_id is None:
+        before_key = others.filter(models.Link.sort_key > after_key).order_by(models.Link.sort_key).limit(1).scalar()
+    elif move.after_id is None:
+        after_key = others.filter(models.Link.sort_key < before_key).order_by(models.Link.sort_key.desc()).limit(1).scalar()
+
+    try:
+        link.sort_key = key_between(after_key, before_key)
+    except ValueError:
+        # Neighbours out of order, or sharing a key after concurrent moves
+        if after_key == before_key:
+            background_tasks.add_task(rebalance_links, current_user.id)
+            raise HTTPException(status_code=409, detail="Links are being reordered, try again")
+        raise HTTPException(status_code=400, detail="after_id must come before before_id")
+
+    db.commit()
+    db.refresh(link)
+    publish("link", current_user.id)
+
+    if needs_rebalance(link.sort_key):
+        background_tasks.add_task(rebalance_links, current_user.id)
+    return link
+
 @router.post("/{link_id}/click", response_model=schemas.LinkResponse)
 def increment_click_count(
     link_id: int,
     db: Session = Depends(get_db)
 ):
-    """Public endpoint to track clicks - no authentication required"""
+    """
+    Public endpoint to track clicks - no authentication required.
+    Prefer GET /r/{link_id}, which counts the click and redirects in one request.
+    """
     link = db.query(models.Link).filter(models.Link.id == link_id).first()
     if not link:
         raise HTTPException(status_code=404, detail="Link not found")
     
-    link.click_count += 1
-    db.commit()
-    db.refresh(link)
+    click_buffer.record(link.id)
     return link
 
-@router.get("/user/{username}", response_model=List[schemas.LinkResponse])
-def get_user_links(
-    username: str,
-    db: Session = Depends(get_db)
-):
-    """Public endpoint to get user's active links"""
-    user = db.query(models.User).filter(models.User.username == username).first()
+_link_list = TypeAdapter(List[schemas.LinkResponse])
+
+def public_links_payload(db: Session, username: str) -> tuple[int, bytes]:
+    user = db.query(models.User).filter(
+        func.lower(models.User.username) == username.lower(),
+        models.User.is_active == True
+    ).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -145,6 +303,15 @@ def get_user_links(
     links = db.query(models.Link).filter(
         models.Link.user_id == user.id,
         models.Link.is_active == True
-    ).order_by(models.Link.position).all()
+    ).order_by(models.Link.sort_key, models.Link.id).all()
     
-    return links
\ No newline at end of file
+    return user.id, _link_list.dump_json(_link_list.validate_python(links, from_attributes=True))
+
+@router.get("/user/{username}", response_model=List[schemas.LinkResponse])
+def get_user_links(
+    username: str,
+    request: Request,
+    db: Session = Depends(get_db)
+):
+    """Public endpoint to get user's active links"""
+    return cached_json_response(request, "links", username, lambda: public_links_payload(db, username))
\ No newline at end of file
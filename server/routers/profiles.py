@@ -1,11 +1,15 @@
-from fastapi import APIRouter, Depends, HTTPException, status
+from fastapi import APIRouter, Depends, HTTPException, status, Query
 from sqlalchemy.orm import Session
+from datetime import date, timedelta
 from database import get_db
+from profiling import ProfiledRoute
 import models
 import schemas
 from auth import get_current_active_user
+from pageviews import HyperLogLog, page_view_buffer
+from invalidation import publish
 
-router = APIRouter(prefix="/profiles", tags=["Profiles"])
+router = APIRouter(prefix="/profiles", tags=["Profiles"], route_class=ProfiledRoute)
 
 @router.get("/me", response_model=schemas.ProfileResponse)
 def get_my_profile(
@@ -43,6 +47,7 @@ def create_my_profile(
     db.add(db_profile)
     db.commit()
     db.refresh(db_profile)
+    publish("profile", current_user.id)
     return db_profile
 
 @router.put("/me", response_model=schemas.ProfileResponse)
@@ -69,6 +74,7 @@ def update_my_profile(
     
     db.commit()
     db.refresh(profile)
+    publish("profile", current_user.id)
     return profile
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
@@ -82,8 +88,40 @@ def delete_my_profile(
     
     db.delete(profile)
     db.commit()
+    publish("profile", current_user.id)
     return None
 
+@router.get("/me/views", response_model=schemas.ProfileViewsResponse)
+def get_my_profile_views(
+    days: int = Query(30, ge=1, le=365),
+    db: Session = Depends(get_db),
+    current_user: models.User = Depends(get_current_active_user)
+):
+    """Estimated unique visitors of my public page, per day and over the period"""
+    since = date.today() - timedelta(days=days - 1)
+    rows = db.query(models.ProfileViewSketch).filter(
+        models.ProfileViewSketch.user_id == current_user.id,
+        models.ProfileViewSketch.day >= since
+    ).all()
+
+    # Persisted sketches plus views this worker hasn't flushed yet
+    sketches = {row.day: HyperLogLog.from_bytes(row.sketch) for row in rows}
+    for day, pending in page_view_buffer.pending(current_user.id).items():
+        if day >= since:
+            sketches.setdefault(day, HyperLogLog()).merge(pending)
+
+    total = HyperLogLog()
+    for sketch in sketches.values():
+        total.merge(sketch)
+
+    return {
+        "unique_visitors": total.estimate(),
+        "days": [
+            {"day": day, "unique_visitors": sketches[day].estimate()}
+            for day in sorted(sketches)
+        ],
+    }
+
 @router.get("/{user_id}", response_model=schemas.ProfileResponse)
 def get_user_profile(
     user_id: int,
@@ -0,0 +1,30 @@
+from fastapi import APIRouter, HTTPException
+from fastapi.responses import RedirectResponse
+from starlette.concurrency import run_in_threadpool
+from access_log import note_cache
+from clicks import click_buffer
+from invalidation import now_ns
+from redirects import redirect_cache, load_target
+
+router = APIRouter(prefix="/r", tags=["Redirects"])
+
+@router.get("/{link_id}", response_class=RedirectResponse, status_code=302)
+async def follow_link(link_id: int):
+    """
+    Public short link: counts a click and redirects to the link's URL.
+    Hot links are answered from memory without a database round trip.
+    """
+    target = redirect_cache.get(link_id)
+    note_cache("redirect", target is not None)
+    if target is None:
+        read_at = now_ns()
+        target = await run_in_threadpool(load_target, link_id)
+        if target is None:
+            raise HTTPException(status_code=404, detail="Link not found")
+        redirect_cache.put(link_id, target, read_at)
+
+    if not (target.is_active and target.user_public):
+        raise HTTPException(status_code=404, detail="Link not found")
+
+    click_buffer.record(link_id)
+    return RedirectResponse(target.url, status_code=302)
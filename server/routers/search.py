@@ -0,0 +1,27 @@
+from fastapi import APIRouter, Depends, HTTPException, Query
+from sqlalchemy.orm import Session
+from typing import Optional
+from database import get_db
+from profiling import ProfiledRoute
+import schemas
+import search
+
+router = APIRouter(prefix="/search", tags=["Search"], route_class=ProfiledRoute)
+
+@router.get("", response_model=schemas.ProfileSearchResponse)
+def search_profiles(
+    q: str = Query(..., min_length=1, max_length=100),
+    limit: int = Query(20, ge=1, le=50),
+    cursor: Optional[str] = None,
+    db: Session = Depends(get_db)
+):
+    """
+    Public endpoint to find profiles by username, name, bio or link text.
+    Pass the returned next_cursor back as `cursor` to get the next page.
+    """
+    try:
+        rows, next_cursor = search.search_profiles(db, q, limit, cursor)
+    except search.InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+
+    return {"results": rows, "next_cursor": next_cursor}
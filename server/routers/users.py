@@ -1,22 +1,25 @@
-from fastapi import APIRouter, Depends, HTTPException, status,UploadFile,File
+import logging
+from fastapi import APIRouter, Depends, HTTPException, status,UploadFile,File, BackgroundTasks, Request
+from sqlalchemy import func
 from sqlalchemy.orm import Session
 from typing import List
 from database import get_db
+from profiling import ProfiledRoute
 import models
 import schemas
 from auth import get_current_active_user
-from supabase import create_client, Client
-from config import get_settings
+from clients import get_supabase
+from availability import availability_index, rebuild_availability_index
+from account_deletion import mark_deleted, purge_user
+from invalidation import publish
+from public_cache import cached_json_response
+import search
+from pageviews import page_view_buffer, visitor_id
 from datetime import datetime
 
-router = APIRouter(prefix="/users", tags=["Users"])
-settings = get_settings()
+logger = logging.getLogger(__name__)
 
-# Initialize Supabase client with service role key
-supabase: Client = create_client(
-    settings.SUPABASE_URL,
-    settings.SUPABASE_SERVICE_KEY  # Service role key
-)
+router = APIRouter(prefix="/users", tags=["Users"], route_class=ProfiledRoute)
 
 @router.get("/", response_model=List[schemas.UserResponse])
 def get_all_users(
@@ -39,10 +42,11 @@ def get_user(
         raise HTTPException(status_code=404, detail="User not found")
     return user
 
-@router.get("/username/{username}", response_model=schemas.PublicUserProfile)
-def get_user_by_username(username: str, db: Session = Depends(get_db)):
-    """Public endpoint to view user's linktree page"""
-    user = db.query(models.User).filter(models.User.username == username).first()
+def public_profile_payload(db: Session, username: str) -> tuple[int, bytes]:
+    user = db.query(models.User).filter(
+        func.lower(models.User.username) == username.lower(),
+        models.User.is_active == True
+    ).first()
     if not user:
         raise HTTPException(status_code=404, detail="User not found")
     
@@ -50,22 +54,45 @@ def get_user_by_username(username: str, db: Session = Depends(get_db)):
     if user.profile and not user.profile.is_public:
         raise HTTPException(status_code=403, detail="This profile is private")
     
-    # Get only active links, sorted by position
+    # Get only active links, in display order
     active_links = [link for link in user.links if link.is_active]
-    active_links.sort(key=lambda x: x.position)
+    active_links.sort(key=lambda x: (x.sort_key, x.id))
     
-    return {
+    payload = schemas.PublicUserProfile.model_validate({
         "username": user.username,
         "full_name": user.full_name,
         "bio": user.bio,
         "avatar_url": user.avatar_url,
         "profile": user.profile,
         "links": active_links
-    }
+    })
+    return user.id, payload.model_dump_json().encode()
+
+@router.get("/username/{username}", response_model=schemas.PublicUserProfile)
+def get_user_by_username(username: str, request: Request, db: Session = Depends(get_db)):
+    """Public endpoint to view user's linktree page"""
+    return cached_json_response(request, "profile", username, lambda: public_profile_payload(db, username))
+
+@router.post("/username/{username}/view", status_code=status.HTTP_204_NO_CONTENT)
+def record_profile_view(username: str, request: Request, db: Session = Depends(get_db)):
+    """Public beacon sent by the profile page; counted as a unique visitor per day"""
+    user_id = db.query(models.User.id).filter(
+        func.lower(models.User.username) == username.lower(),
+        models.User.is_active == True
+    ).scalar()
+    if user_id is None:
+        raise HTTPException(status_code=404, detail="User not found")
+
+    # X-Forwarded-For is client controlled; behind a proxy, run uvicorn with
+    # --forwarded-allow-ips set to it and request.client is the right-most untrusted hop
+    client_ip = request.client.host if request.client else ""
+    page_view_buffer.record(user_id, visitor_id(client_ip, request.headers.get("user-agent", "")))
+    return None
 
 @router.put("/me", response_model=schemas.UserResponse)
 def update_current_user(
     user_update: schemas.UserUpdate,
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
@@ -77,25 +104,49 @@ def update_current_user(
     
     # Check if username is being changed and if it's already taken
     if user_update.username and user_update.username != current_user.username:
-        existing = db.query(models.User).filter(models.User.username == user_update.username).first()
+        existing = db.query(models.User).filter(func.lower(models.User.username) == user_update.username).first()
         if existing:
             raise HTTPException(status_code=400, detail="Username already taken")
     
+    old_username, old_email = current_user.username, current_user.email
+
     # Update fields
     for field, value in user_update.model_dump(exclude_unset=True).items():
         setattr(current_user, field, value)
     
+    search.index_user(db, current_user.id)
     db.commit()
     db.refresh(current_user)
+    publish("user", current_user.id)
+
+    # Keep the signup availability index in sync
+    renamed = current_user.username != old_username
+    email_changed = current_user.email != old_email
+    if renamed or email_changed:
+        availability_index.add(
+            username=current_user.username if renamed else None,
+            email=current_user.email if email_changed else None,
+        )
+        availability_index.release()
+        if availability_index.needs_rebuild:
+            background_tasks.add_task(rebuild_availability_index)
+
     return current_user
 
 @router.delete("/me", status_code=status.HTTP_204_NO_CONTENT)
 def delete_current_user(
+    background_tasks: BackgroundTasks,
     db: Session = Depends(get_db),
     current_user: models.User = Depends(get_current_active_user)
 ):
-    db.delete(current_user)
-    db.commit()
+    """Deactivate the account now and delete its data in the background"""
+    user_id = current_user.id
+    mark_deleted(db, current_user)
+    background_tasks.add_task(purge_user, user_id)
+
+    availability_index.release()
+    if availability_index.needs_rebuild:
+        background_tasks.add_task(rebuild_availability_index)
     return None
 
 @router.post("/me/avatar/upload", response_model=schemas.UserResponse)
@@ -139,28 +190,29 @@ async def upload_avatar(
             try:
                 # Extract path from URL
                 old_path = current_user.avatar_url.split('/linktree-files/')[-1]
-                supabase.storage.from_('linktree-files').remove([old_path])
-            except Exception as e:
-                print(f"Error deleting old avatar: {e}")
+                get_supabase().storage.from_('linktree-files').remove([old_path])
+            except Exception:
+                logger.exception("Deleting old avatar of user %s failed", current_user.id)
         
         # Generate unique filename
         file_ext = file.filename.split('.')[-1]
         filename = f"{current_user.id}/{int(datetime.now().timestamp())}.{file_ext}"
         
         # Upload to Supabase Storage
-        response = supabase.storage.from_('linktree-files').upload(
+        response = get_supabase().storage.from_('linktree-files').upload(
             filename,
             contents,
             {"content-type": file.content_type}
         )
         
         # Get public URL
-        public_url = supabase.storage.from_('linktree-files').get_public_url(filename)
+        public_url = get_supabase().storage.from_('linktree-files').get_public_url(filename)
         
         # Update user in database
         current_user.avatar_url = public_url
         db.commit()
         db.refresh(current_user)
+        publish("user", current_user.id)
         
         return current_user
         
@@ -180,12 +232,13 @@ def remove_avatar(
         try:
             # Extract path and delete from storage
             path = current_user.avatar_url.split('/linktree-files/')[-1]
-            supabase.storage.from_('linktree-files').remove([path])
-        except Exception as e:
-            print(f"Error deleting avatar: {e}")
+            get_supabase().storage.from_('linktree-files').remove([path])
+        except Exception:
+            logger.exception("Deleting avatar of user %s failed", current_user.id)
     
     current_user.avatar_url = None
     db.commit()
     db.refresh(current_user)
+    publish("user", current_user.id)
     
     return current_user
\ No newline at end of file
@@ -0,0 +1,335 @@
+"""
+In-process scheduler for periodic work, started and stopped by the app lifespan.
+
+Jobs are plain functions (sync ones run on the background threads) scheduled either
+every N seconds (`every`) or on a cron expression (`cron`, five fields:
+minute hour day-of-month month day-of-week, supporting `*`, `*/n`, `a-b`,
+`a-b/n` and lists). Each run can be delayed by up to `jitter` seconds so that
+workers started together don't hit the database at the same instant.
+
+Jobs marked `leader_only` run in one worker of the whole deployment: the one
+holding the leader lock, a Postgres advisory lock (a file lock on SQLite, where
+there is only one host). Workers that aren't leader keep trying to take the
+lock, so leadership moves when the leader exits. Per-worker jobs (flushing
+that worker's buffers, syncing its caches) run everywhere.
+
+`stop()` lets running jobs finish, up to a deadline, before cancelling them
+(a sync job's thread can't be interrupted; it is left to finish on its own).
+`stats()` reports per-job run counts, failures and run times.
+"""
+import asyncio
+import hashlib
+import inspect
+import logging
+import os
+import random
+import tempfile
+import time
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta, timezone
+from typing import Callable, Optional
+from sqlalchemy import text
+from database import engine
+from threadpool import run_in_background_thread
+
+logger = logging.getLogger(__name__)
+
+# Advisory lock key shared by every worker (any stable 64-bit number)
+LEADER_LOCK_KEY = int.from_bytes(hashlib.sha256(b"linktree-scheduler").digest()[:8], "big", signed=True)
+LOCK_FILE = os.path.join(tempfile.gettempdir(), "linktree-scheduler.lock")
+# How often a follower tries to become leader, and the leader checks it still is
+LEADER_CHECK_SECONDS = 15
+DRAIN_TIMEOUT_SECONDS = 10
+
+
+class CronExpression:
+    FIELDS = (("minute", 0, 59), ("hour", 0, 23), ("day", 1, 31), ("month", 1, 12), ("weekday", 0, 6))
+
+    def __init__(self, expression: str):
+        parts = expression.split()
+        if len(parts) != len(self.FIELDS):
+            raise ValueError(f"Cron expression needs 5 fields: {expression!r}")
+        self.expression = expression
+        self.minute, self.hour, self.day, self.month, self.weekday = (
+            self._parse(part, low, high) for part, (_, low, high) in zip(parts, self.FIELDS)
+        )
+        self._any_day = parts[2] == "*"
+        self._any_weekday = parts[4] == "*"
+
+    @staticmethod
+    def _parse(part: str, low: int, high: int) -> set[int]:
+        values = set()
+        for item in part.split(","):
+            range_, _, step = item.partition("/")
+            if range_ == "*":
+                start, end = low, high
+            elif "-" in range_:
+                start, end = (int(value) for value in range_.split("-", 1))
+            else:
+                start = end = int(range_)
+            if start < low or end > high or start > end:
+                raise ValueError(f"Cron field out of range: {item!r}")
+            values.update(range(start, end + 1, int(step) if step else 1))
+        return values
+
+    def _day_matches(self, moment: datetime) -> bool:
+        # Sunday is 0 in cron, 6 in Python
+        weekday = (moment.weekday() + 1) % 7
+        if self._any_day or self._any_weekday:
+            return moment.day in self.day and weekday in self.weekday
+        # As in cron, restricting both fields means either may match
+        return moment.day in self.day or weekday in self.weekday
+
+    def next_after(self, moment: datetime) -> datetime:
+        """First matching minute strictly after `moment` (UTC)"""
+        candidate = moment.replace(second=0, microsecond=0) + timedelta(minutes=1)
+        limit = candidate + timedelta(days=366 * 4)
+        while candidate < limit:
+            if candidate.month not in self.month or not self._day_matches(candidate):
+                candidate = (candidate + timedelta(days=1)).replace(hour=0, minute=0)
+            elif candidate.hour not in self.hour:
+                candidate = (candidate + timedelta(hours=1)).replace(minute=0)
+            elif candidate.minute not in self.minute:
+                candidate += timedelta(minutes=1)
+            else:
+                return candidate
+        raise ValueError(f"Cron expression never matches: {self.expression!r}")
+
+
+@dataclass
+class Job:
+    name: str
+    func: Callable
+    interval: Optional[float] = None
+    cron: Optional[CronExpression] = None
+    jitter: float = 0
+    leader_only: bool = False
+    run_at_start: bool = False
+    # Metrics
+    runs: int = 0
+    failures: int = 0
+    skipped: int = 0
+    running: bool = False
+    last_started_at: Optional[datetime] = None
+    last_duration_ms: Optional[float] = None
+    max_duration_ms: float = 0
+    total_duration_ms: float = 0
+    last_error: Optional[str] = None
+    next_run_at: Optional[datetime] = field(default=None)
+
+    def seconds_until_next(self, first: bool) -> float:
+        now = datetime.now(timezone.utc)
+        if first and self.run_at_start:
+            delay = 0.0
+        elif self.cron is not None:
+            delay = (self.cron.next_after(now) - now).total_seconds()
+        else:
+            delay = self.interval
+        delay += random.uniform(0, self.jitter) if self.jitter else 0
+        self.next_run_at = now + timedelta(seconds=delay)
+        return delay
+
+    def stats(self) -> dict:
+        return {
+            "schedule": self.cron.expression if self.cron else f"every {self.interval:g}s",
+            "leader_only": self.leader_only,
+            "runs": self.runs,
+            "failures": self.failures,
+            "skipped": self.skipped,
+            "running": self.running,
+            "last_started_at": self.last_started_at,
+            "last_duration_ms": self.last_duration_ms,
+            "mean_duration_ms": round(self.total_duration_ms / self.runs, 2) if self.runs else None,
+            "max_duration_ms": round(self.max_duration_ms, 2),
+            "last_error": self.last_error,
+            "next_run_at": self.next_run_at,
+        }
+
+
+class PostgresLeaderLock:
+    """Session-level advisory lock, held on a connection kept out of the pool"""
+    def __init__(self):
+        self._connection = None
+
+    def try_acquire(self) -> bool:
+        if self._connection is not None:
+            try:
+                self._connection.execute(text("SELECT 1"))
+                return True
+            except Exception:
+                logger.warning("Scheduler leader lost its lock connection")
+                self.release()
+        connection = engine.connect()
+        try:
+            # The lock belongs to the database session, not to a transaction
+            connection = connection.execution_options(isolation_level="AUTOCOMMIT")
+            acquired = connection.execute(text("SELECT pg_try_advisory_lock(:key)"), {"key": LEADER_LOCK_KEY}).scalar()
+        except Exception:
+            connection.close()
+            raise
+        if not acquired:
+            connection.close()
+            return False
+        # Hold the connection for as long as we lead
+        connection.connection.detach()
+        self._connection = connection
+        return True
+
+    def release(self):
+        if self._connection is not None:
+            try:
+                self._connection.close()
+            except Exception:
+                pass
+            self._connection = None
+
+
+class FileLeaderLock:
+    """Exclusive lock on LOCK_FILE; only coordinates workers on one host"""
+    def __init__(self, path: str = LOCK_FILE):
+        self.path = path
+        self._file = None
+
+    def try_acquire(self) -> bool:
+        if self._file is not None:
+            return True
+        import fcntl
+
+        lock_file = open(self.path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError:
+            lock_file.close()
+            return False
+        self._file = lock_file
+        return True
+
+    def release(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+
+def make_leader_lock():
+    return PostgresLeaderLock() if engine.dialect.name == "postgresql" else FileLeaderLock()
+
+
+class Scheduler:
+    def __init__(self):
+        self.jobs: dict[str, Job] = {}
+        self.is_leader = False
+        self._lock = None
+        self._tasks: list[asyncio.Task] = []
+        self._stopping = asyncio.Event()
+        self._running: set[asyncio.Task] = set()
+
+    def every(self, seconds: float, name: str, func: Callable, **options) -> Job:
+        return self._add(Job(name, func, interval=seconds, **options))
+
+    def cron(self, expression: str, name: str, func: Callable, **options) -> Job:
+        return self._add(Job(name, func, cron=CronExpression(expression), **options))
+
+    def _add(self, job: Job) -> Job:
+        if job.name in self.jobs:
+            raise ValueError(f"Duplicate job {job.name!r}")
+        self.jobs[job.name] = job
+        return job
+
+    async def start(self, leader_lock=None):
+        self._stopping = asyncio.Event()
+        self._lock = leader_lock or make_leader_lock()
+        await self._check_leadership()
+        self._tasks = [asyncio.create_task(self._run_leader_checks())]
+        self._tasks += [asyncio.create_task(self._run_job(job)) for job in self.jobs.values()]
+        logger.info("Scheduler started with %s jobs (leader: %s)", len(self.jobs), self.is_leader)
+
+    async def stop(self, timeout: float = DRAIN_TIMEOUT_SECONDS):
+        """Stop scheduling, give running jobs `timeout` seconds to finish, then cancel them"""
+        self._stopping.set()
+        if self._running:
+            _, pending = await asyncio.wait(self._running, timeout=timeout)
+            for task in pending:
+                if inspect.iscoroutinefunction(self.jobs[task.get_name()].func):
+                    logger.warning("Scheduler job %s still running at shutdown, cancelling", task.get_name())
+                else:
+                    # Cancelling only stops waiting; the thread runs on
+                    logger.warning("Scheduler job %s still running at shutdown in a thread, abandoning it", task.get_name())
+                task.cancel()
+            await asyncio.gather(*pending, return_exceptions=True)
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        if self._lock is not None:
+            await run_in_background_thread(self._lock.release)
+        self.is_leader = False
+
+    async def _check_leadership(self):
+        try:
+            leader = await run_in_background_thread(self._lock.try_acquire)
+        except Exception:
+            logger.exception("Scheduler leader election failed")
+            leader = False
+        if leader != self.is_leader:
+            logger.info("Scheduler %s leadership", "took" if leader else "lost")
+        self.is_leader = leader
+
+    async def _run_leader_checks(self):
+        while not self._stopping.is_set():
+            await self._sleep(LEADER_CHECK_SECONDS)
+            if not self._stopping.is_set():
+                await self._check_leadership()
+
+    async def _sleep(self, seconds: float):
+        """Sleep, waking early when the scheduler stops"""
+        try:
+            await asyncio.wait_for(self._stopping.wait(), timeout=max(0.0, seconds))
+        except asyncio.TimeoutError:
+            pass
+
+    async def _run_job(self, job: Job):
+        first = True
+        while not self._stopping.is_set():
+            await self._sleep(job.seconds_until_next(first))
+            first = False
+            if self._stopping.is_set():
+                return
+            if job.leader_only and not self.is_leader:
+                job.skipped += 1
+                continue
+            # Shielded so that shutdown drains it instead of cancelling mid-run
+            run = asyncio.create_task(self._execute(job), name=job.name)
+            self._running.add(run)
+            run.add_done_callback(self._running.discard)
+            await asyncio.shield(run)
+
+    async def _execute(self, job: Job):
+        job.running = True
+        job.last_started_at = datetime.now(timezone.utc)
+        started = time.perf_counter()
+        try:
+            if inspect.iscoroutinefunction(job.func):
+                await job.func()
+            else:
+                await run_in_background_thread(job.func)
+            job.last_error = None
+        except Exception as exc:
+            job.failures += 1
+            job.last_error = repr(exc)
+            logger.exception("Scheduled job %s failed", job.name)
+        finally:
+            duration_ms = (time.perf_counter() - started) * 1000
+            job.runs += 1
+            job.running = False
+            job.last_duration_ms = round(duration_ms, 2)
+            job.total_duration_ms += duration_ms
+            job.max_duration_ms = max(job.max_duration_ms, duration_ms)
+
+    def stats(self) -> dict:
+        return {
+            "leader": self.is_leader,
+            "lock": type(self._lock).__name__ if self._lock else None,
+            "jobs": {name: job.stats() for name, job in self.jobs.items()},
+        }
+
+
+scheduler = Scheduler()
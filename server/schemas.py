@@ -1,7 +1,7 @@
 from enum import Enum
-from pydantic import BaseModel, EmailStr, Field, HttpUrl
+from pydantic import BaseModel, EmailStr, Field, HttpUrl, field_validator
 from typing import Optional, List
-from datetime import datetime
+from datetime import datetime, date
 
 # ============ AUTH SCHEMAS ============
 class Token(BaseModel):
@@ -41,12 +41,20 @@ class ResetPasswordResponse(BaseModel):
     message: str
 
 # ============ USER SCHEMAS ============
+def canonical_username(username):
+    # Usernames are case-insensitive and stored lowercase. Runs before the
+    # Field length checks so they apply to the normalized value; anything
+    # but a string is left for the type check to reject.
+    return username.strip().lower() if isinstance(username, str) else username
+
 class UserBase(BaseModel):
     email: EmailStr
     username: str = Field(..., min_length=3, max_length=50)
     full_name: str = Field(None, max_length=100)
     bio: Optional[str] = None
 
+    _canonical_username = field_validator("username", mode="before")(canonical_username)
+
 class UserCreate(UserBase):
     password: str = Field(..., min_length=6)
 
@@ -57,6 +65,8 @@ class UserUpdate(BaseModel):
     bio: Optional[str] = None
     avatar_url: Optional[str] = None
 
+    _canonical_username = field_validator("username", mode="before")(canonical_username)
+
 class UserResponse(UserBase):
     id: int
     avatar_url: Optional[str]
@@ -100,6 +110,15 @@ class ProfileResponse(ProfileBase):
     class Config:
         from_attributes = True
 
+class DailyProfileViews(BaseModel):
+    day: date
+    unique_visitors: int
+
+class ProfileViewsResponse(BaseModel):
+    # Estimated unique visitors over the whole range (not the sum of the days)
+    unique_visitors: int
+    days: List[DailyProfileViews]
+
 # ============ LINK SCHEMAS ============
 class LinkType(str, Enum):
     BUTTON = "button"
@@ -150,6 +169,11 @@ class LinkUpdate(BaseModel):
 class LinkResponse(LinkBase):
     id: int
     user_id: int
+    sort_key: str
+    # "ok", "broken" or "unreachable"; None until the link has been checked
+    health_status: Optional[str] = None
+    health_status_code: Optional[int] = None
+    health_checked_at: Optional[datetime] = None
     created_at: datetime
     updated_at: Optional[datetime]
     
@@ -160,6 +184,21 @@ class LinkReorder(BaseModel):
     link_id: int
     new_position: int
 
+class LinkMove(BaseModel):
+    # New neighbours of the link: it goes right after `after_id` and right before `before_id`
+    after_id: Optional[int] = None
+    before_id: Optional[int] = None
+
+class LinkImportError(BaseModel):
+    row: int
+    errors: List[str]
+
+class LinkImportResponse(BaseModel):
+    imported: int
+    failed: int
+    # At most the first 100 failed rows are listed
+    errors: List[LinkImportError]
+
 # ============ PUBLIC PROFILE SCHEMAS ============
 class PublicUserProfile(BaseModel):
     username: str
@@ -170,4 +209,16 @@ class PublicUserProfile(BaseModel):
     links: List[LinkResponse]
     
     class Config:
-        from_attributes = True
\ No newline at end of file
+        from_attributes = True
+
+# ============ SEARCH SCHEMAS ============
+class ProfileSearchResult(BaseModel):
+    username: str
+    full_name: Optional[str]
+    bio: Optional[str]
+    avatar_url: Optional[str]
+    rank: float
+
+class ProfileSearchResponse(BaseModel):
+    results: List[ProfileSearchResult]
+    next_cursor: Optional[str] = None
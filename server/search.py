@@ -0,0 +1,150 @@
+"""
+Full-text search over public profiles.
+
+Every user has one search document made of their username, full name and bio
+plus the titles and descriptions of their active links. On Postgres it lives
+in the `users.search_vector` tsvector column (GIN indexed), on SQLite in the
+`user_search` FTS5 table. Write handlers call `index_user` before committing
+so the document is refreshed in the same transaction.
+
+Results are ranked (ts_rank_cd / bm25) and paginated with an opaque keyset
+cursor over (rank, user id), so deep pages cost the same as the first one.
+"""
+import base64
+import binascii
+import re
+from typing import Optional
+from sqlalchemy import text
+from sqlalchemy.orm import Session
+
+MAX_TERMS = 8
+
+_POSTGRES_INDEX_SQL = """
+UPDATE users SET search_vector =
+    setweight(to_tsvector('simple', coalesce(username, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(full_name, '')), 'A') ||
+    setweight(to_tsvector('simple', coalesce(bio, '')), 'B') ||
+    setweight(to_tsvector('simple', coalesce((
+        SELECT string_agg(links.title || ' ' || coalesce(links.description, ''), ' ')
+        FROM links WHERE links.user_id = users.id AND links.is_active
+    ), '')), 'C')
+WHERE id = :user_id
+"""
+
+_SQLITE_INDEX_SQL = """
+INSERT INTO user_search (rowid, username, full_name, bio, links)
+SELECT id, username, coalesce(full_name, ''), coalesce(bio, ''), coalesce((
+    SELECT group_concat(links.title || ' ' || coalesce(links.description, ''), ' ')
+    FROM links WHERE links.user_id = users.id AND links.is_active
+), '')
+FROM users WHERE id = :user_id
+"""
+
+# Higher rank is better on both backends (bm25 is negated)
+_POSTGRES_SEARCH_SQL = """
+SELECT * FROM (
+    SELECT users.id, users.username, users.full_name, users.bio, users.avatar_url,
+           ts_rank_cd(users.search_vector, query) AS rank
+    FROM users
+    CROSS JOIN to_tsquery('simple', :query) AS query
+    LEFT JOIN profiles ON profiles.user_id = users.id
+    WHERE users.search_vector @@ query
+      AND users.is_active AND coalesce(profiles.is_public, true)
+) AS hits
+{keyset}
+ORDER BY rank DESC, id
+LIMIT :limit
+"""
+
+_SQLITE_SEARCH_SQL = """
+SELECT * FROM (
+    SELECT users.id, users.username, users.full_name, users.bio, users.avatar_url,
+           -bm25(user_search, 10.0, 10.0, 5.0, 2.0) AS rank
+    FROM user_search
+    JOIN users ON users.id = user_search.rowid
+    LEFT JOIN profiles ON profiles.user_id = users.id
+    WHERE user_search MATCH :query
+      AND users.is_active AND coalesce(profiles.is_public, 1)
+) AS hits
+{keyset}
+ORDER BY rank DESC, id
+LIMIT :limit
+"""
+
+_KEYSET_SQL = "WHERE rank < :cursor_rank OR (rank = :cursor_rank AND id > :cursor_id)"
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def _dialect(db: Session) -> str:
+    return db.get_bind().dialect.name
+
+
+def index_user(db: Session, user_id: int):
+    """Rebuild a user's search document inside the current transaction"""
+    # Pending ORM changes must reach the database before the document is built from it
+    db.flush()
+    if _dialect(db) == "postgresql":
+        db.execute(text(_POSTGRES_INDEX_SQL), {"user_id": user_id})
+    else:
+        remove_user(db, user_id)
+        db.execute(text(_SQLITE_INDEX_SQL), {"user_id": user_id})
+
+
+def remove_user(db: Session, user_id: int):
+    # On Postgres the document is a column and goes away with the row
+    if _dialect(db) == "sqlite":
+        db.execute(text("DELETE FROM user_search WHERE rowid = :user_id"), {"user_id": user_id})
+
+
+def _terms(q: str) -> list[str]:
+    # Letters and digits only: both backends split words on underscores and punctuation
+    return re.findall(r"[^\W_]+", q.lower())[:MAX_TERMS]
+
+
+def encode_cursor(rank: float, user_id: int) -> str:
+    # repr() round-trips floats exactly, so the keyset comparison is exact too
+    return base64.urlsafe_b64encode(f"{float(rank)!r}:{user_id}".encode()).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> tuple[float, int]:
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        rank, user_id = base64.urlsafe_b64decode(padded).decode().split(":")
+        return float(rank), int(user_id)
+    except (binascii.Error, UnicodeDecodeError, ValueError):
+        raise InvalidCursor("Invalid cursor")
+
+
+def search_profiles(db: Session, q: str, limit: int, cursor: Optional[str] = None):
+    """Return (rows, next_cursor) for a prefix search over profile documents"""
+    terms = _terms(q)
+    if not terms:
+        return [], None
+
+    # Every term must match as a prefix so results update while typing
+    dialect = _dialect(db)
+    if dialect == "postgresql":
+        sql = _POSTGRES_SEARCH_SQL
+        query = " & ".join(f"{term}:*" for term in terms)
+    else:
+        sql = _SQLITE_SEARCH_SQL
+        query = " ".join(f'"{term}"*' for term in terms)
+
+    params = {"query": query, "limit": limit + 1}
+    if cursor:
+        cursor_rank, cursor_id = decode_cursor(cursor)
+        params.update(cursor_rank=cursor_rank, cursor_id=cursor_id)
+        sql = sql.format(keyset=_KEYSET_SQL)
+    else:
+        sql = sql.format(keyset="")
+
+    rows = db.execute(text(sql), params).mappings().all()
+
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]["rank"], rows[-1]["id"])
+    return rows, next_cursor
@@ -3,6 +3,8 @@ from database import Base, engine, SessionLocal
 from models import User, Profile, Link,SocialPlatform, LinkType
 from sqlalchemy.exc import IntegrityError
 from auth import get_password_hash
+from search import index_user
+from ordering import spread_keys
 
 
 def seed_data():
@@ -88,6 +90,7 @@ def seed_data():
                 description="My personal web development projects",
                 thumbnail_url=None,
                 position=1,
+                sort_key=spread_keys(2)[0],
                 is_active=True,
             ),
             Link(
@@ -99,6 +102,7 @@ def seed_data():
                 description=None,
                 thumbnail_url=None,
                 position=2,
+                sort_key=spread_keys(2)[1],
                 is_active=True,
             ),
             Link(
@@ -110,11 +114,16 @@ def seed_data():
                 description=None,
                 thumbnail_url=None,
                 position=1,
+                sort_key=spread_keys(1)[0],
                 is_active=True,
             ),
         ]
 
         db.add_all(links)
+
+        # ---- SEARCH DOCUMENTS ----
+        for user in (user1, user2):
+            index_user(db, user.id)
         db.commit()
 
         print("✅ Database seeded successfully!")
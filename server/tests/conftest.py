@@ -0,0 +1,46 @@
+"""
+Shared test setup: the app's modules import flat from server/, and settings
+come from the environment, so both are prepared before anything is imported.
+Tests run against an in-memory SQLite database and make no outside requests.
+"""
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+for name, value in {
+    "DATABASE_URL": "sqlite://",
+    "SECRET_KEY": "test-secret",
+    "REFRESH_SECRET_KEY": "test-refresh-secret",
+    "ALGORITHM": "HS256",
+    "ACCESS_TOKEN_EXPIRE_MINUTES": "30",
+    "REFRESH_TOKEN_EXPIRE_DAYS": "7",
+    "COOKIE_SECURE": "false",
+    "COOKIE_SAMESITE": "lax",
+    "BACKEND_CORS_ORIGINS": "http://localhost:5173",
+    "SUPABASE_URL": "http://localhost:1",
+    "SUPABASE_SERVICE_KEY": "test",
+    "MAIL_USERNAME": "test",
+    "MAIL_PASSWORD": "test",
+    "MAIL_FROM": "test@example.com",
+    "MAIL_SERVER": "localhost",
+    "MAIL_PORT": "25",
+    "FRONTEND_URL": "http://localhost:5173",
+}.items():
+    os.environ.setdefault(name, value)
+
+import pytest
+
+
+@pytest.fixture
+def db():
+    from database import Base, SessionLocal, engine
+    import models  # noqa: F401
+
+    Base.metadata.create_all(bind=engine)
+    session = SessionLocal()
+    try:
+        yield session
+    finally:
+        session.close()
+        Base.metadata.drop_all(bind=engine)
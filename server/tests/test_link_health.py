@@ -0,0 +1,174 @@
+"""Link health checks against a stand-in HTTP server on 127.0.0.1"""
+import asyncio
+import http.server
+import threading
+import time
+
+import pytest
+
+import link_health
+import models
+from url_safety import UnsafeUrl
+
+
+class StandIn(http.server.ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self):
+        super().__init__(("127.0.0.1", 0), StandInHandler)
+        self.requests: list[tuple[str, str, dict]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.lock = threading.Lock()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server_address[1]}{path}"
+
+    def hits(self, path: str) -> list[str]:
+        return [method for method, hit_path, _ in self.requests if hit_path == path]
+
+
+class StandInHandler(http.server.BaseHTTPRequestHandler):
+    def log_message(self, *args):
+        pass
+
+    def _respond(self, status: int, headers: dict = {}, body: bytes = b""):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if self.command == "GET":
+            self.wfile.write(body)
+
+    def _handle(self):
+        server: StandIn = self.server
+        with server.lock:
+            server.requests.append((self.command, self.path, dict(self.headers)))
+            server.in_flight += 1
+            server.max_in_flight = max(server.max_in_flight, server.in_flight)
+        try:
+            if self.path.startswith("/slow"):
+                time.sleep(0.1)
+            if self.path == "/no-head" and self.command == "HEAD":
+                return self._respond(405)
+            if self.path == "/not-implemented" and self.command == "HEAD":
+                return self._respond(501)
+            if self.path == "/gone":
+                return self._respond(404)
+            if self.path == "/to-internal":
+                return self._respond(302, {"Location": "/internal"})
+            if self.path == "/moved":
+                return self._respond(301, {"Location": "/page"})
+            if self.headers.get("If-None-Match") == '"v1"':
+                return self._respond(304, {"ETag": '"v1"'})
+            self._respond(200, {"ETag": '"v1"'}, b"ok")
+        finally:
+            with server.lock:
+                server.in_flight -= 1
+
+    do_HEAD = do_GET = _handle
+
+
+@pytest.fixture
+def server():
+    stand_in = StandIn()
+    thread = threading.Thread(target=stand_in.serve_forever, daemon=True)
+    thread.start()
+    yield stand_in
+    stand_in.shutdown()
+    stand_in.server_close()
+
+
+@pytest.fixture
+def allow_loopback(monkeypatch):
+    """The stand-in is on loopback, which the public address check refuses"""
+    async def public_address(url: str) -> str:
+        if "/internal" in url:
+            raise UnsafeUrl(url)
+        return "127.0.0.1"
+    monkeypatch.setattr(link_health, "public_address", public_address)
+
+
+def check(urls: dict) -> dict:
+    return asyncio.run(link_health.check_urls(urls))
+
+
+def test_head_ok(server, allow_loopback):
+    result = check({server.url("/page"): None})[server.url("/page")]
+    assert (result.status, result.status_code, result.etag) == ("ok", 200, '"v1"')
+    assert server.hits("/page") == ["HEAD"]
+
+
+@pytest.mark.parametrize("path", ["/no-head", "/not-implemented"])
+def test_falls_back_to_get_when_head_unsupported(server, allow_loopback, path):
+    result = check({server.url(path): None})[server.url(path)]
+    assert (result.status, result.status_code) == ("ok", 200)
+    assert server.hits(path) == ["HEAD", "GET"]
+
+
+def test_broken_link(server, allow_loopback):
+    result = check({server.url("/gone"): None})[server.url("/gone")]
+    assert (result.status, result.status_code) == ("broken", 404)
+
+
+def test_conditional_request_reuses_stored_result(server, allow_loopback):
+    previous = models.UrlCheck(status="ok", status_code=200, etag='"v1"', last_modified=None)
+    result = check({server.url("/page"): previous})[server.url("/page")]
+    assert (result.status, result.status_code, result.etag) == ("ok", 200, '"v1"')
+    method, _, headers = server.requests[0]
+    assert method == "HEAD" and headers["If-None-Match"] == '"v1"'
+
+
+def test_validators_are_only_sent_to_the_original_url(server, allow_loopback):
+    previous = models.UrlCheck(status="ok", status_code=200, etag='"v1"', last_modified=None)
+    result = check({server.url("/moved"): previous})[server.url("/moved")]
+    # /page answers 200 rather than 304: it never saw the validator
+    assert (result.status, result.status_code) == ("ok", 200)
+    headers = {path: hit_headers for _, path, hit_headers in server.requests}
+    assert headers["/moved"]["If-None-Match"] == '"v1"'
+    assert "If-None-Match" not in headers["/page"]
+
+
+def test_connects_to_the_checked_address(server, allow_loopback):
+    # The name doesn't resolve: the request has to go to the address the check returned
+    url = f"http://rebind.invalid:{server.server_address[1]}/page"
+    result = check({url: None})[url]
+    assert (result.status, result.status_code) == ("ok", 200)
+    _, _, headers = server.requests[0]
+    assert headers["Host"] == f"rebind.invalid:{server.server_address[1]}"
+
+
+def test_per_host_concurrency_cap(server, allow_loopback):
+    urls = {server.url(f"/slow/{n}"): None for n in range(8)}
+    results = check(urls)
+    assert all(result.status == "ok" for result in results.values())
+    assert server.max_in_flight == link_health.PER_HOST_CONCURRENCY
+
+
+def test_internal_addresses_are_not_requested(server):
+    result = check({server.url("/page"): None})[server.url("/page")]
+    assert result.status == "unreachable"
+    assert server.requests == []
+
+
+def test_redirect_to_internal_address_is_not_followed(server, allow_loopback):
+    result = check({server.url("/to-internal"): None})[server.url("/to-internal")]
+    assert result.status == "unreachable"
+    assert server.hits("/internal") == []
+
+
+def test_one_fetch_per_url_shared_by_links(server, allow_loopback, db):
+    user = models.User(email="a@example.com", username="a", hashed_password="x")
+    db.add(user)
+    db.flush()
+    shared, single = server.url("/shared"), server.url("/single")
+    for n, url in enumerate([shared, shared, shared, single]):
+        db.add(models.Link(user_id=user.id, title=f"link {n}", url=url, sort_key=f"a{n}"))
+    db.commit()
+
+    assert asyncio.run(link_health.run_link_health_check()) == 2
+    assert server.hits("/shared") == ["HEAD"]
+    assert server.hits("/single") == ["HEAD"]
+    db.expire_all()
+    assert {link.health_status for link in db.query(models.Link)} == {"ok"}
@@ -0,0 +1,46 @@
+"""Bulk link import and its size limit"""
+import io
+import json
+
+import pytest
+
+import link_import
+import models
+
+ROWS = [{"title": f"link {n}", "url": f"https://example.com/{n}"} for n in range(50)]
+FILES = {
+    "csv": "title,url\n" + "".join(f"{row['title']},{row['url']}\n" for row in ROWS),
+    "ndjson": "".join(json.dumps(row) + "\n" for row in ROWS),
+    "json": json.dumps(ROWS),
+}
+
+
+@pytest.fixture
+def user(db):
+    user = models.User(email="a@example.com", username="a", hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+@pytest.mark.parametrize("format_", FILES)
+def test_import(db, user, format_):
+    result = link_import.import_links(db, user.id, io.BytesIO(FILES[format_].encode()), format_)
+    db.commit()
+    assert (result.imported, result.failed) == (50, 0)
+    titles = [link.title for link in db.query(models.Link).order_by(models.Link.sort_key)]
+    assert titles == [row["title"] for row in ROWS]
+
+
+@pytest.mark.parametrize("format_", FILES)
+def test_size_limit_is_enforced_while_reading(db, user, monkeypatch, format_):
+    # Nothing tells the reader the size up front
+    monkeypatch.setattr(link_import, "MAX_IMPORT_BYTES", 1000)
+    with pytest.raises(link_import.ImportTooLarge):
+        link_import.import_links(db, user.id, io.BytesIO(FILES[format_].encode()), format_)
+
+
+def test_file_at_the_limit_is_accepted(db, user, monkeypatch):
+    body = FILES["ndjson"].encode()
+    monkeypatch.setattr(link_import, "MAX_IMPORT_BYTES", len(body))
+    assert link_import.import_links(db, user.id, io.BytesIO(body), "ndjson").imported == 50
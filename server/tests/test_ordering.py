@@ -0,0 +1,79 @@
+"""Fractional ordering keys"""
+import pytest
+
+import models
+from ordering import MAX_KEY_LENGTH, key_between, needs_rebalance, rebalance_links, spread_keys
+
+
+def test_first_key():
+    assert key_between(None, None) == "V"
+
+
+def test_open_ends():
+    assert key_between(None, "V") < "V"
+    assert key_between(None, "01") < "01"
+    assert key_between("V", None) > "V"
+    assert key_between("z", None) > "z"
+
+
+@pytest.mark.parametrize("before, after", [("a", "b"), ("a", "a1"), ("az", "b"), ("a0V", "a1")])
+def test_between_neighbours(before, after):
+    assert before < key_between(before, after) < after
+
+
+@pytest.mark.parametrize("before, after", [("a", "a"), ("b", "a"), ("a", "a0"), ("a0", "a")])
+def test_equal_or_out_of_order_keys(before, after):
+    with pytest.raises(ValueError):
+        key_between(before, after)
+
+
+def test_keys_never_end_in_zero():
+    keys = [key_between(None, "1"), key_between("a", "a1"), key_between("z", None)]
+    assert not any(key.endswith("0") for key in keys)
+
+
+def test_repeated_inserts_at_the_same_point_trigger_rebalance():
+    before, after = "a", "b"
+    for inserts in range(1, 1000):
+        key = key_between(before, after)
+        assert before < key < after
+        if needs_rebalance(key):
+            break
+        after = key
+    assert len(key) == MAX_KEY_LENGTH + 1
+    assert inserts > MAX_KEY_LENGTH
+
+
+def test_appends_grow_slowly():
+    key = key_between(None, None)
+    for _ in range(200):
+        key = key_between(key, None)
+    assert len(key) < 5
+
+
+def test_spread_keys():
+    keys = spread_keys(1000)
+    assert keys == sorted(keys) and len(set(keys)) == 1000
+    assert all(key and not key.endswith("0") for key in keys)
+
+
+def test_rebalance_keeps_order(db):
+    user = models.User(email="a@example.com", username="a", hashed_password="x")
+    db.add(user)
+    db.flush()
+    before, after, keys = "a", "b", []
+    for _ in range(30):
+        after = key_between(before, after)
+        keys.append(after)
+    # Each key sorts before the previous one, so ids run against the key order
+    for n, key in enumerate(keys):
+        db.add(models.Link(user_id=user.id, title=f"link {n}", url="https://example.com", sort_key=key))
+    db.commit()
+    order = [link.id for link in db.query(models.Link).order_by(models.Link.sort_key)]
+
+    rebalance_links(user.id)
+
+    db.expire_all()
+    links = db.query(models.Link).order_by(models.Link.sort_key).all()
+    assert [link.id for link in links] == order
+    assert all(len(link.sort_key) <= 2 for link in links)
@@ -0,0 +1,102 @@
+"""Encoding negotiation and conditional requests for the cached public payloads"""
+import json
+
+import pytest
+from fastapi import FastAPI, Request
+from fastapi.testclient import TestClient
+
+from invalidation import publish
+from public_cache import brotli, cached_json_response, choose_encoding, public_cache
+
+ALL = {"identity", "gzip", "br"}
+BODY = json.dumps({"links": [{"title": f"link {n}", "url": "https://example.com"} for n in range(20)]}).encode()
+
+
+@pytest.mark.parametrize("header, expected", [
+    (None, "identity"),
+    ("", "identity"),
+    ("gzip", "gzip"),
+    ("gzip, br", "br"),
+    ("br;q=1.0, gzip;q=1.0", "br"),
+    ("gzip;q=1.0, br;q=0.5", "gzip"),
+    ("GZIP", "gzip"),
+    ("identity", "identity"),
+    ("*", "br"),
+    ("*;q=0.5, gzip", "gzip"),
+    ("br;q=0, gzip;q=0", "identity"),
+    ("br;q=0, *", "gzip"),
+    ("deflate", "identity"),
+    ("br;q=bogus, gzip", "gzip"),
+])
+def test_choose_encoding(header, expected):
+    assert choose_encoding(header, ALL) == expected
+
+
+def test_only_available_encodings_are_chosen():
+    assert choose_encoding("br, gzip", {"identity", "gzip"}) == "gzip"
+    assert choose_encoding("br", {"identity"}) == "identity"
+
+
+@pytest.fixture
+def client():
+    builds = []
+
+    def build():
+        builds.append(1)
+        return 1, BODY
+
+    app = FastAPI()
+
+    @app.get("/links/user/{username}")
+    def links(request: Request, username: str):
+        return cached_json_response(request, "links", username, build)
+
+    public_cache.clear()
+    with TestClient(app) as test_client:
+        test_client.builds = builds
+        yield test_client
+    public_cache.clear()
+
+
+def get(client, **headers):
+    return client.get("/links/user/Alice", headers=headers)
+
+
+@pytest.mark.parametrize("accept, encoding", [
+    pytest.param("br", "br", marks=pytest.mark.skipif(brotli is None, reason="brotli not installed")),
+    ("gzip", "gzip"),
+    ("identity", None),
+])
+def test_serves_the_negotiated_encoding(client, accept, encoding):
+    response = get(client, **{"Accept-Encoding": accept})
+    assert response.status_code == 200
+    assert response.headers.get("Content-Encoding") == encoding
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert response.json() == json.loads(BODY)
+
+
+def test_built_once_per_username(client):
+    get(client, **{"Accept-Encoding": "br"})
+    get(client, **{"Accept-Encoding": "gzip"})
+    client.get("/links/user/alice")
+    assert len(client.builds) == 1
+
+
+def test_not_modified(client):
+    etag = get(client).headers["ETag"]
+
+    response = get(client, **{"If-None-Match": etag, "Accept-Encoding": "gzip"})
+    assert response.status_code == 304
+    assert response.content == b""
+    assert response.headers["ETag"] == etag
+    assert response.headers["Vary"] == "Accept-Encoding"
+    assert "Content-Encoding" not in response.headers
+
+    assert get(client, **{"If-None-Match": 'W/"other"'}).status_code == 200
+
+
+def test_invalidation_rebuilds(client):
+    get(client)
+    publish("link", 1)
+    get(client)
+    assert len(client.builds) == 2
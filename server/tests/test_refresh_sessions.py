@@ -0,0 +1,110 @@
+"""Refresh token rotation, reuse detection and the revocation cache"""
+import asyncio
+from datetime import timedelta
+
+import pytest
+from fastapi import HTTPException
+
+import auth
+import models
+from refresh_sessions import (
+    RevocationCache,
+    _utcnow,
+    revoke_session,
+    revoke_user_sessions,
+    rotate_session,
+    start_session,
+)
+
+
+def make_user(db, name: str) -> models.User:
+    user = models.User(email=f"{name}@example.com", username=name, hashed_password="x")
+    db.add(user)
+    db.commit()
+    return user
+
+
+def login(db, user: models.User) -> tuple[str, str]:
+    family_id, jti = start_session(db, user.id)
+    db.commit()
+    return family_id, jti
+
+
+def rejected(call) -> str:
+    with pytest.raises(HTTPException) as exc_info:
+        call()
+    assert exc_info.value.status_code == 401
+    return exc_info.value.detail
+
+
+def age_last_use(db, family_id: str):
+    """Move the last rotation out of the grace window for concurrent refreshes"""
+    db.query(models.RefreshSession).filter(models.RefreshSession.family_id == family_id).update(
+        {"last_used_at": _utcnow() - timedelta(minutes=5)}, synchronize_session=False
+    )
+    db.commit()
+
+
+def test_rotation(db):
+    family_id, jti = login(db, make_user(db, "alice"))
+
+    new_jti = rotate_session(db, family_id, jti)
+    assert new_jti != jti
+    session = db.query(models.RefreshSession).filter_by(family_id=family_id).one()
+    assert (session.current_jti, session.previous_jti, session.revoked_at) == (new_jti, jti, None)
+    # The new token rotates in turn
+    assert rotate_session(db, family_id, new_jti) not in (jti, new_jti)
+
+
+def test_rotated_token_within_grace_is_rejected_without_revoking(db):
+    family_id, jti = login(db, make_user(db, "alice"))
+    new_jti = rotate_session(db, family_id, jti)
+
+    assert rejected(lambda: rotate_session(db, family_id, jti)) == "Refresh token already used"
+    rotate_session(db, family_id, new_jti)
+
+
+def test_replayed_token_revokes_the_family(db):
+    family_id, jti = login(db, make_user(db, "alice"))
+    new_jti = rotate_session(db, family_id, jti)
+    age_last_use(db, family_id)
+
+    assert rejected(lambda: rotate_session(db, family_id, jti)) == "Refresh token reuse detected"
+    session = db.query(models.RefreshSession).filter_by(family_id=family_id).one()
+    assert session.revoked_reason == "reuse"
+    # The legitimate holder's current token dies with the family
+    assert rejected(lambda: rotate_session(db, family_id, new_jti)) == "Session has been revoked"
+
+
+def test_access_tokens_of_revoked_family_rejected_after_sync(db, monkeypatch):
+    user = make_user(db, "alice")
+    family_id, _ = login(db, user)
+    token = auth.create_access_token({"sub": user.email, "user_id": user.id, "fid": family_id})
+
+    # This worker's cache; revoke_session below runs as if on another worker
+    worker = RevocationCache()
+    worker.load(db)
+    monkeypatch.setattr(auth, "revocation_cache", worker)
+    current_user = lambda: asyncio.run(auth.get_current_user(token=token, db=db))
+    assert current_user().id == user.id
+
+    revoke_session(db, family_id)
+    assert not worker.is_recently_revoked(family_id)
+    assert current_user().id == user.id
+
+    worker.sync(db)
+    assert worker.is_recently_revoked(family_id) and worker.maybe_revoked(family_id)
+    assert rejected(current_user) == "Could not validate credentials"
+
+
+def test_logout_all(db):
+    alice, bob = make_user(db, "alice"), make_user(db, "bob")
+    phone, laptop, other = login(db, alice), login(db, alice), login(db, bob)
+
+    revoke_user_sessions(db, alice.id)
+
+    for family_id, jti in (phone, laptop):
+        assert rejected(lambda: rotate_session(db, family_id, jti)) == "Session has been revoked"
+    assert rotate_session(db, *other)
+    reasons = {s.family_id: s.revoked_reason for s in db.query(models.RefreshSession)}
+    assert reasons == {phone[0]: "logout_all", laptop[0]: "logout_all", other[0]: None}
@@ -0,0 +1,114 @@
+"""Cron parsing and the scheduler's leader and shutdown handling"""
+import asyncio
+from datetime import datetime, timezone
+
+import pytest
+
+from scheduler import CronExpression, Scheduler
+
+
+def at(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+class NeverLeader:
+    def try_acquire(self) -> bool:
+        return False
+
+    def release(self):
+        pass
+
+
+class AlwaysLeader(NeverLeader):
+    def try_acquire(self) -> bool:
+        return True
+
+
+def test_step():
+    cron = CronExpression("*/15 * * * *")
+    assert cron.minute == {0, 15, 30, 45}
+    assert cron.next_after(at(2026, 3, 2, 10, 15)) == at(2026, 3, 2, 10, 30)
+    assert cron.next_after(at(2026, 3, 2, 10, 50, 30)) == at(2026, 3, 2, 11, 0)
+
+
+def test_ranges_and_lists():
+    cron = CronExpression("0 9-17/4 * * 1-5")
+    assert cron.hour == {9, 13, 17}
+    # Friday 17:30 -> Monday 09:00
+    assert cron.next_after(at(2026, 3, 6, 17, 30)) == at(2026, 3, 9, 9, 0)
+    assert CronExpression("5,10 0 1 1,7 *").month == {1, 7}
+
+
+def test_day_of_month_or_day_of_week():
+    # The 13th, or any Friday
+    cron = CronExpression("0 0 13 * 5")
+    # Monday 2 March 2026 -> Friday 6 March
+    assert cron.next_after(at(2026, 3, 2)) == at(2026, 3, 6)
+    # Tuesday 10 March -> Friday 13 March, both at once
+    assert cron.next_after(at(2026, 3, 10)) == at(2026, 3, 13)
+    # Friday 13 March -> the next Friday, not the 13th of April
+    assert cron.next_after(at(2026, 3, 13)) == at(2026, 3, 20)
+
+
+def test_one_restricted_day_field_must_match():
+    cron = CronExpression("0 0 13 * *")
+    assert cron.next_after(at(2026, 3, 2)) == at(2026, 3, 13)
+
+
+def test_sunday_is_zero():
+    # Saturday 7 March 2026 -> Sunday 8 March
+    assert CronExpression("0 0 * * 0").next_after(at(2026, 3, 7, 12)) == at(2026, 3, 8)
+
+
+@pytest.mark.parametrize("expression", ["* * * *", "60 * * * *", "* * * * 7", "* 5-3 * * *", "* * 0 * *"])
+def test_invalid_expressions(expression):
+    with pytest.raises(ValueError):
+        CronExpression(expression)
+
+
+def test_never_matches():
+    cron = CronExpression("0 0 30 2 *")
+    with pytest.raises(ValueError, match="never matches"):
+        cron.next_after(at(2026, 1, 1))
+
+
+def test_leader_only_job_skipped_when_not_leader():
+    async def scenario(scheduler: Scheduler):
+        await scheduler.start(NeverLeader())
+        await asyncio.sleep(0.1)
+        await scheduler.stop(timeout=1)
+
+    calls = []
+    scheduler = Scheduler()
+    cleanup = scheduler.every(0.01, "cleanup", lambda: calls.append("cleanup"), leader_only=True, run_at_start=True)
+    flush = scheduler.every(0.01, "flush", lambda: calls.append("flush"), run_at_start=True)
+    asyncio.run(scenario(scheduler))
+
+    assert cleanup.runs == 0 and cleanup.skipped > 0
+    assert flush.runs > 0 and set(calls) == {"flush"}
+
+
+def test_stop_cancels_async_job_past_the_timeout():
+    events = []
+
+    async def slow():
+        events.append("started")
+        try:
+            await asyncio.sleep(30)
+        except asyncio.CancelledError:
+            events.append("cancelled")
+            raise
+
+    async def scenario(scheduler: Scheduler):
+        await scheduler.start(AlwaysLeader())
+        while job.runs == 0 and not job.running:
+            await asyncio.sleep(0.01)
+        await asyncio.wait_for(scheduler.stop(timeout=0.05), timeout=5)
+
+    scheduler = Scheduler()
+    job = scheduler.every(60, "slow", slow, run_at_start=True)
+    asyncio.run(scenario(scheduler))
+
+    assert events == ["started", "cancelled"]
+    assert job.runs == 1 and not job.running
+    assert not scheduler.is_leader
@@ -0,0 +1,95 @@
+"""
+Threads for blocking work: the request threadpool and the background limiter.
+
+The request threadpool runs sync routes and `run_in_threadpool` calls. AnyIO
+defaults to 40 threads, but a worker only has DB_POOL_SIZE + DB_MAX_OVERFLOW
+database connections; the extra threads would just block on pool checkout.
+
+Work that isn't answering a request (streaming exports, sync scheduler jobs,
+startup builds) runs through `run_in_background_thread` instead, on its own
+limiter of BACKGROUND_THREADS. A burst of exports or a long job then can't
+take every thread and stall the sync routes. DNS lookups for user URLs use
+the event loop's resolver (see url_safety.py) and take neither.
+
+`configure_threadpool` sets both limits at startup: the request threadpool to
+THREADPOOL_SIZE or, when unset, to the connections the background threads
+leave over.
+
+`probe_threadpool` runs periodically and times how long a no-op waits for a
+request thread, which is the queueing every sync route sees at that moment.
+`threadpool_status` reports it next to the limiters' own counters.
+"""
+import time
+from collections import deque
+from typing import AsyncIterator, Callable, Iterator, TypeVar
+import anyio
+import anyio.to_thread
+from starlette.concurrency import run_in_threadpool
+from config import get_settings
+
+settings = get_settings()
+
+PROBE_SAMPLES = 300
+
+T = TypeVar("T")
+
+background_limiter = anyio.CapacityLimiter(settings.BACKGROUND_THREADS)
+
+
+def threadpool_size() -> int:
+    connections = settings.DB_POOL_SIZE + settings.DB_MAX_OVERFLOW
+    return settings.THREADPOOL_SIZE or max(1, connections - settings.BACKGROUND_THREADS)
+
+
+def configure_threadpool() -> int:
+    """Apply the configured sizes to the default thread limiter and the background one (call from the event loop)"""
+    size = threadpool_size()
+    anyio.to_thread.current_default_thread_limiter().total_tokens = size
+    background_limiter.total_tokens = settings.BACKGROUND_THREADS
+    return size
+
+
+async def run_in_background_thread(func: Callable[..., T], *args) -> T:
+    return await anyio.to_thread.run_sync(func, *args, limiter=background_limiter)
+
+
+async def iterate_in_background_thread(iterator: Iterator[T]) -> AsyncIterator[T]:
+    """Iterate a blocking iterator, each step in a background thread (for StreamingResponse)"""
+    done = object()
+    while True:
+        item = await run_in_background_thread(next, iterator, done)
+        if item is done:
+            return
+        yield item
+
+
+_waits_ms: deque[float] = deque(maxlen=PROBE_SAMPLES)
+
+
+async def probe_threadpool():
+    started = time.perf_counter()
+    await run_in_threadpool(lambda: None)
+    _waits_ms.append((time.perf_counter() - started) * 1000)
+
+
+def _limiter_status(limiter: anyio.CapacityLimiter) -> dict:
+    statistics = limiter.statistics()
+    return {
+        "size": statistics.total_tokens,
+        "busy": statistics.borrowed_tokens,
+        "waiting": statistics.tasks_waiting,
+        "utilization": round(statistics.borrowed_tokens / statistics.total_tokens, 2),
+    }
+
+
+def threadpool_status() -> dict:
+    waits = sorted(_waits_ms)
+    def percentile(p):
+        return round(waits[min(len(waits) - 1, int(p * len(waits)))], 2) if waits else None
+    return {
+        **_limiter_status(anyio.to_thread.current_default_thread_limiter()),
+        "wait_ms_p50": percentile(0.5),
+        "wait_ms_p99": percentile(0.99),
+        "wait_ms_max": round(waits[-1], 2) if waits else None,
+        "background": _limiter_status(background_limiter),
+    }
@@ -0,0 +1,50 @@
+"""
+Scheduled removal of tokens that can no longer be used.
+
+Expired or used email verification and password reset tokens, and refresh
+sessions past their expiry (revoked or not), are deleted in batches of
+DELETE_BATCH_SIZE, each in its own short transaction, so the cleanup never
+holds long locks on tables the auth endpoints write to.
+"""
+import logging
+from datetime import datetime, timezone
+from sqlalchemy import delete, or_, select
+from database import SessionLocal
+import models
+
+logger = logging.getLogger(__name__)
+
+DELETE_BATCH_SIZE = 1000
+
+
+def _delete_in_batches(db, model, condition) -> int:
+    total = 0
+    while True:
+        batch = select(model.id).where(condition).limit(DELETE_BATCH_SIZE)
+        deleted = db.execute(delete(model).where(model.id.in_(batch))).rowcount
+        db.commit()
+        total += deleted
+        if deleted < DELETE_BATCH_SIZE:
+            return total
+
+
+def purge_expired_tokens() -> dict[str, int]:
+    now = datetime.now(timezone.utc)
+    db = SessionLocal()
+    try:
+        counts = {
+            "verification_tokens": _delete_in_batches(db, models.EmailVerificationToken, or_(
+                models.EmailVerificationToken.expires_at < now,
+                models.EmailVerificationToken.used == True
+            )),
+            "password_reset_tokens": _delete_in_batches(db, models.EmailPasswordResetToken, or_(
+                models.EmailPasswordResetToken.expires_at < now,
+                models.EmailPasswordResetToken.used == True
+            )),
+            # Revocation checks only look at sessions that haven't expired
+            "sessions": _delete_in_batches(db, models.RefreshSession, models.RefreshSession.expires_at < now),
+        }
+    finally:
+        db.close()
+    logger.info("Purged expired tokens: %s", counts)
+    return counts
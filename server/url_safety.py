@@ -0,0 +1,52 @@
+"""
+Guards for server-side requests to user-supplied URLs (link previews, link
+health checks).
+
+A URL may only be requested when every address its host resolves to is
+public: not loopback, private, link-local or otherwise internal. The request
+then connects to the address that was checked instead of letting the HTTP
+client resolve the name again, so a host whose DNS answer changes in between
+(DNS rebinding) can't steer it to an internal address. The Host header, TLS
+SNI and certificate check still use the hostname.
+
+Callers follow redirects themselves, checking and pinning every hop, at
+most MAX_REDIRECTS of them.
+"""
+import asyncio
+import ipaddress
+import socket
+from typing import TYPE_CHECKING
+from urllib.parse import urlsplit
+
+if TYPE_CHECKING:
+    import httpx
+
+MAX_REDIRECTS = 5
+
+
+class UnsafeUrl(ValueError):
+    pass
+
+
+async def public_address(url: str) -> str:
+    """The address to connect to for `url`; UnsafeUrl unless all of the host's addresses are public"""
+    parts = urlsplit(url)
+    if parts.scheme not in ("http", "https") or not parts.hostname:
+        raise UnsafeUrl(url)
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    # The event loop's resolver threads, not the threadpool that serves requests
+    infos = await asyncio.get_running_loop().getaddrinfo(parts.hostname, port, type=socket.SOCK_STREAM)
+    addresses = [info[4][0] for info in infos]
+    if not addresses or not all(ipaddress.ip_address(address).is_global for address in addresses):
+        raise UnsafeUrl(url)
+    return addresses[0]
+
+
+def pinned(url: str, address: str) -> tuple["httpx.URL", dict, dict]:
+    """(URL with the host replaced by `address`, Host header, request extensions for SNI)"""
+    # Imported here to keep httpx out of the API's startup imports
+    import httpx
+
+    target = httpx.URL(url)
+    host = target.host if target.port is None else f"{target.host}:{target.port}"
+    return target.copy_with(host=address), {"Host": host}, {"sni_hostname": target.host}
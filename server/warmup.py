@@ -0,0 +1,137 @@
+"""
+Startup warm-up, run by the app lifespan before the worker reports ready.
+
+1. Opens DB_POOL_SIZE connections at once and returns them to the pool, so
+   the first requests don't pay for connecting (and TLS) to the database.
+2. Runs the hottest statement shapes once (the authenticated user lookup, the
+   dashboard link list, the short link lookup), so SQLAlchemy has them in its
+   compiled statement cache.
+3. Preloads the public profile and link list payloads of the WARMUP_PROFILES
+   most viewed profiles of the last WARMUP_DAYS into the public cache.
+
+GET /health answers 503 until the warm-up has finished, so a load balancer
+only sends traffic to a warm worker. A failing step is logged and skipped:
+a cold worker is better than one that never becomes ready.
+"""
+import logging
+import time
+from datetime import date, timedelta
+from typing import Optional
+from fastapi import HTTPException
+from sqlalchemy import func, text
+from config import get_settings
+from database import SessionLocal, engine
+import models
+from public_cache import preload
+from redirects import load_target
+from routers.links import public_links_payload
+from routers.users import public_profile_payload
+
+logger = logging.getLogger(__name__)
+settings = get_settings()
+
+
+class WarmUpState:
+    def __init__(self):
+        self.ready = False
+        self.duration_ms: Optional[float] = None
+        self.steps: dict[str, float] = {}
+        self.failed: list[str] = []
+        self.profiles = 0
+
+    def stats(self) -> dict:
+        return {
+            "ready": self.ready,
+            "duration_ms": self.duration_ms,
+            "steps_ms": self.steps,
+            "failed": self.failed,
+            "profiles": self.profiles,
+        }
+
+
+warmup_state = WarmUpState()
+
+
+def open_connections():
+    # Held together so the pool has to open every one of them
+    connections = []
+    try:
+        for _ in range(settings.DB_POOL_SIZE):
+            connection = engine.connect()
+            connections.append(connection)
+            connection.execute(text("SELECT 1"))
+    finally:
+        for connection in connections:
+            connection.close()
+
+
+def run_hot_queries():
+    db = SessionLocal()
+    try:
+        # Parameters match nothing; only the statement shapes matter
+        db.query(models.User).filter(models.User.email == "").first()
+        db.query(models.Link).filter(
+            models.Link.user_id == 0
+        ).order_by(models.Link.sort_key, models.Link.id).all()
+    finally:
+        db.close()
+    load_target(0)
+
+
+def most_viewed_usernames(limit: int, days: int) -> list[str]:
+    db = SessionLocal()
+    try:
+        views = func.sum(models.ProfileViewSketch.unique_visitors)
+        rows = db.query(models.User.username).join(
+            models.ProfileViewSketch, models.ProfileViewSketch.user_id == models.User.id
+        ).filter(
+            models.ProfileViewSketch.day >= date.today() - timedelta(days=days),
+            models.User.is_active == True
+        ).group_by(models.User.id, models.User.username).order_by(views.desc()).limit(limit).all()
+        return [username for (username,) in rows]
+    finally:
+        db.close()
+
+
+def preload_profiles() -> int:
+    loaded = 0
+    db = SessionLocal()
+    try:
+        for username in most_viewed_usernames(settings.WARMUP_PROFILES, settings.WARMUP_DAYS):
+            try:
+                preload("profile", username, lambda: public_profile_payload(db, username))
+                preload("links", username, lambda: public_links_payload(db, username))
+            except HTTPException:
+                # Private profile
+                continue
+            finally:
+                # Don't hold a connection or an ever growing identity map across profiles
+                db.close()
+            loaded += 1
+    finally:
+        db.close()
+    return loaded
+
+
+def run_warmup():
+    """Run every warm-up step, then mark the worker ready"""
+    started = time.perf_counter()
+    steps = (
+        ("connections", open_connections),
+        ("hot_queries", run_hot_queries),
+        ("profiles", preload_profiles),
+    )
+    for name, step in steps:
+        step_started = time.perf_counter()
+        try:
+            result = step()
+        except Exception:
+            logger.exception("Warm-up step %s failed", name)
+            warmup_state.failed.append(name)
+            continue
+        warmup_state.steps[name] = round((time.perf_counter() - step_started) * 1000, 2)
+        if name == "profiles":
+            warmup_state.profiles = result
+    warmup_state.duration_ms = round((time.perf_counter() - started) * 1000, 2)
+    warmup_state.ready = True
+    logger.info("Warm-up done in %.0f ms (%s profiles preloaded)", warmup_state.duration_ms, warmup_state.profiles)